@@ -1,15 +1,19 @@
+import calendar
 import collections
 import configparser
 import enum
+import functools
 import hashlib
 import hmac
 import logging
 import os
+import threading
+import time
 import typing
 
 from datetime import datetime
 from requests.auth import AuthBase
-from urllib.parse import quote, urlparse
+from urllib.parse import quote, unquote, urlparse
 from requests.models import PreparedRequest
 
 from astro_cloud.constants import ENCODING
@@ -19,6 +23,15 @@ PWN: typing.TypeVar = typing.TypeVar('PWN')
 AMZDATE_FORMAT: str = '%Y%m%dT%H%M%SZ'
 DATESTAMP_FORMAT: str = '%Y%m%d'
 QUOTE_SAFE_CHARS: str = '/-_.~'
+QUERY_SAFE_CHARS: str = '-_.~'
+SIGNING_ALGORITHM: str = 'AWS4-HMAC-SHA256'
+UNSIGNED_PAYLOAD: str = 'UNSIGNED-PAYLOAD'
+DEFAULT_PRESIGN_EXPIRES: int = 60 * 60
+# S3 refuses presigned urls that claim to be valid for longer than seven days
+MAX_PRESIGN_EXPIRES: int = 7 * 24 * 60 * 60
+# Cached presigned urls are replaced once they're this close to expiring, so a worker handed one has time to use it
+DEFAULT_PRESIGN_REFRESH_MARGIN: int = 5 * 60
+PRESIGN_CACHE_MAX_ENTRIES: int = 100000
 
 AWS_CREDENTIAL_FILE_LOCATION = os.path.expanduser('~/.aws/credentials')
 
@@ -34,13 +47,49 @@ class AWSAuthContext(typing.NamedTuple):
     region: str
     service: AWSService
 
+_auth_context_cache: typing.Dict[typing.Tuple, AWSAuthContext] = {}
+_auth_context_cache_lock: threading.Lock = threading.Lock()
+
+def invalidate_aws_auth_context() -> None:
+    '''
+    Forgets every cached AWSAuthContext, forcing the next load_aws_auth_context to re-read the credentials file
+    '''
+    with _auth_context_cache_lock:
+        _auth_context_cache.clear()
+
 def load_aws_auth_context() -> AWSAuthContext:
     '''
     Loads AWS Credentials in a simular fashion to as boto3. If a credentials file is found, it'll take from that. If
       ENV-Vars are found, they're overwrite corrolating entries from the credentials
 
+    The result is cached against the credentials file location and modification time, the profile and the ENV-Vars,
+      so the file is only read and parsed again once one of those changes
+
     https://docs.aws.amazon.com/cli/latest/userguide/cli-configure-envvars.html
     '''
+    try:
+        modified = os.stat(AWS_CREDENTIAL_FILE_LOCATION).st_mtime_ns
+    except OSError:
+        modified = None
+
+    cache_key = (
+        AWS_CREDENTIAL_FILE_LOCATION,
+        modified,
+        os.environ.get('AWS_PROFILE', 'default'),
+        os.environ.get('AWS_ACCESS_KEY_ID', None),
+        os.environ.get('AWS_SECRET_ACCESS_KEY', None),
+        os.environ.get('AWS_DEFAULT_REGION', None),
+    )
+    auth_context = _auth_context_cache.get(cache_key, None)
+    if auth_context is None:
+        auth_context = read_aws_auth_context()
+        with _auth_context_cache_lock:
+            _auth_context_cache.clear()
+            _auth_context_cache[cache_key] = auth_context
+
+    return auth_context
+
+def read_aws_auth_context() -> AWSAuthContext:
     aws_profile = os.environ.get('AWS_PROFILE', 'default')
     if os.path.exists(AWS_CREDENTIAL_FILE_LOCATION):
         parser = configparser.ConfigParser()
@@ -62,14 +111,15 @@ def load_aws_auth_context() -> AWSAuthContext:
     region = os.environ.get('AWS_DEFAULT_REGION', region)
     return AWSAuthContext(access_key, secret_key, region, AWSService.S3)
 
-def get_canonical_headers(timestamp: datetime, host: str, request_payer: bool = False) -> str:
+@functools.lru_cache(maxsize=1024)
+def get_canonical_headers_template(host: str, request_payer: bool = False) -> typing.Tuple[str, str, str]:
     '''
-    timestamp is a datetime object to be used in other functions, later to be signed into the signature
-    host is a string representing the AWSService URL. For s3, this could be: http://s3.us-east-1.amazonaws.com/datum/
+    Everything in the canonical headers except x-amz-date depends only on the host and request_payer, so it's worked
+      out once per host. Returns the signed headers, and the canonical headers before and after the x-amz-date value
     '''
     headers: typing.Dict[str, str] = {
         'host': host,
-        'x-amz-date': timestamp.strftime(AMZDATE_FORMAT)
+        'x-amz-date': None,
     }
     if request_payer:
         headers['x-amz-request-payer'] = 'requester'
@@ -78,11 +128,19 @@ def get_canonical_headers(timestamp: datetime, host: str, request_payer: bool =
     ordered = []
     for key in sorted(headers.keys()):
         ordered_headers.append(key)
-        ordered.append(f'{key}:{headers[key]}')
+        ordered.append(f'{key}:{headers[key]}' if key != 'x-amz-date' else f'{key}:')
 
-    ordered_headers = ';'.join(ordered_headers)
     ordered = '\n'.join(ordered)
-    return ordered_headers, f'{ordered}\n'
+    prefix, suffix = ordered.split('x-amz-date:')
+    return ';'.join(ordered_headers), f'{prefix}x-amz-date:', f'{suffix}\n'
+
+def get_canonical_headers(timestamp: datetime, host: str, request_payer: bool = False) -> str:
+    '''
+    timestamp is a datetime object to be used in other functions, later to be signed into the signature
+    host is a string representing the AWSService URL. For s3, this could be: http://s3.us-east-1.amazonaws.com/datum/
+    '''
+    ordered_headers, prefix, suffix = get_canonical_headers_template(host, request_payer)
+    return ordered_headers, f'{prefix}{timestamp.strftime(AMZDATE_FORMAT)}{suffix}'
 
 def get_canonical_url(url: str) -> str:
     url_parts = urlparse(url)
@@ -92,15 +150,25 @@ def get_canonical_url(url: str) -> str:
     return quote('/', safe=QUOTE_SAFE_CHARS)
 
 def get_canonical_querystring(url: str) -> str:
+    '''
+    Every parameter, key and value URI-encoded with only unreserved characters left as-is, sorted by key then value.
+      A parameter without a value is signed with an empty one, `list-type=2&prefix` -> `list-type=2&prefix=`
+
+    https://docs.aws.amazon.com/general/latest/gr/sigv4-create-canonical-request.html
+    '''
     url_parts = urlparse(url)
     if url_parts.query == '':
         return ''
 
-    # https://github.com/DavidMuller/aws-requests-auth/blob/969bc643f8386bc796c30d71e78c59af7f82f6b2/aws_requests_auth/aws_auth.py#L202
-    raise NotImplementedError
-    sorted_querystring: str = sorted(url_parts.query.split('&'))
-    import pdb; pdb.set_trace()
-    pass
+    parameters: typing.List[typing.Tuple[str, str]] = []
+    for parameter in url_parts.query.split('&'):
+        if parameter == '':
+            continue
+
+        key, _, value = parameter.partition('=')
+        parameters.append((quote(unquote(key), safe=QUERY_SAFE_CHARS), quote(unquote(value), safe=QUERY_SAFE_CHARS)))
+
+    return '&'.join(f'{key}={value}' for key, value in sorted(parameters))
 
 def get_payload_hash(payload_body: bytes = None) -> str:
     payload_body = payload_body or bytes()
@@ -117,22 +185,49 @@ def sign(key: typing.Union[str, bytes], value: str) -> bytes:
 
     return hmac.new(key, value.encode(ENCODING), hashlib.sha256).digest()
 
-def get_signature_key(key: str, timestamp: datetime, region: str, service: AWSService) -> bytes:
-    kDate: str = sign(f'AWS4{key}', timestamp.strftime(DATESTAMP_FORMAT))
+@functools.lru_cache(maxsize=64)
+def derive_signature_key(key: str, datestamp: str, region: str, service: AWSService) -> bytes:
+    '''
+    The signing key only changes with the date, region and service, so the four HMAC rounds are done once a day for
+      each of them rather than once per request
+    '''
+    kDate: str = sign(f'AWS4{key}', datestamp)
     kRegion: str = sign(kDate, region)
     kService: str = sign(kRegion, service)
     kSigning: str = sign(kService, 'aws4_request')
     return kSigning
 
+def get_signature_key(key: str, timestamp: datetime, region: str, service: AWSService) -> bytes:
+    return derive_signature_key(key, timestamp.strftime(DATESTAMP_FORMAT), region, service)
+
+def get_credential_scope(aws_context: AWSAuthContext, datestamp: str) -> str:
+    return f'{datestamp}/{aws_context.region}/{aws_context.service}/aws4_request'
+
+def sign_canonical_request(aws_context: AWSAuthContext, amzdate: str, datestamp: str, canonical_request: str) -> str:
+    hashed_request: str = hashlib.sha256(canonical_request.encode(ENCODING)).hexdigest()
+    string_to_sign = f'{SIGNING_ALGORITHM}\n{amzdate}\n{get_credential_scope(aws_context, datestamp)}\n{hashed_request}'
+    signing_key = derive_signature_key(aws_context.secret_key, datestamp, aws_context.region, aws_context.service)
+    return hmac.new(signing_key, string_to_sign.encode(ENCODING), hashlib.sha256).hexdigest()
+
 class AWSAuth(AuthBase):
+    '''
+    Signs requests with SigV4 headers, using aws_context when given and the AWS credentials file and ENV-Vars otherwise
+    '''
     _request_payer: bool
-    def __init__(self: PWN, request_payer: bool=False) -> None:
+    _aws_context: AWSAuthContext
+    def __init__(self: PWN, request_payer: bool=False, aws_context: AWSAuthContext = None) -> None:
         self._request_payer = request_payer
+        self._aws_context = aws_context
+
+    def auth_context(self: PWN, host: str) -> AWSAuthContext:
+        return self._aws_context or load_aws_auth_context()
 
     def __call__(self: PWN, request: 'requests.Request') -> 'requests.Request':
         timestamp = datetime.utcnow()
-        aws_context = load_aws_auth_context()
+        amzdate: str = timestamp.strftime(AMZDATE_FORMAT)
+        datestamp: str = timestamp.strftime(DATESTAMP_FORMAT)
         request_host: str = urlparse(request.url).netloc
+        aws_context = self.auth_context(request_host)
 
         payload_hash = get_payload_hash(request.body)
         signed_headers, canonical_headers = get_canonical_headers(timestamp, request_host, self._request_payer)
@@ -145,21 +240,125 @@ class AWSAuth(AuthBase):
             payload_hash,
         ])
 
-        algorithm: str = 'AWS4-HMAC-SHA256'
-        credential_scope: str = f'{timestamp.strftime(DATESTAMP_FORMAT)}/{aws_context.region}/{aws_context.service}/aws4_request'
-        hashed_request: str = hashlib.sha256(canonical_request.encode(ENCODING)).hexdigest()
-        string_to_sign = f'{algorithm}\n{timestamp.strftime(AMZDATE_FORMAT)}\n{credential_scope}\n{hashed_request}'
-        signing_key = get_signature_key(aws_context.secret_key, timestamp, aws_context.region, aws_context.service)
-        signature = hmac.new(
-            signing_key,
-            string_to_sign.encode(ENCODING),
-            hashlib.sha256).hexdigest()
-
-        auth_header = f'{algorithm} Credential={aws_context.access_key}/{credential_scope}, SignedHeaders={signed_headers}, Signature={signature}'
+        credential_scope: str = get_credential_scope(aws_context, datestamp)
+        signature = sign_canonical_request(aws_context, amzdate, datestamp, canonical_request)
+        auth_header = f'{SIGNING_ALGORITHM} Credential={aws_context.access_key}/{credential_scope}, SignedHeaders={signed_headers}, Signature={signature}'
         request.headers['Authorization'] = auth_header
-        request.headers['x-amz-date'] = timestamp.strftime('%Y%m%dT%H%M%SZ')
+        request.headers['x-amz-date'] = amzdate
         request.headers['x-amz-content-sha256'] = payload_hash
         if self._request_payer:
             request.headers['x-amz-request-payer'] = 'requester'
 
         return request
+
+class PresignedURL(typing.NamedTuple):
+    url: str
+    expires_at: float  # seconds since the epoch
+
+def presign_url(url: str, expires: int = DEFAULT_PRESIGN_EXPIRES, request_payer: bool = False, method: str = 'GET',
+        aws_context: AWSAuthContext = None, timestamp: datetime = None) -> PresignedURL:
+    '''
+    Signs url in its query string, so whoever holds it can send the request for the next expires seconds without
+      credentials or an Authorization header. Only the host header is signed and the payload isn't, so Range headers
+      can be added freely. With request_payer, x-amz-request-payer=requester is signed into the query string
+
+    https://docs.aws.amazon.com/AmazonS3/latest/API/sigv4-query-string-auth.html
+    '''
+    if not 0 < expires <= MAX_PRESIGN_EXPIRES:
+        raise ValueError(f'Presigned urls expire within 1 to {MAX_PRESIGN_EXPIRES} seconds, not {expires}')
+
+    timestamp = timestamp or datetime.utcnow()
+    amzdate: str = timestamp.strftime(AMZDATE_FORMAT)
+    datestamp: str = timestamp.strftime(DATESTAMP_FORMAT)
+    aws_context = aws_context or load_aws_auth_context()
+    parameters: typing.List[typing.Tuple[str, str]] = [
+        ('X-Amz-Algorithm', SIGNING_ALGORITHM),
+        ('X-Amz-Credential', f'{aws_context.access_key}/{get_credential_scope(aws_context, datestamp)}'),
+        ('X-Amz-Date', amzdate),
+        ('X-Amz-Expires', str(expires)),
+        ('X-Amz-SignedHeaders', 'host'),
+    ]
+    if request_payer:
+        parameters.append(('x-amz-request-payer', 'requester'))
+
+    url_parts = urlparse(url)
+    querystring = '&'.join(f'{quote(key, safe=QUERY_SAFE_CHARS)}={quote(value, safe=QUERY_SAFE_CHARS)}'
+        for key, value in parameters)
+    unsigned_url: str = url_parts._replace(
+        query=f'{url_parts.query}&{querystring}' if url_parts.query else querystring).geturl()
+    canonical_request = '\n'.join([
+        method,
+        get_canonical_url(url),
+        get_canonical_querystring(unsigned_url),
+        f'host:{url_parts.netloc}\n',
+        'host',
+        UNSIGNED_PAYLOAD,
+    ])
+    signature = sign_canonical_request(aws_context, amzdate, datestamp, canonical_request)
+    return PresignedURL(f'{unsigned_url}&X-Amz-Signature={signature}',
+        calendar.timegm(timestamp.utctimetuple()) + expires)
+
+class PresignedURLCache:
+    '''
+    Presigned GET urls, reused until they come within refresh_margin seconds of expiring. Sign a batch of urls up front
+      with presign_many and hand the results to worker processes or plain HTTP clients, which then need neither
+      credentials nor an HMAC per request. Holds up to max_entries urls, dropping the least recently signed first
+    '''
+    _expires: int
+    _request_payer: bool
+    _refresh_margin: int
+    _max_entries: int
+    _urls: typing.Dict[str, PresignedURL]
+    _lock: threading.Lock
+    signed: int
+    def __init__(self: PWN, expires: int = DEFAULT_PRESIGN_EXPIRES, request_payer: bool = False,
+            refresh_margin: int = DEFAULT_PRESIGN_REFRESH_MARGIN, max_entries: int = PRESIGN_CACHE_MAX_ENTRIES) -> None:
+        if refresh_margin >= expires:
+            raise ValueError(f'refresh_margin[{refresh_margin}] has to be shorter than expires[{expires}]')
+
+        self._expires = expires
+        self._request_payer = request_payer
+        self._refresh_margin = refresh_margin
+        self._max_entries = max_entries
+        self._urls = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.signed = 0
+
+    def __len__(self: PWN) -> int:
+        return len(self._urls)
+
+    def get(self: PWN, url: str) -> str:
+        return self.presign_many([url])[0]
+
+    def presign_many(self: PWN, urls: typing.Iterable[str]) -> typing.List[str]:
+        '''
+        Presigned versions of urls, in the same order. The ones missing or about to expire are signed together, with
+          one credentials lookup and timestamp
+        '''
+        now: float = time.time()
+        aws_context: AWSAuthContext = None
+        timestamp: datetime = None
+        presigned: typing.List[str] = []
+        with self._lock:
+            for url in urls:
+                entry = self._urls.get(url, None)
+                if entry is None or entry.expires_at - self._refresh_margin <= now:
+                    if aws_context is None:
+                        aws_context = load_aws_auth_context()
+                        timestamp = datetime.utcnow()
+
+                    entry = self._urls[url] = presign_url(url, self._expires, self._request_payer,
+                        aws_context=aws_context, timestamp=timestamp)
+                    self._urls.move_to_end(url)
+                    self.signed += 1
+
+                presigned.append(entry.url)
+
+            while len(self._urls) > self._max_entries:
+                self._urls.popitem(last=False)
+
+        return presigned
+
+    def clear(self: PWN) -> None:
+        with self._lock:
+            self._urls.clear()
@@ -1,13 +1,160 @@
+import base64
+import hashlib
+import hmac
 import logging
+import os
 import typing
 
+import requests
+
+from email.utils import formatdate
 from requests.auth import AuthBase
 from requests.models import PreparedRequest
+from urllib.parse import parse_qsl, urlparse
+
+from astro_cloud.auth.tokens import TOKEN_REQUEST_TIMEOUT, Token, TokenCache, get_token_cache, parse_token_response
+from astro_cloud.constants import ENCODING
 
 PWN: typing.TypeVar = typing.TypeVar('PWN')
 
+# Bearer tokens need 2017-11-09 or later
+AZURE_STORAGE_VERSION: str = '2021-08-06'
+AZURE_AUTHORITY_HOST: str = 'https://login.microsoftonline.com'
+AZURE_STORAGE_SCOPE: str = 'https://storage.azure.com/.default'
+# Headers signed by position in a Shared Key signature, in order
+SHARED_KEY_HEADERS: typing.List[str] = [
+    'Content-Encoding',
+    'Content-Language',
+    'Content-Length',
+    'Content-MD5',
+    'Content-Type',
+    'Date',
+    'If-Modified-Since',
+    'If-Match',
+    'If-None-Match',
+    'If-Unmodified-Since',
+    'Range',
+]
+
 logger = logging.getLogger(__file__)
 
+class AzureCredentialKind(typing.NamedTuple):
+    Anonymous = 'anonymous'
+    SAS = 'sas'
+    SharedKey = 'shared_key'
+    ClientSecret = 'client_secret'
+
+class AzureCredentials(typing.NamedTuple):
+    kind: str
+    account: str = None
+    key: str = None  # base64 account key
+    sas_token: str = None
+    tenant_id: str = None
+    client_id: str = None
+    client_secret: str = None
+    authority_host: str = AZURE_AUTHORITY_HOST
+
+def load_azure_credentials() -> AzureCredentials:
+    '''
+    Reads credentials from the ENV-Vars the Azure SDKs use. AZURE_STORAGE_SAS_TOKEN is appended to every url,
+      AZURE_STORAGE_ACCOUNT with AZURE_STORAGE_KEY signs with the account's Shared Key, and AZURE_TENANT_ID,
+      AZURE_CLIENT_ID and AZURE_CLIENT_SECRET fetch OAuth tokens for a service principal. Without any of them requests
+      are sent anonymously, for public containers
+    '''
+    sas_token = os.environ.get('AZURE_STORAGE_SAS_TOKEN', None)
+    if sas_token:
+        return AzureCredentials(AzureCredentialKind.SAS, sas_token=sas_token.lstrip('?'))
+
+    account = os.environ.get('AZURE_STORAGE_ACCOUNT', None)
+    key = os.environ.get('AZURE_STORAGE_KEY', None)
+    if account and key:
+        return AzureCredentials(AzureCredentialKind.SharedKey, account=account, key=key)
+
+    tenant_id = os.environ.get('AZURE_TENANT_ID', None)
+    client_id = os.environ.get('AZURE_CLIENT_ID', None)
+    client_secret = os.environ.get('AZURE_CLIENT_SECRET', None)
+    if tenant_id and client_id and client_secret:
+        return AzureCredentials(AzureCredentialKind.ClientSecret, tenant_id=tenant_id, client_id=client_id,
+            client_secret=client_secret,
+            authority_host=os.environ.get('AZURE_AUTHORITY_HOST', AZURE_AUTHORITY_HOST).rstrip('/'))
+
+    return AzureCredentials(AzureCredentialKind.Anonymous)
+
+def get_canonicalized_resource(account: str, url: str) -> str:
+    '''
+    /account/container/blob, followed by every query parameter as `\\nname:value`, sorted by name. The path is signed
+      URL-encoded, exactly as it's sent, while query parameter values are signed decoded
+
+    https://docs.microsoft.com/en-us/rest/api/storageservices/authorize-with-shared-key
+    '''
+    url_parts = urlparse(url)
+    parameters: typing.Dict[str, typing.List[str]] = {}
+    for key, value in parse_qsl(url_parts.query, keep_blank_values=True):
+        parameters.setdefault(key.lower(), []).append(value)
+
+    resource = f'/{account}{url_parts.path or "/"}'
+    for key in sorted(parameters.keys()):
+        resource += f'\n{key}:{",".join(sorted(parameters[key]))}'
+
+    return resource
+
+def get_shared_key_signature(method: str, url: str, headers: typing.Mapping[str, str], account: str,
+        key: str) -> str:
+    values: typing.List[str] = []
+    for name in SHARED_KEY_HEADERS:
+        value = headers.get(name, '')
+        values.append('' if name == 'Content-Length' and value == '0' else value)
+
+    canonicalized_headers = ''.join(f'{name}:{value.strip()}\n' for name, value in sorted(
+        (name.lower(), value) for name, value in headers.items() if name.lower().startswith('x-ms-')))
+    string_to_sign = '\n'.join([method] + values + [canonicalized_headers + get_canonicalized_resource(account, url)])
+    digest = hmac.new(base64.b64decode(key), string_to_sign.encode(ENCODING), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+def fetch_client_secret_token(credentials: AzureCredentials) -> Token:
+    url = f'{credentials.authority_host}/{credentials.tenant_id}/oauth2/v2.0/token'
+    response = requests.post(url, timeout=TOKEN_REQUEST_TIMEOUT, data={
+        'grant_type': 'client_credentials',
+        'client_id': credentials.client_id,
+        'client_secret': credentials.client_secret,
+        'scope': AZURE_STORAGE_SCOPE,
+    })
+    if response.status_code not in [200]:
+        raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code} from url[{url}]')
+
+    return parse_token_response(response.json())
+
+def load_token_cache(credentials: AzureCredentials) -> TokenCache:
+    return get_token_cache(('azure', credentials.authority_host, credentials.tenant_id, credentials.client_id),
+        lambda: fetch_client_secret_token(credentials))
+
 class AzureAuth(AuthBase):
+    '''
+    Authorizes Blob Storage requests with a SAS token, the account's Shared Key or a service principal's OAuth token.
+      Tokens are shared by every AzureAuth using the same service principal and refreshed before they expire. Without
+      credentials requests are left as they are
+    '''
+    _credentials: AzureCredentials
+    def __init__(self: PWN, credentials: AzureCredentials = None) -> None:
+        self._credentials = credentials
+
     def __call__(self: PWN, request: PreparedRequest) -> PreparedRequest:
+        credentials = self._credentials or load_azure_credentials()
+        if credentials.kind == AzureCredentialKind.Anonymous:
+            return request
+
+        elif credentials.kind == AzureCredentialKind.SAS:
+            separator = '&' if urlparse(request.url).query else '?'
+            request.url = f'{request.url}{separator}{credentials.sas_token}'
+            return request
+
+        request.headers['x-ms-version'] = AZURE_STORAGE_VERSION
+        if credentials.kind == AzureCredentialKind.SharedKey:
+            request.headers['x-ms-date'] = formatdate(usegmt=True)
+            signature = get_shared_key_signature(request.method, request.url, request.headers, credentials.account,
+                credentials.key)
+            request.headers['Authorization'] = f'SharedKey {credentials.account}:{signature}'
+            return request
+
+        request.headers['Authorization'] = f'Bearer {load_token_cache(credentials).get()}'
         return request
@@ -1,13 +1,37 @@
 import logging
+import os
+import re
 import typing
 
-from requests.auth import AuthBase
-from requests.models import PreparedRequest
+from astro_cloud.auth.aws import AWSAuth, AWSAuthContext, AWSService, load_aws_auth_context
 
 PWN: typing.TypeVar = typing.TypeVar('PWN')
 
+# nyc3.digitaloceanspaces.com, or bucket.nyc3.digitaloceanspaces.com
+SPACES_HOST_PATTERN = re.compile(r'(?:^|\.)([a-z0-9-]+)\.digitaloceanspaces\.com(?::\d+)?$')
+DEFAULT_SPACES_REGION: str = 'us-east-1'
+
 logger = logging.getLogger(__file__)
 
-class DigitalOceanAuth(AuthBase):
-    def __call__(self: PWN, request: PreparedRequest) -> PreparedRequest:
-        return request
+def load_spaces_auth_context(host: str) -> AWSAuthContext:
+    '''
+    Spaces speaks SigV4 with the region taken from the endpoint. Keys come from SPACES_ACCESS_KEY_ID and
+      SPACES_SECRET_ACCESS_KEY, falling back to the AWS credentials for hosts that aren't Spaces endpoints or when they
+      aren't set. SPACES_REGION names the region of endpoints that don't carry one
+    '''
+    access_key = os.environ.get('SPACES_ACCESS_KEY_ID', None)
+    secret_key = os.environ.get('SPACES_SECRET_ACCESS_KEY', None)
+    if not access_key or not secret_key:
+        return load_aws_auth_context()
+
+    match = SPACES_HOST_PATTERN.search(host)
+    region = match.group(1) if match else os.environ.get('SPACES_REGION', DEFAULT_SPACES_REGION)
+    return AWSAuthContext(access_key, secret_key, region, AWSService.S3)
+
+class DigitalOceanAuth(AWSAuth):
+    '''
+    AWSAuth with Spaces keys and the region of the endpoint being requested. Signing keys are derived once a day per
+      region, so there's no token to refresh
+    '''
+    def auth_context(self: PWN, host: str) -> AWSAuthContext:
+        return self._aws_context or load_spaces_auth_context(host)
@@ -1,13 +1,207 @@
+import base64
+import json
 import logging
+import os
+import threading
+import time
 import typing
 
+import requests
+
 from requests.auth import AuthBase
 from requests.models import PreparedRequest
 
+from astro_cloud.auth.aws import AWSAuth, AWSAuthContext, AWSService
+from astro_cloud.auth.tokens import TOKEN_REQUEST_TIMEOUT, Token, TokenCache, get_token_cache, parse_token_response
+from astro_cloud.constants import ENCODING
+
 PWN: typing.TypeVar = typing.TypeVar('PWN')
 
+GCP_CREDENTIAL_FILE_LOCATION: str = os.path.expanduser('~/.config/gcloud/application_default_credentials.json')
+GCP_TOKEN_URI: str = 'https://oauth2.googleapis.com/token'
+GCP_STORAGE_SCOPE: str = 'https://www.googleapis.com/auth/devstorage.read_only'
+GCP_METADATA_HOST: str = 'metadata.google.internal'
+GCP_METADATA_TOKEN_PATH: str = '/computeMetadata/v1/instance/service-accounts/default/token'
+# Compute Engine, GKE and Cloud Run machines say who made them here, so the metadata server isn't probed elsewhere
+GCE_PRODUCT_NAME_FILE: str = '/sys/class/dmi/id/product_name'
+# Cloud Storage accepts SigV4 signed with HMAC keys at storage.googleapis.com, with the region left to it
+GCP_HMAC_REGION: str = 'auto'
+JWT_LIFETIME: int = 60 * 60
+
 logger = logging.getLogger(__file__)
 
+class GCPCredentialKind(typing.NamedTuple):
+    Anonymous = 'anonymous'
+    HMAC = 'hmac'
+    AuthorizedUser = 'authorized_user'
+    ServiceAccount = 'service_account'
+    Metadata = 'metadata'
+
+class GCPCredentials(typing.NamedTuple):
+    kind: str
+    info: typing.Dict[str, str]  # the credentials file, the HMAC key or the metadata host
+
+_credentials_cache: typing.Dict[typing.Tuple, GCPCredentials] = {}
+_credentials_cache_lock: threading.Lock = threading.Lock()
+
+def credentials_filepath() -> str:
+    return os.environ.get('GOOGLE_APPLICATION_CREDENTIALS', GCP_CREDENTIAL_FILE_LOCATION)
+
+def load_gcp_credentials() -> GCPCredentials:
+    '''
+    Finds credentials the way Google's client libraries do. A GCS_HMAC_ACCESS_KEY_ID and GCS_HMAC_SECRET pair signs
+      requests with SigV4, otherwise the file GOOGLE_APPLICATION_CREDENTIALS names, or the one `gcloud auth
+      application-default login` writes, provides OAuth tokens. On Google Cloud machines, or when GCE_METADATA_HOST is
+      set, tokens come from the metadata server. Without any of them requests are sent anonymously, for public buckets
+
+    Cached against the ENV-Vars and the credentials file modification time, like load_aws_auth_context
+    '''
+    filepath = credentials_filepath()
+    try:
+        modified = os.stat(filepath).st_mtime_ns
+    except OSError:
+        modified = None
+
+    cache_key = (
+        filepath,
+        modified,
+        os.environ.get('GCS_HMAC_ACCESS_KEY_ID', None),
+        os.environ.get('GCS_HMAC_SECRET', None),
+        os.environ.get('GCE_METADATA_HOST', None),
+    )
+    credentials = _credentials_cache.get(cache_key, None)
+    if credentials is None:
+        credentials = read_gcp_credentials()
+        with _credentials_cache_lock:
+            _credentials_cache.clear()
+            _credentials_cache[cache_key] = credentials
+
+    return credentials
+
+def invalidate_gcp_credentials() -> None:
+    with _credentials_cache_lock:
+        _credentials_cache.clear()
+
+def running_on_gce() -> bool:
+    try:
+        with open(GCE_PRODUCT_NAME_FILE, 'r') as stream:
+            return stream.read().strip().startswith('Google')
+
+    except OSError:
+        return False
+
+def read_gcp_credentials() -> GCPCredentials:
+    access_key = os.environ.get('GCS_HMAC_ACCESS_KEY_ID', None)
+    secret_key = os.environ.get('GCS_HMAC_SECRET', None)
+    if access_key and secret_key:
+        return GCPCredentials(GCPCredentialKind.HMAC, {'access_key': access_key, 'secret_key': secret_key})
+
+    filepath = credentials_filepath()
+    if os.path.exists(filepath):
+        with open(filepath, 'rb') as stream:
+            info = json.loads(stream.read().decode(ENCODING))
+
+        if not info.get('type', None) in [GCPCredentialKind.AuthorizedUser, GCPCredentialKind.ServiceAccount]:
+            raise NotImplementedError(f'Unsupported GCP Credential Type[{info.get("type", None)}]')
+
+        return GCPCredentials(info['type'], info)
+
+    metadata_host = os.environ.get('GCE_METADATA_HOST', None)
+    if metadata_host or running_on_gce():
+        return GCPCredentials(GCPCredentialKind.Metadata, {'host': metadata_host or GCP_METADATA_HOST})
+
+    logger.info('Unable to locate GCP Credentials, requests will be anonymous')
+    return GCPCredentials(GCPCredentialKind.Anonymous, {})
+
+def base64url(value: bytes) -> str:
+    return base64.urlsafe_b64encode(value).rstrip(b'=').decode('ascii')
+
+def encode_jwt(claims: typing.Dict[str, typing.Any], private_key: str) -> str:
+    '''
+    A JWT signed with RS256. cryptography is an optional dependency, installed with `pip install astro-cloud[gcp]`
+    '''
+    try:
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import padding
+    except ImportError:
+        raise ImportError('Service account credentials need cryptography, `pip install astro-cloud[gcp]`')
+
+    signing_input = '.'.join([
+        base64url(json.dumps({'alg': 'RS256', 'typ': 'JWT'}).encode(ENCODING)),
+        base64url(json.dumps(claims).encode(ENCODING)),
+    ])
+    key = serialization.load_pem_private_key(private_key.encode(ENCODING), password=None)
+    signature = key.sign(signing_input.encode(ENCODING), padding.PKCS1v15(), hashes.SHA256())
+    return f'{signing_input}.{base64url(signature)}'
+
+def request_token(url: str, **kwargs) -> Token:
+    response = requests.request(kwargs.pop('method', 'POST'), url, timeout=TOKEN_REQUEST_TIMEOUT, **kwargs)
+    if response.status_code not in [200]:
+        raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code} from url[{url}]')
+
+    return parse_token_response(response.json())
+
+def fetch_authorized_user_token(info: typing.Dict[str, str]) -> Token:
+    return request_token(info.get('token_uri', GCP_TOKEN_URI), data={
+        'grant_type': 'refresh_token',
+        'client_id': info['client_id'],
+        'client_secret': info['client_secret'],
+        'refresh_token': info['refresh_token'],
+    })
+
+def fetch_service_account_token(info: typing.Dict[str, str]) -> Token:
+    token_uri: str = info.get('token_uri', GCP_TOKEN_URI)
+    issued_at = int(time.time())
+    assertion = encode_jwt({
+        'iss': info['client_email'],
+        'scope': GCP_STORAGE_SCOPE,
+        'aud': token_uri,
+        'iat': issued_at,
+        'exp': issued_at + JWT_LIFETIME,
+    }, info['private_key'])
+    return request_token(token_uri, data={
+        'grant_type': 'urn:ietf:params:oauth:grant-type:jwt-bearer',
+        'assertion': assertion,
+    })
+
+def fetch_metadata_token(info: typing.Dict[str, str]) -> Token:
+    return request_token(f'http://{info["host"]}{GCP_METADATA_TOKEN_PATH}', method='GET',
+        headers={'Metadata-Flavor': 'Google'})
+
+def load_token_cache(credentials: GCPCredentials) -> TokenCache:
+    info: typing.Dict[str, str] = credentials.info
+    if credentials.kind == GCPCredentialKind.AuthorizedUser:
+        return get_token_cache(('gcp', credentials.kind, info['client_id'], info['refresh_token']),
+            lambda: fetch_authorized_user_token(info))
+
+    elif credentials.kind == GCPCredentialKind.ServiceAccount:
+        return get_token_cache(('gcp', credentials.kind, info['client_email'], info.get('token_uri', GCP_TOKEN_URI)),
+            lambda: fetch_service_account_token(info))
+
+    elif credentials.kind == GCPCredentialKind.Metadata:
+        return get_token_cache(('gcp', credentials.kind, info['host']), lambda: fetch_metadata_token(info))
+
+    raise NotImplementedError(f'GCP Credential Type[{credentials.kind}] has no tokens')
+
 class GCPAuth(AuthBase):
+    '''
+    Authorizes Cloud Storage requests with an OAuth bearer token, or SigV4 signed with an HMAC key. Tokens are shared by
+      every GCPAuth using the same credentials and refreshed before they expire. Without credentials requests are left
+      as they are
+    '''
+    _credentials: GCPCredentials
+    def __init__(self: PWN, credentials: GCPCredentials = None) -> None:
+        self._credentials = credentials
+
     def __call__(self: PWN, request: PreparedRequest) -> PreparedRequest:
+        credentials = self._credentials or load_gcp_credentials()
+        if credentials.kind == GCPCredentialKind.Anonymous:
+            return request
+
+        elif credentials.kind == GCPCredentialKind.HMAC:
+            aws_context = AWSAuthContext(credentials.info['access_key'], credentials.info['secret_key'],
+                GCP_HMAC_REGION, AWSService.S3)
+            return AWSAuth(aws_context=aws_context)(request)
+
+        request.headers['Authorization'] = f'Bearer {load_token_cache(credentials).get()}'
         return request
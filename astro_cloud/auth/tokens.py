@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+import typing
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+# Tokens are replaced this many seconds before they expire, while the old one still works
+DEFAULT_REFRESH_MARGIN: float = 5 * 60
+DEFAULT_TOKEN_LIFETIME: int = 60 * 60
+TOKEN_REQUEST_TIMEOUT: float = 10.0
+
+logger = logging.getLogger(__file__)
+
+class Token(typing.NamedTuple):
+    value: str
+    expires_at: float  # seconds since the epoch
+
+def parse_token_response(payload: typing.Dict[str, typing.Any]) -> Token:
+    '''
+    {"access_token": "...", "expires_in": 3599, "token_type": "Bearer"}, the OAuth 2.0 token response both Google and
+      Microsoft answer with
+    '''
+    return Token(payload['access_token'], time.time() + int(payload.get('expires_in', DEFAULT_TOKEN_LIFETIME)))
+
+class TokenCache:
+    '''
+    Holds one access token and fetches the next once it's within refresh_margin seconds of expiring. While the held
+      token is still valid, one caller fetches its replacement and every other caller carries on with the old one.
+      Once it has expired, callers queue behind the one fetching, so the token endpoint sees a single request
+    '''
+    _fetch: typing.Callable[[], Token]
+    _refresh_margin: float
+    _token: Token
+    _lock: threading.Lock
+    refreshes: int
+    def __init__(self: PWN, fetch: typing.Callable[[], Token], refresh_margin: float = DEFAULT_REFRESH_MARGIN) -> None:
+        self._fetch = fetch
+        self._refresh_margin = refresh_margin
+        self._token = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    @property
+    def token(self: PWN) -> Token:
+        return self._token
+
+    def get(self: PWN) -> str:
+        token = self._token
+        now: float = time.time()
+        if token is not None and now < token.expires_at - self._refresh_margin:
+            return token.value
+
+        if token is not None and now < token.expires_at:
+            if self._lock.acquire(blocking=False):
+                try:
+                    if self._token is token:
+                        self._refresh()
+
+                except Exception as err:
+                    logger.info(f'Unable to refresh token ahead of expiry, still using the current one: {err}')
+
+                finally:
+                    self._lock.release()
+
+            return self._token.value
+
+        with self._lock:
+            token = self._token
+            if token is None or time.time() >= token.expires_at:
+                self._refresh()
+
+            return self._token.value
+
+    def _refresh(self: PWN) -> None:
+        self._token = self._fetch()
+        self.refreshes += 1
+
+    def invalidate(self: PWN) -> None:
+        '''
+        Forgets the token, after the server refused it for example
+        '''
+        with self._lock:
+            self._token = None
+
+_token_caches: typing.Dict[typing.Tuple, TokenCache] = {}
+_token_caches_lock: threading.Lock = threading.Lock()
+
+def get_token_cache(key: typing.Tuple, fetch: typing.Callable[[], Token],
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN) -> TokenCache:
+    '''
+    The process-wide TokenCache for key, an identity such as the service account or client id, so every auth object
+      and thread using the same credentials shares one token
+    '''
+    with _token_caches_lock:
+        token_cache = _token_caches.get(key, None)
+        if token_cache is None:
+            token_cache = _token_caches[key] = TokenCache(fetch, refresh_margin)
+
+        return token_cache
+
+def clear_token_caches() -> None:
+    with _token_caches_lock:
+        _token_caches.clear()
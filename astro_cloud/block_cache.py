@@ -0,0 +1,427 @@
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+import typing
+
+from astro_cloud.transport import RangeResponse
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+DEFAULT_MAX_BYTES: int = 256 * 1024 * 1024
+# One FITS block. Header walks and cutouts already request whole blocks, so aligning to them rarely costs extra bytes
+DEFAULT_BLOCK_SIZE: int = 2880
+# Seconds the ETag and size learned for a url are trusted. Once they're older, the next read goes to the server, and
+#   if the ETag it answers with has changed, the blocks of the previous version are dropped
+DEFAULT_MAX_AGE: float = 60.0
+
+logger = logging.getLogger(__file__)
+
+class BlockCacheStats(typing.NamedTuple):
+    hits: int  # blocks served from memory
+    misses: int  # blocks requested from the server
+    coalesced: int  # blocks another reader was already requesting, and were waited for
+    evictions: int
+    blocks: int
+    bytes: int
+
+class ObjectValidators(typing.NamedTuple):
+    etag: str
+    last_modified: str
+    size: int
+    checked: float  # time.monotonic() of the response they came from
+
+class ObjectChanged(Exception):
+    '''
+    Raised to readers waiting on blocks of a version of the object the server no longer has, they read again
+    '''
+    pass
+
+class ShortRead(Exception):
+    '''
+    Raised when the server answers a block aligned range with fewer bytes than it asked for. Nothing from the response
+      is cached, and readers waiting on its blocks read again
+    '''
+    pass
+
+def content_range_size(content_range: str) -> int:
+    '''
+    Content-Range: bytes 0-2879/1234567 -> 1234567, None when the server sent * or no Content-Range
+    '''
+    size = (content_range or '').rpartition('/')[2]
+    return int(size) if size.isdigit() else None
+
+def block_runs(offsets: typing.List[int], block_size: int) -> typing.List[typing.Tuple[int, int]]:
+    '''
+    Groups sorted block offsets into inclusive byte ranges of consecutive blocks
+    '''
+    runs: typing.List[typing.Tuple[int, int]] = []
+    for offset in offsets:
+        if runs and runs[-1][1] + 1 == offset:
+            runs[-1] = (runs[-1][0], offset + block_size - 1)
+
+        else:
+            runs.append((offset, offset + block_size - 1))
+
+    return runs
+
+class BlockCache:
+    '''
+    Thread safe, in memory cache of block_size aligned blocks, keyed by url, ETag and offset, evicting the least
+      recently used blocks once they hold more than max_bytes. Readers asking for a block another reader is already
+      requesting wait for that request instead of sending their own. Share one between Transports, or give it to the
+      default Transport to share it across the process
+
+      set_default_transport(Transport(block_cache=BlockCache(max_bytes=1024 ** 3)))
+    '''
+    _max_bytes: int
+    _block_size: int
+    _max_age: float
+    _blocks: typing.Dict[typing.Tuple[str, str, int], bytes]
+    _in_flight: typing.Dict[typing.Tuple[str, str, int], concurrent.futures.Future]
+    _validators: typing.Dict[str, ObjectValidators]
+    _refreshing: typing.Dict[str, concurrent.futures.Future]
+    _bytes: int
+    _lock: threading.Lock
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+    def __init__(self: PWN, max_bytes: int = DEFAULT_MAX_BYTES, block_size: int = DEFAULT_BLOCK_SIZE,
+            max_age: float = DEFAULT_MAX_AGE) -> None:
+        self._max_bytes = max_bytes
+        self._block_size = block_size
+        self._max_age = max_age
+        self._blocks = collections.OrderedDict()
+        self._in_flight = {}
+        self._validators = {}
+        self._refreshing = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self: PWN) -> int:
+        return self._max_bytes
+
+    @property
+    def block_size(self: PWN) -> int:
+        return self._block_size
+
+    @property
+    def bytes(self: PWN) -> int:
+        return self._bytes
+
+    def __len__(self: PWN) -> int:
+        return len(self._blocks)
+
+    def stats(self: PWN) -> BlockCacheStats:
+        with self._lock:
+            return BlockCacheStats(self.hits, self.misses, self.coalesced, self.evictions, len(self._blocks),
+                self._bytes)
+
+    def clear(self: PWN) -> None:
+        with self._lock:
+            self._blocks.clear()
+            self._validators.clear()
+            self._bytes = 0
+
+    def invalidate(self: PWN, url: str) -> None:
+        with self._lock:
+            self._validators.pop(url, None)
+            self._drop(url)
+
+    def validators(self: PWN, url: str) -> ObjectValidators:
+        '''
+        ETag, Last-Modified and size last seen for url, or None while they haven't been seen or are older than max_age
+        '''
+        with self._lock:
+            return self._fresh_validators(url)
+
+    def _fresh_validators(self: PWN, url: str) -> ObjectValidators:
+        validators = self._validators.get(url, None)
+        if validators is None or time.monotonic() - validators.checked > self._max_age:
+            return None
+
+        return validators
+
+    def _drop(self: PWN, url: str, keep_etags: typing.Tuple[str, ...] = ()) -> None:
+        for key in [key for key in self._blocks if key[0] == url and not key[1] in keep_etags]:
+            self._bytes -= len(self._blocks.pop(key))
+
+    def _offsets(self: PWN, start: int, end: int) -> typing.List[int]:
+        return list(range(start - start % self._block_size, end + 1, self._block_size))
+
+    def _claim(self: PWN, url: str, etag: str, offsets: typing.Iterable[int]) -> typing.Tuple[
+            typing.Dict[int, bytes], typing.List[int], typing.Dict[int, concurrent.futures.Future]]:
+        '''
+        Splits offsets into the blocks held, the blocks this reader now has to request, and the blocks other readers
+          are requesting
+        '''
+        found: typing.Dict[int, bytes] = {}
+        owned: typing.List[int] = []
+        waiting: typing.Dict[int, concurrent.futures.Future] = {}
+        with self._lock:
+            for offset in offsets:
+                key = (url, etag, offset)
+                block = self._blocks.get(key, None)
+                if block is not None:
+                    self._blocks.move_to_end(key)
+                    found[offset] = block
+                    continue
+
+                future = self._in_flight.get(key, None)
+                if future is not None:
+                    waiting[offset] = future
+                    continue
+
+                self._in_flight[key] = concurrent.futures.Future()
+                owned.append(offset)
+
+            self.hits += len(found)
+            self.misses += len(owned)
+            self.coalesced += len(waiting)
+
+        return found, owned, waiting
+
+    def _store(self: PWN, url: str, etag: str, blocks: typing.Dict[int, bytes]) -> None:
+        with self._lock:
+            for offset, block in blocks.items():
+                key = (url, etag, offset)
+                previous = self._blocks.pop(key, None)
+                if previous is not None:
+                    self._bytes -= len(previous)
+
+                self._blocks[key] = block
+                self._bytes += len(block)
+
+            while self._bytes > self._max_bytes and self._blocks:
+                _, block = self._blocks.popitem(last=False)
+                self._bytes -= len(block)
+                self.evictions += 1
+
+    def _release(self: PWN, url: str, etag: str, offsets: typing.List[int], blocks: typing.Dict[int, bytes] = None,
+            err: Exception = None) -> None:
+        '''
+        Hands the blocks this reader requested, or the error that stopped it, to the readers waiting for them
+        '''
+        with self._lock:
+            futures = [self._in_flight.pop((url, etag, offset)) for offset in offsets]
+
+        for offset, future in zip(offsets, futures):
+            block = blocks.get(offset, None) if err is None else None
+            if block is None:
+                future.set_exception(err or ShortRead(f'url[{url}] block[{offset}] was not received'))
+
+            else:
+                future.set_result(block)
+
+    def _check_length(self: PWN, url: str, start: int, end: int, content: bytes) -> None:
+        if len(content) != end - start + 1:
+            raise ShortRead(f'url[{url}] bytes[{start}-{end}] answered with {len(content)} bytes')
+
+    def _split(self: PWN, start: int, content: bytes) -> typing.Dict[int, bytes]:
+        return {start + position: content[position:position + self._block_size]
+            for position in range(0, len(content), self._block_size)}
+
+    def _learn(self: PWN, url: str, headers: typing.Mapping[str, str]) -> ObjectValidators:
+        '''
+        Records the validators of a 206 response, dropping the blocks of any other version of url
+        '''
+        validators = ObjectValidators(headers.get('ETag', None), headers.get('Last-Modified', None),
+            content_range_size(headers.get('Content-Range', None)), time.monotonic())
+        with self._lock:
+            previous = self._validators.get(url, None)
+            self._validators[url] = validators
+            if previous is not None and previous.etag != validators.etag:
+                logger.info(f'url[{url}] changed from ETag[{previous.etag}] to ETag[{validators.etag}]')
+                self._drop(url, (validators.etag,))
+
+        return validators
+
+    def read_range(self: PWN, url: str, start: int, end: int,
+            fetch: typing.Callable[[int, int], 'requests.Response']) -> 'requests.Response':
+        '''
+        Returns the inclusive byte range [start, end] of url as a 206 response, requesting the blocks it isn't holding
+          with fetch(start, end) as one block aligned range. Responses other than 206 are returned as they are
+        '''
+        while True:
+            validators = self._wait_for_validators(url)
+            if validators is None:
+                return self._refresh(url, start, end, fetch)
+
+            if validators.size is None or start >= validators.size or end < start:
+                return fetch(start, end)
+
+            end = min(end, validators.size - 1)
+            offsets = self._offsets(start, end)
+            found, owned, waiting = self._claim(url, validators.etag, offsets)
+            response: 'requests.Response' = None
+            if owned:
+                run_start, run_end = owned[0], min(owned[-1] + self._block_size, validators.size) - 1
+                try:
+                    response = fetch(run_start, run_end)
+                except Exception as err:
+                    self._release(url, validators.etag, owned, err=err)
+                    raise
+
+                if response.status_code not in [206]:
+                    self._release(url, validators.etag, owned, err=NotImplementedError(
+                        f'Unable to handle HTTP Code: {response.status_code}'))
+                    return response
+
+                try:
+                    self._check_length(url, run_start, run_end, response.content)
+                except ShortRead as err:
+                    self._release(url, validators.etag, owned, err=err)
+                    raise
+
+                learned = self._learn(url, response.headers)
+                if learned.etag != validators.etag:
+                    self._release(url, validators.etag, owned, err=ObjectChanged(url))
+                    self._store(url, learned.etag, self._split(run_start, response.content))
+                    continue
+
+                blocks = self._split(run_start, response.content)
+                self._store(url, validators.etag, blocks)
+                self._release(url, validators.etag, owned, blocks)
+                found.update(blocks)
+
+            try:
+                for offset, future in waiting.items():
+                    found[offset] = future.result()
+
+            except Exception:
+                # The reader requesting them failed or found a new version, read again
+                continue
+
+            content = b''.join(found[offset] for offset in offsets)[start - offsets[0]:end - offsets[0] + 1]
+            return RangeResponse(206, content, {
+                'Content-Range': f'bytes {start}-{end}/{validators.size}',
+                'ETag': validators.etag,
+                'Last-Modified': validators.last_modified,
+            }, getattr(response, 'elapsed', 0.0), getattr(response, 'attempts', 1), getattr(response, 'hedged', False),
+                response is None, getattr(response, 'hedge_sent', False))
+
+    def _wait_for_validators(self: PWN, url: str) -> ObjectValidators:
+        '''
+        Fresh validators for url, waiting for another reader refreshing them if there is one. None when this reader has
+          to refresh them, which it then must do with _refresh
+        '''
+        while True:
+            with self._lock:
+                validators = self._fresh_validators(url)
+                if validators is not None:
+                    return validators
+
+                future = self._refreshing.get(url, None)
+                if future is None:
+                    self._refreshing[url] = concurrent.futures.Future()
+                    return None
+
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def _refresh(self: PWN, url: str, start: int, end: int,
+            fetch: typing.Callable[[int, int], 'requests.Response']) -> 'requests.Response':
+        aligned_start = start - start % self._block_size
+        aligned_end = end - end % self._block_size + self._block_size - 1
+        with self._lock:
+            self.misses += len(self._offsets(start, end))
+
+        try:
+            response = fetch(aligned_start, aligned_end)
+            if response.status_code not in [206]:
+                return response
+
+            validators = self._learn(url, response.headers)
+            if validators.size is not None:
+                self._check_length(url, aligned_start, min(aligned_end, validators.size - 1), response.content)
+                self._store(url, validators.etag, self._split(aligned_start, response.content))
+
+        finally:
+            with self._lock:
+                future = self._refreshing.pop(url)
+
+            future.set_result(None)
+
+        if validators.size is None:
+            return response
+
+        end = min(end, validators.size - 1)
+        return RangeResponse(206, response.content[start - aligned_start:end - aligned_start + 1], dict(
+            response.headers, **{'Content-Range': f'bytes {start}-{end}/{validators.size}'}),
+            getattr(response, 'elapsed', None), getattr(response, 'attempts', 1), getattr(response, 'hedged', False),
+            hedge_sent=getattr(response, 'hedge_sent', False))
+
+    def read_ranges(self: PWN, url: str, ranges: typing.List[typing.Tuple[int, int]],
+            fetch: typing.Callable[[int, int], 'requests.Response'],
+            fetch_many: typing.Callable[[typing.List[typing.Tuple[int, int]]], typing.List[bytes]]) -> typing.List[bytes]:
+        '''
+        Returns the contents of many inclusive byte ranges of url, requesting every block none of them is holding in
+          one fetch_many call, one range per run of consecutive blocks. The first range is read through read_range
+          when url's validators need refreshing, as a multipart response doesn't carry them. Blocks requested by
+          fetch_many are taken to belong to the version those validators describe
+        '''
+        if not ranges:
+            return []
+
+        while True:
+            validators = self.validators(url)
+            if validators is None:
+                response = self.read_range(url, ranges[0][0], ranges[0][1], fetch)
+                if response.status_code not in [206]:
+                    raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+
+                validators = self.validators(url)
+
+            if validators is None or validators.size is None or \
+                    any(start >= validators.size or end < start for start, end in ranges):
+                return fetch_many(ranges)
+
+            ranges = [(start, min(end, validators.size - 1)) for start, end in ranges]
+            offsets = sorted({offset for start, end in ranges for offset in self._offsets(start, end)})
+            found, owned, waiting = self._claim(url, validators.etag, offsets)
+            if owned:
+                runs = [(run_start, min(run_end, validators.size - 1))
+                    for run_start, run_end in block_runs(owned, self._block_size)]
+                try:
+                    contents = fetch_many(runs)
+                    if len(contents) != len(runs):
+                        raise ShortRead(f'url[{url}] answered {len(contents)} of {len(runs)} ranges')
+
+                    for (run_start, run_end), content in zip(runs, contents):
+                        self._check_length(url, run_start, run_end, content)
+
+                except Exception as err:
+                    self._release(url, validators.etag, owned, err=err)
+                    raise
+
+                blocks: typing.Dict[int, bytes] = {}
+                for (run_start, _), content in zip(runs, contents):
+                    blocks.update(self._split(run_start, content))
+
+                self._store(url, validators.etag, blocks)
+                self._release(url, validators.etag, owned, blocks)
+                found.update(blocks)
+
+            try:
+                for offset, future in waiting.items():
+                    found[offset] = future.result()
+
+            except Exception:
+                continue
+
+            results: typing.List[bytes] = []
+            for start, end in ranges:
+                range_offsets = self._offsets(start, end)
+                content = b''.join(found[offset] for offset in range_offsets)
+                results.append(content[start - range_offsets[0]:end - range_offsets[0] + 1])
+
+            return results
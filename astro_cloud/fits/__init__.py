@@ -1,22 +1,104 @@
+import functools
+import importlib
 import typing
 
 from astro_cloud.fits.datatypes import CloudService, FITSHeader, PaymentSolution
-from astro_cloud.fits.index import aws, gcp, azure, digital_ocean
 
-def load_headers(url: str, service: CloudService, payment_solution: PaymentSolution=None) -> typing.List[FITSHeader]:
-    if service is CloudService.S3:
-        return aws.load_headers(url, payment_solution)
+# Everything else is imported on first use, so `import astro_cloud.fits` stays cheap for short lived processes. Only
+#   the modules a call actually needs get loaded, requests with the cloud index modules, numpy and astropy with
+#   cutouts or FITSHeader.fits
+SERVICE_MODULES: typing.Dict[CloudService, str] = {
+    CloudService.S3: 'astro_cloud.fits.index.aws',
+    CloudService.ObjectStorage: 'astro_cloud.fits.index.gcp',
+    CloudService.BlobStorage: 'astro_cloud.fits.index.azure',
+    CloudService.Spaces: 'astro_cloud.fits.index.digital_ocean',
+    CloudService.FileSystem: 'astro_cloud.fits.index.local',
+}
+LAZY_ATTRIBUTES: typing.Dict[str, typing.Tuple[str, str]] = {
+    'HeaderResult': ('astro_cloud.fits.batch', 'HeaderResult'),
+    'map_headers': ('astro_cloud.fits.batch', 'map_headers'),
+    'PipelineConfig': ('astro_cloud.fits.batch', 'PipelineConfig'),
+    'pipeline_headers': ('astro_cloud.fits.batch', 'pipeline_headers'),
+    'crawl_headers': ('astro_cloud.fits.crawl', 'crawl_headers'),
+    'HeaderCache': ('astro_cloud.fits.index.cache', 'HeaderCache'),
+    'HeaderCatalogue': ('astro_cloud.fits.catalogue', 'HeaderCatalogue'),
+    'ColumnarBuilder': ('astro_cloud.fits.columnar', 'ColumnarBuilder'),
+    'ReadAheadConfig': ('astro_cloud.fits.index.read_ahead', 'ReadAheadConfig'),
+    'Instrumentation': ('astro_cloud.metrics', 'Instrumentation'),
+    'AsyncTransport': ('astro_cloud.transport', 'AsyncTransport'),
+    'Transport': ('astro_cloud.transport', 'Transport'),
+    'aws': ('astro_cloud.fits.index.aws', None),
+    'gcp': ('astro_cloud.fits.index.gcp', None),
+    'azure': ('astro_cloud.fits.index.azure', None),
+    'digital_ocean': ('astro_cloud.fits.index.digital_ocean', None),
+    'local': ('astro_cloud.fits.index.local', None),
+    'gzipped': ('astro_cloud.fits.index.gzipped', None),
+}
 
-    elif service is CloudService.ObjectStorage:
-        return gcp.load_headers(url, payment_solution)
+def __getattr__(name: str) -> typing.Any:
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-    elif service is CloudService.BlobStorage:
-        return azure.load_headers(url, payment_solution)
+    module_name, attribute = LAZY_ATTRIBUTES[name]
+    value = importlib.import_module(module_name)
+    if attribute is not None:
+        value = getattr(value, attribute)
 
-    elif service is CloudService.Spaces:
-        return digital_ocean.load_headers(url, payment_solution)
+    globals()[name] = value
+    return value
 
-    else:
+def __dir__() -> typing.List[str]:
+    return sorted(list(globals()) + list(LAZY_ATTRIBUTES))
+
+def load_headers(url: str, service: CloudService, payment_solution: PaymentSolution=None,
+        transport: 'Transport' = None, read_ahead: 'ReadAheadConfig' = None,
+        cache: 'HeaderCache' = None, instrumentation: 'Instrumentation' = None) -> typing.List[FITSHeader]:
+    service_module = load_service_module(service)
+    return service_module.load_headers(url, payment_solution, transport, read_ahead, cache,
+        instrumentation=instrumentation)
+
+def load_service_module(service: CloudService) -> 'types.ModuleType':
+    if service not in SERVICE_MODULES:
         raise NotImplementedError(f'Cloud Service[{service}] not implemented')
 
+    return importlib.import_module(SERVICE_MODULES[service])
+
+def iter_headers(url: str, service: CloudService, payment_solution: PaymentSolution=None,
+        transport: 'Transport' = None, read_ahead: 'ReadAheadConfig' = None, prefetch: int = 0,
+        cache: 'HeaderCache' = None, instrumentation: 'Instrumentation' = None) -> typing.Iterator[FITSHeader]:
+    '''
+    Lazy version of load_headers, yielding each FITSHeader as soon as it has been read. With prefetch, up to that many
+      headers are read ahead on a background thread. Stop iterating, or close the generator, to stop the walk
+    '''
+    service_module = load_service_module(service)
+    return service_module.iter_headers(url, payment_solution, transport, read_ahead, prefetch, cache,
+        instrumentation=instrumentation)
+
+async def aload_headers(url: str, service: CloudService, payment_solution: PaymentSolution=None,
+        transport: 'AsyncTransport' = None, read_ahead: 'ReadAheadConfig' = None,
+        instrumentation: 'Instrumentation' = None) -> typing.AsyncIterator[FITSHeader]:
+    '''
+    asyncio version of load_headers, an async generator yielding each FITSHeader as soon as it has been read
+    '''
+    service_module = load_service_module(service)
+    async for header in service_module.aload_headers(url, payment_solution, transport, read_ahead,
+            instrumentation=instrumentation):
+        yield header
+
+def load_headers_many(urls: typing.Iterable[str], service: CloudService, payment_solution: PaymentSolution=None,
+        max_workers: int = 16, max_per_host: int = 4, transport: 'Transport' = None,
+        read_ahead: 'ReadAheadConfig' = None, cache: 'HeaderCache' = None,
+        instrumentation: 'Instrumentation' = None, pipeline: 'PipelineConfig' = None) -> typing.Iterator['HeaderResult']:
+    '''
+    Loads the headers of many urls concurrently, yielding a HeaderResult per url as soon as it completes. Keep
+      max_per_host at or below the Transport pool_maxsize so every worker gets a kept-alive connection. With a
+      PipelineConfig the astropy Headers are built by a separate pool of parse workers while the walks carry on
+    '''
+    from astro_cloud.fits.batch import map_headers, pipeline_headers
+
+    loader = functools.partial(load_headers, service=service, payment_solution=payment_solution,
+        transport=transport, read_ahead=read_ahead, cache=cache, instrumentation=instrumentation)
+    if pipeline is not None:
+        return pipeline_headers(urls, loader, max_workers=max_workers, max_per_host=max_per_host, config=pipeline)
 
+    return map_headers(urls, loader, max_workers=max_workers, max_per_host=max_per_host)
@@ -0,0 +1,183 @@
+import collections
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import typing
+
+from urllib.parse import urlparse
+
+from astro_cloud.fits.constants import ENCODING
+from astro_cloud.fits.datatypes import FITSHeader
+
+logger = logging.getLogger(__file__)
+
+# URLs pulled from the input ahead of time while their host is at its limit, per worker
+BACKLOG_PER_WORKER: int = 4
+PIPELINE_POLL_INTERVAL: float = 0.1
+PARSE_EXECUTORS: typing.Tuple[str, ...] = ('thread', 'process')
+
+class HeaderResult(typing.NamedTuple):
+    url: str
+    headers: typing.List[FITSHeader]
+    error: Exception
+
+def map_headers(urls: typing.Iterable[str], loader: typing.Callable[[str], typing.List[FITSHeader]],
+        max_workers: int = 16, max_per_host: int = 4) -> typing.Iterator[HeaderResult]:
+    '''
+    Calls loader for every url on a bounded pool of threads and yields a HeaderResult as each url completes, in
+      completion order. No more than max_per_host urls of the same host run at once. urls are pulled lazily, so a
+      generator of millions of urls is fine. An exception raised for one url is returned in its HeaderResult and
+      doesn't affect the others
+    '''
+    url_iter: typing.Iterator[str] = iter(urls)
+    waiting: typing.Dict[str, typing.Deque[str]] = collections.defaultdict(collections.deque)
+    in_flight: typing.Dict[str, int] = collections.defaultdict(int)
+    futures: typing.Dict[concurrent.futures.Future, typing.Tuple[str, str]] = {}
+    backlog_limit: int = max_workers * BACKLOG_PER_WORKER
+    backlog: int = 0
+    exhausted: bool = False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def submit(url: str, host: str) -> None:
+            in_flight[host] += 1
+            futures[executor.submit(loader, url)] = (url, host)
+
+        def fill() -> None:
+            nonlocal backlog, exhausted
+            for host in list(waiting.keys()):
+                while waiting[host] and in_flight[host] < max_per_host and len(futures) < max_workers:
+                    submit(waiting[host].popleft(), host)
+                    backlog -= 1
+
+                if not waiting[host]:
+                    del waiting[host]
+
+            while not exhausted and len(futures) < max_workers and backlog < backlog_limit:
+                try:
+                    url = next(url_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                host = urlparse(url).netloc
+                if in_flight[host] < max_per_host:
+                    submit(url, host)
+
+                else:
+                    waiting[host].append(url)
+                    backlog += 1
+
+        fill()
+        while futures:
+            done, _ = concurrent.futures.wait(futures.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                url, host = futures.pop(future)
+                in_flight[host] -= 1
+                try:
+                    result = HeaderResult(url, future.result(), None)
+                except Exception as err:
+                    logger.info(f'Unable to load headers for url[{url}]: {err}')
+                    result = HeaderResult(url, None, err)
+
+                fill()
+                yield result
+
+class PipelineConfig(typing.NamedTuple):
+    '''
+    The parse stage of pipeline_headers. parse_workers build the astropy Headers on threads or, with
+      parse_executor='process', in worker processes that don't share the GIL with the fetch threads. Up to max_pending
+      files are held between the stages, once that many are waiting to be parsed or consumed, fetching pauses
+    '''
+    parse_workers: int = os.cpu_count() or 1
+    parse_executor: str = 'thread'
+    max_pending: int = 64
+
+def parse_header_chain(raws: typing.List[bytes]) -> typing.List['astropy.io.fits.Header']:
+    '''
+    Builds the astropy Header of every raw header of a file. Module level so a process pool can pickle it
+    '''
+    from astropy.io import fits
+
+    return [fits.Header.fromstring(raw.decode(ENCODING)) for raw in raws]
+
+def create_parse_executor(config: PipelineConfig) -> concurrent.futures.Executor:
+    if not config.parse_executor in PARSE_EXECUTORS:
+        raise NotImplementedError(f'Parse Executor[{config.parse_executor}] not implemented')
+
+    if config.parse_executor == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=config.parse_workers)
+
+    return concurrent.futures.ThreadPoolExecutor(max_workers=config.parse_workers,
+        thread_name_prefix='astro-cloud-parse')
+
+def pipeline_headers(urls: typing.Iterable[str], loader: typing.Callable[[str], typing.List[FITSHeader]],
+        max_workers: int = 16, max_per_host: int = 4, config: PipelineConfig = None) -> typing.Iterator[HeaderResult]:
+    '''
+    map_headers with the parsing taken off the fetch threads. Walks run on max_workers threads and hand the
+      raw headers of each file to a parse pool, which builds their astropy Headers while the next walks are waiting on
+      the network. HeaderResults are yielded in completion order with every FITSHeader's `fits` already built. Failed
+      walks and parses are returned in their HeaderResult. Closing the generator stops fetching new urls
+    '''
+    config = config or PipelineConfig()
+    results: queue.Queue = queue.Queue()
+    slots: threading.Semaphore = threading.Semaphore(config.max_pending)
+    stop: threading.Event = threading.Event()
+
+    def acquire_slot() -> bool:
+        while not stop.is_set():
+            if slots.acquire(timeout=PIPELINE_POLL_INTERVAL):
+                return True
+
+        return False
+
+    def parsed(fetched: HeaderResult, future: concurrent.futures.Future) -> None:
+        try:
+            headers = [FITSHeader(header.offset, header.length, fits=fits_header, raw=header.raw, cards=header.cards)
+                for header, fits_header in zip(fetched.headers, future.result())]
+            results.put(('result', HeaderResult(fetched.url, headers, None)))
+        except Exception as err:
+            logger.info(f'Unable to parse headers for url[{fetched.url}]: {err}')
+            results.put(('result', HeaderResult(fetched.url, None, err)))
+
+    def fetch(executor: concurrent.futures.Executor) -> None:
+        fetched_results = map_headers(urls, loader, max_workers, max_per_host)
+        try:
+            for fetched in fetched_results:
+                if not acquire_slot():
+                    break
+
+                if fetched.error is not None:
+                    results.put(('result', fetched))
+                    continue
+
+                future = executor.submit(parse_header_chain, [header.raw for header in fetched.headers])
+                future.add_done_callback(lambda future, fetched=fetched: parsed(fetched, future))
+
+        except Exception as err:
+            results.put(('error', err))
+
+        finally:
+            fetched_results.close()
+            # Every parse has been submitted, shutting down waits for them to finish and report
+            executor.shutdown(wait=True)
+            results.put(('done', None))
+
+    executor = create_parse_executor(config)
+    fetcher = threading.Thread(target=fetch, args=(executor,), daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            kind, item = results.get()
+            if kind == 'result':
+                slots.release()
+                yield item
+
+            elif kind == 'error':
+                raise item
+
+            else:
+                break
+
+    finally:
+        stop.set()
@@ -0,0 +1,130 @@
+import functools
+import re
+import typing
+
+from astro_cloud.fits.constants import CARD_SIZE
+
+KEYWORD_SIZE: int = 8
+VALUE_INDICATOR: bytes = b'= '
+END_KEYWORD: bytes = b'END'
+NAXIS_PATTERN = re.compile(r'^NAXIS\d+$')
+INTEGER_PATTERN = re.compile(r'^[+-]?\d+$')
+# Headers across a survey repeat most of their cards, parsed values are immutable so they can be shared
+CARD_VALUE_CACHE_SIZE: int = 64 * 1024
+
+# Everything find_next_header_offset needs to walk from one header to the next
+STRUCTURAL_KEYWORDS: typing.FrozenSet[str] = frozenset(['SIMPLE', 'XTENSION', 'BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT'])
+
+# Keyword fields as they appear in a card, padded to KEYWORD_SIZE, for comparing against memoryview slices
+END_FIELD: bytes = END_KEYWORD.ljust(KEYWORD_SIZE)
+STRUCTURAL_FIELDS: typing.Tuple[bytes, ...] = tuple(keyword.encode('ascii').ljust(KEYWORD_SIZE)
+    for keyword in sorted(STRUCTURAL_KEYWORDS))
+NAXIS_FIELD: bytes = b'NAXIS'
+
+def is_structural_keyword(keyword: str) -> bool:
+    return keyword in STRUCTURAL_KEYWORDS or NAXIS_PATTERN.match(keyword) is not None
+
+def parse_card_value(field: bytes) -> typing.Union[bool, int, float, str]:
+    '''
+    Parses the value of a card, everything after `KEYWORD= `, dropping any comment
+    '''
+    text = field.decode('ascii').strip()
+    if text.startswith("'"):
+        # Strings are quoted, with quotes inside them doubled
+        position = 1
+        while True:
+            position = text.find("'", position)
+            if position == -1:
+                return text[1:].rstrip()
+
+            elif text[position + 1:position + 2] == "'":
+                position += 2
+
+            else:
+                return text[1:position].replace("''", "'").rstrip()
+
+    value = text.split('/', 1)[0].strip()
+    if value == 'T':
+        return True
+
+    elif value == 'F':
+        return False
+
+    elif INTEGER_PATTERN.match(value):
+        return int(value)
+
+    try:
+        return float(value.replace('D', 'E'))
+    except ValueError:
+        return value
+
+cached_card_value = functools.lru_cache(maxsize=CARD_VALUE_CACHE_SIZE)(parse_card_value)
+
+def parse_structural_cards(buffer: typing.Union[bytes, memoryview, 'mmap.mmap'], start: int = 0,
+        end: int = None) -> typing.Dict[str, typing.Union[bool, int, float, str]]:
+    '''
+    Pulls the structural keywords out of the 80 byte cards in buffer[start:end] without building an astropy Header.
+      The standard puts them at the start of every header, in order, so parsing usually stops after a handful of cards.
+      Keywords are compared on memoryview slices of buffer, only the values of structural cards are copied and decoded
+    '''
+    end = len(buffer) if end is None else end
+    cards: typing.Dict[str, typing.Union[bool, int, float, str]] = {}
+    with memoryview(buffer) as view:
+        for card_start in range(start, end - CARD_SIZE + 1, CARD_SIZE):
+            field = view[card_start:card_start + KEYWORD_SIZE]
+            if field == END_FIELD:
+                break
+
+            value_start = card_start + KEYWORD_SIZE + len(VALUE_INDICATOR)
+            if view[card_start + KEYWORD_SIZE:value_start] == VALUE_INDICATOR and \
+                    (field in STRUCTURAL_FIELDS or field[:len(NAXIS_FIELD)] == NAXIS_FIELD):
+                keyword = field.tobytes().decode('ascii').rstrip()
+                if is_structural_keyword(keyword):
+                    cards[keyword] = parse_card_value(view[value_start:card_start + CARD_SIZE].tobytes())
+                    continue
+
+            if 'NAXIS' in cards and all(f'NAXIS{idx}' in cards for idx in range(1, cards['NAXIS'] + 1)):
+                if 'SIMPLE' in cards or ('PCOUNT' in cards and 'GCOUNT' in cards):
+                    break
+
+    return cards
+
+def parse_cards(buffer: typing.Union[bytes, memoryview], keywords: typing.Collection[str], start: int = 0,
+        end: int = None) -> typing.Dict[str, typing.Union[bool, int, float, str]]:
+    '''
+    Pulls the values of keywords out of the cards in buffer[start:end], stopping at END. The first card wins when a
+      keyword repeats, which is how astropy reads it too
+    '''
+    end = len(buffer) if end is None else end
+    cards: typing.Dict[str, typing.Union[bool, int, float, str]] = {}
+    for card_start in range(start, end - CARD_SIZE + 1, CARD_SIZE):
+        card = bytes(buffer[card_start:card_start + CARD_SIZE])
+        keyword = card[:KEYWORD_SIZE].rstrip()
+        if keyword == END_KEYWORD:
+            break
+
+        keyword = keyword.decode('ascii')
+        if keyword in keywords and keyword not in cards and card[KEYWORD_SIZE:KEYWORD_SIZE + 2] == VALUE_INDICATOR:
+            cards[keyword] = cached_card_value(card[KEYWORD_SIZE + 2:])
+            if len(cards) == len(keywords):
+                break
+
+    return cards
+
+def iter_cards(buffer: typing.Union[bytes, memoryview], start: int = 0,
+        end: int = None) -> typing.Iterator[typing.Tuple[str, typing.Union[bool, int, float, str]]]:
+    '''
+    Yields (keyword, value) for every card with a value in buffer[start:end], up to END. Commentary cards, COMMENT,
+      HISTORY and blank keywords, have no value indicator and are skipped
+    '''
+    end = len(buffer) if end is None else end
+    # One copy of the whole header, rather than one per card
+    data = bytes(buffer[start:end])
+    for card_start in range(0, len(data) - CARD_SIZE + 1, CARD_SIZE):
+        keyword = data[card_start:card_start + KEYWORD_SIZE].rstrip()
+        if keyword == END_KEYWORD:
+            break
+
+        value_start = card_start + KEYWORD_SIZE
+        if data[value_start:value_start + 2] == VALUE_INDICATOR:
+            yield keyword.decode('ascii'), cached_card_value(data[value_start + 2:card_start + CARD_SIZE])
@@ -0,0 +1,273 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import typing
+
+from astro_cloud.fits.cards import parse_cards
+from astro_cloud.fits.datatypes import FITSHeader
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+DEFAULT_CATALOGUE_LOCATION: str = os.path.expanduser('~/.cache/astro-cloud/catalogue.sqlite3')
+DEFAULT_BATCH_SIZE: int = 10000
+SQLITE_TIMEOUT: float = 30.0
+OPERATORS: typing.List[str] = ['=', '!=', '<', '<=', '>', '>=']
+
+logger = logging.getLogger(__file__)
+
+SCHEMA: typing.List[str] = [
+    '''CREATE TABLE IF NOT EXISTS hdus (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        hdu INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        raw BLOB NOT NULL,
+        UNIQUE (url, hdu)
+    )''',
+    # Values of the indexed keywords, numbers and booleans in number and strings in text
+    '''CREATE TABLE IF NOT EXISTS cards (
+        hdu_id INTEGER NOT NULL,
+        keyword TEXT NOT NULL,
+        number REAL,
+        text TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS cards_number ON cards (keyword, number, hdu_id)',
+    'CREATE INDEX IF NOT EXISTS cards_text ON cards (keyword, text, hdu_id)',
+    'CREATE INDEX IF NOT EXISTS cards_hdu ON cards (hdu_id)',
+    'CREATE TABLE IF NOT EXISTS indexed_keywords (keyword TEXT PRIMARY KEY)',
+]
+
+class CatalogueHeader(FITSHeader):
+    '''
+    A FITSHeader read back from a HeaderCatalogue, with the url of its file and its HDU index in that file
+    '''
+    __slots__ = ('url', 'hdu')
+    url: str
+    hdu: int
+    def __init__(self: PWN, url: str, hdu: int, offset: int, length: int, raw: bytes) -> None:
+        super().__init__(offset, length, raw=raw)
+        self.url = url
+        self.hdu = hdu
+
+    def __repr__(self: PWN) -> str:
+        return f'CatalogueHeader(url={self.url}, hdu={self.hdu}, offset={self.offset}, length={self.length})'
+
+    def __getstate__(self: PWN) -> typing.Tuple[typing.Any, ...]:
+        return super().__getstate__() + (self.url, self.hdu)
+
+    def __setstate__(self: PWN, state: typing.Tuple[typing.Any, ...]) -> None:
+        super().__setstate__(state[:4])
+        self.url, self.hdu = state[4:]
+
+class Condition(typing.NamedTuple):
+    keyword: str
+    operator: str
+    value: typing.Union[bool, int, float, str]
+
+def as_columns(value: typing.Union[bool, int, float, str]) -> typing.Tuple[float, str]:
+    if isinstance(value, str):
+        return None, value
+
+    return float(value), None
+
+class HeaderCatalogue:
+    '''
+    Queryable store of header chains. The values of the chosen keywords are kept in an indexed keyword/value table,
+      so a query is a handful of index range scans however many HDUs have been added. Only the raw header bytes are
+      stored besides, and the records returned are built from them without touching the network
+
+      catalogue = HeaderCatalogue('tess.sqlite3', keywords=['CAMERA', 'CCD', 'EXPOSURE'])
+      catalogue.add_many(load_headers_many(urls, CloudService.S3))
+      catalogue.query([('CAMERA', '=', 4), ('EXPOSURE', '>', 1000)])
+    '''
+    _path: str
+    _keywords: typing.List[str]
+    _batch_size: int
+    def __init__(self: PWN, path: str = DEFAULT_CATALOGUE_LOCATION, keywords: typing.Iterable[str] = (),
+            batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self._path = path
+        self._batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+            self._keywords = [row[0] for row in connection.execute('SELECT keyword FROM indexed_keywords')]
+
+        new_keywords = [keyword.upper() for keyword in keywords if keyword.upper() not in self._keywords]
+        if new_keywords:
+            self.index_keywords(new_keywords)
+
+    @property
+    def path(self: PWN) -> str:
+        return self._path
+
+    @property
+    def keywords(self: PWN) -> typing.List[str]:
+        return list(self._keywords)
+
+    @contextlib.contextmanager
+    def _connect(self: PWN) -> typing.Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self._path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        try:
+            yield connection
+
+        finally:
+            connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self: PWN, connection: sqlite3.Connection) -> typing.Iterator[sqlite3.Connection]:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+        else:
+            connection.execute('COMMIT')
+
+    def _card_rows(self: PWN, hdu_id: int, raw: bytes,
+            keywords: typing.List[str]) -> typing.Iterator[typing.Tuple[int, str, float, str]]:
+        for keyword, value in parse_cards(raw, keywords).items():
+            yield (hdu_id, keyword) + as_columns(value)
+
+    def add(self: PWN, url: str, headers: typing.List[FITSHeader]) -> None:
+        self.add_many([(url, headers)])
+
+    def add_many(self: PWN, chains: typing.Iterable[typing.Tuple[str, typing.List[FITSHeader]]]) -> int:
+        '''
+        Adds (url, headers) chains, replacing any already added for the same url, and returns the number of HDUs
+          added. HeaderResults from load_headers_many or crawl_headers can be passed straight in, the ones that failed
+          are skipped. Rows are written batch_size HDUs to a transaction
+        '''
+        added: int = 0
+        with self._connect() as connection:
+            pending: typing.List[typing.Tuple[str, typing.List[FITSHeader]]] = []
+            pending_hdus: int = 0
+            for chain in chains:
+                url, headers = chain[0], chain[1]
+                if headers is None:
+                    continue
+
+                pending.append((url, headers))
+                pending_hdus += len(headers)
+                if pending_hdus >= self._batch_size:
+                    added += self._write(connection, pending)
+                    pending, pending_hdus = [], 0
+
+            if pending:
+                added += self._write(connection, pending)
+
+        return added
+
+    def _write(self: PWN, connection: sqlite3.Connection,
+            chains: typing.List[typing.Tuple[str, typing.List[FITSHeader]]]) -> int:
+        added: int = 0
+        with self._transaction(connection):
+            urls = [(url, ) for url, _ in chains]
+            connection.executemany('DELETE FROM cards WHERE hdu_id IN (SELECT id FROM hdus WHERE url = ?)', urls)
+            connection.executemany('DELETE FROM hdus WHERE url = ?', urls)
+            card_rows: typing.List[typing.Tuple[int, str, float, str]] = []
+            for url, headers in chains:
+                for hdu, header in enumerate(headers):
+                    raw = header.raw
+                    hdu_id = connection.execute(
+                        'INSERT INTO hdus (url, hdu, offset, length, raw) VALUES (?, ?, ?, ?, ?)',
+                        (url, hdu, header.offset, header.length, raw)).lastrowid
+                    card_rows.extend(self._card_rows(hdu_id, raw, self._keywords))
+                    added += 1
+
+            connection.executemany('INSERT INTO cards VALUES (?, ?, ?, ?)', card_rows)
+
+        return added
+
+    def index_keywords(self: PWN, keywords: typing.Iterable[str]) -> None:
+        '''
+        Starts indexing keywords, reading their values out of every HDU already in the catalogue
+        '''
+        keywords = [keyword.upper() for keyword in keywords if keyword.upper() not in self._keywords]
+        if not keywords:
+            return None
+
+        with self._connect() as connection:
+            with self._transaction(connection):
+                connection.executemany('INSERT OR IGNORE INTO indexed_keywords VALUES (?)',
+                    [(keyword, ) for keyword in keywords])
+                rows = connection.execute('SELECT id, raw FROM hdus')
+                while True:
+                    batch = rows.fetchmany(self._batch_size)
+                    if not batch:
+                        break
+
+                    card_rows = [card_row for hdu_id, raw in batch
+                        for card_row in self._card_rows(hdu_id, raw, keywords)]
+                    connection.executemany('INSERT INTO cards VALUES (?, ?, ?, ?)', card_rows)
+
+        self._keywords.extend(keywords)
+
+    def query(self: PWN, conditions: typing.Iterable[typing.Union[Condition, typing.Tuple[str, str, typing.Any]]] = (),
+            url: str = None, limit: int = None) -> typing.List[CatalogueHeader]:
+        '''
+        Returns the HDUs matching every condition, a (keyword, operator, value) with operator one of =, !=, <, <=, >
+          or >=, ordered by url and HDU index. Only indexed keywords can be queried. Numbers compare with numbers and
+          strings with strings, T and F are 1 and 0
+        '''
+        clauses: typing.List[str] = []
+        parameters: typing.List[typing.Any] = []
+        for condition in conditions:
+            keyword, operator, value = Condition(*condition)
+            keyword = keyword.upper()
+            if keyword not in self._keywords:
+                raise ValueError(f'Keyword[{keyword}] is not indexed, add it with index_keywords first')
+
+            if operator not in OPERATORS:
+                raise NotImplementedError(f'Operator[{operator}] not implemented')
+
+            number, text = as_columns(value)
+            column = 'text' if number is None else 'number'
+            clauses.append(f'h.id IN (SELECT hdu_id FROM cards WHERE keyword = ? AND {column} {operator} ?)')
+            parameters.extend([keyword, text if number is None else number])
+
+        if url is not None:
+            clauses.append('h.url = ?')
+            parameters.append(url)
+
+        statement = 'SELECT h.url, h.hdu, h.offset, h.length, h.raw FROM hdus h'
+        if clauses:
+            statement = f'{statement} WHERE {" AND ".join(clauses)}'
+
+        statement = f'{statement} ORDER BY h.url, h.hdu'
+        if limit is not None:
+            statement = f'{statement} LIMIT ?'
+            parameters.append(limit)
+
+        with self._connect() as connection:
+            return [CatalogueHeader(*row) for row in connection.execute(statement, parameters)]
+
+    def get(self: PWN, url: str) -> typing.List[CatalogueHeader]:
+        return self.query(url=url)
+
+    def remove(self: PWN, url: str) -> None:
+        with self._connect() as connection:
+            with self._transaction(connection):
+                connection.execute('DELETE FROM cards WHERE hdu_id IN (SELECT id FROM hdus WHERE url = ?)', (url, ))
+                connection.execute('DELETE FROM hdus WHERE url = ?', (url, ))
+
+    def __len__(self: PWN) -> int:
+        with self._connect() as connection:
+            total, = connection.execute('SELECT COUNT(*) FROM hdus').fetchone()
+            return total
+
+    def __contains__(self: PWN, url: str) -> bool:
+        with self._connect() as connection:
+            row = connection.execute('SELECT 1 FROM hdus WHERE url = ?', (url, )).fetchone()
+            return row is not None
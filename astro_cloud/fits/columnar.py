@@ -0,0 +1,249 @@
+import sys
+import typing
+
+import numpy as np
+
+from astro_cloud.fits.cards import iter_cards, parse_cards
+from astro_cloud.fits.datatypes import FITSHeader
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+DEFAULT_CHUNK_SIZE: int = 64 * 1024
+# Types a keyword can take, in promotion order. A keyword seen as both int and float is float, anything seen as a
+#   string at least once is a string
+KINDS: str = 'bifU'
+KIND_DTYPES: typing.Dict[str, np.dtype] = {
+    'b': np.dtype(np.bool_),
+    'i': np.dtype(np.int64),
+    'f': np.dtype(np.float64),
+}
+KIND_FILL_VALUES: typing.Dict[str, typing.Any] = {'b': False, 'i': 0, 'f': np.nan, 'U': ''}
+# Columns every row has, lower case so they can't clash with a FITS keyword
+RECORD_COLUMNS: typing.List[str] = ['url', 'hdu', 'offset', 'length']
+
+KIND_OF_TYPE: typing.Dict[type, str] = {bool: 'b', int: 'i', float: 'f', str: 'U'}
+
+def promote(kind: str, other: str) -> str:
+    return kind if KINDS.index(kind) >= KINDS.index(other) else other
+
+class Chunk(typing.NamedTuple):
+    '''
+    One column's values for a chunk of rows. mask is True where the keyword is missing and None when it's present in
+      every row. values is None when it's missing from every row
+    '''
+    length: int
+    values: np.ndarray
+    mask: np.ndarray
+
+class Column:
+    '''
+    Values of one keyword. The rows of the chunk being built are held sparsely, as row numbers and values, and turned
+      into a typed array when the chunk is sealed
+    '''
+    __slots__ = ('name', 'kind', 'chunks', '_rows', '_values', '_chunk_kind')
+    name: str
+    kind: str
+    chunks: typing.List[Chunk]
+    def __init__(self: PWN, name: str, sealed_chunk_lengths: typing.List[int]) -> None:
+        self.name = name
+        self.kind = 'b'
+        self.chunks = [Chunk(length, None, None) for length in sealed_chunk_lengths]
+        self._rows = []
+        self._values = []
+        self._chunk_kind = 'b'
+
+    def append(self: PWN, row: int, value: typing.Union[bool, int, float, str]) -> None:
+        self._rows.append(row)
+        self._values.append(value)
+        kind = KIND_OF_TYPE[type(value)]
+        if kind != self._chunk_kind:
+            self._chunk_kind = promote(self._chunk_kind, kind)
+
+    def seal(self: PWN, length: int) -> None:
+        if not self._rows:
+            self.chunks.append(Chunk(length, None, None))
+            return None
+
+        kind = self._chunk_kind
+        if kind == 'U':
+            values = np.array([str(value) for value in self._values])
+
+        else:
+            values = np.array(self._values, dtype=KIND_DTYPES[kind])
+
+        mask: np.ndarray = None
+        if len(self._rows) < length:
+            dense = np.full(length, KIND_FILL_VALUES[kind], dtype=values.dtype)
+            dense[self._rows] = values
+            values = dense
+            mask = np.ones(length, dtype=np.bool_)
+            mask[self._rows] = False
+
+        self.chunks.append(Chunk(length, values, mask))
+        self.kind = promote(self.kind, kind)
+        self._rows = []
+        self._values = []
+        self._chunk_kind = 'b'
+
+    def dtype(self: PWN) -> np.dtype:
+        if self.kind == 'U':
+            # Chunks sealed before a string was seen are cast to strings too, so their string form sets the width
+            width = max([chunk.values.astype(str, copy=False).dtype.itemsize // 4 for chunk in self.chunks
+                if chunk.values is not None] + [1])
+            return np.dtype(f'U{width}')
+
+        return KIND_DTYPES[self.kind]
+
+    def chunk_arrays(self: PWN, chunk: Chunk, dtype: np.dtype) -> typing.Tuple[np.ndarray, np.ndarray]:
+        '''
+        chunk's values cast to dtype, and its mask, with missing values filled
+        '''
+        if chunk.values is None:
+            return np.full(chunk.length, KIND_FILL_VALUES[self.kind], dtype=dtype), np.ones(chunk.length, np.bool_)
+
+        values = chunk.values.astype(dtype, copy=False)
+        if chunk.mask is not None and dtype.kind != chunk.values.dtype.kind:
+            values = values.copy()
+            values[chunk.mask] = KIND_FILL_VALUES[self.kind]
+
+        mask = chunk.mask if chunk.mask is not None else np.zeros(chunk.length, np.bool_)
+        return values, mask
+
+class ColumnarBuilder:
+    '''
+    Turns a stream of headers into one column per keyword, chunk_size rows at a time. Only the values of the chunk
+      being built are held as Python objects, and headers are read straight from their raw cards, so neither the
+      FITSHeader nor an astropy Header is kept. Every row also gets the url, hdu, offset and length of its header.
+      Pass keywords to keep only those, otherwise every keyword seen becomes a column
+
+      builder = ColumnarBuilder(keywords=['CAMERA', 'EXPOSURE'])
+      builder.extend(load_headers_many(urls, CloudService.S3))
+      table = builder.to_numpy()
+      table[(table['CAMERA'] == 4) & (table['EXPOSURE'] > 1000)]
+    '''
+    _keywords: typing.FrozenSet[str]
+    _chunk_size: int
+    _columns: typing.Dict[str, Column]
+    _sealed_lengths: typing.List[int]
+    _rows: int
+    _chunk_rows: int
+    def __init__(self: PWN, keywords: typing.Iterable[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        self._keywords = frozenset(sys.intern(keyword.upper()) for keyword in keywords) if keywords else None
+        self._chunk_size = chunk_size
+        self._columns = {name: Column(name, []) for name in RECORD_COLUMNS}
+        self._sealed_lengths = []
+        self._rows = 0
+        self._chunk_rows = 0
+
+    @property
+    def columns(self: PWN) -> typing.List[str]:
+        return list(self._columns.keys())
+
+    def __len__(self: PWN) -> int:
+        return self._rows
+
+    def add(self: PWN, header: FITSHeader, url: str = None, hdu: int = None) -> None:
+        row = self._chunk_rows
+        columns = self._columns
+        for name, value in zip(RECORD_COLUMNS, [url, hdu, header.offset, header.length]):
+            if value is not None:
+                columns[name].append(row, value)
+
+        if self._keywords is None:
+            cards = iter_cards(header.raw)
+
+        else:
+            cards = parse_cards(header.raw, self._keywords).items()
+
+        seen: typing.Set[str] = set()
+        for keyword, value in cards:
+            if keyword in seen:
+                continue
+
+            seen.add(keyword)
+            column = columns.get(keyword, None)
+            if column is None:
+                keyword = sys.intern(keyword)
+                column = columns[keyword] = Column(keyword, self._sealed_lengths)
+
+            column.append(row, value)
+
+        self._rows += 1
+        self._chunk_rows += 1
+        if self._chunk_rows >= self._chunk_size:
+            self._seal()
+
+    def add_chain(self: PWN, url: str, headers: typing.List[FITSHeader]) -> None:
+        for hdu, header in enumerate(headers):
+            self.add(header, url, hdu)
+
+    def extend(self: PWN, chains: typing.Iterable[typing.Tuple[str, typing.List[FITSHeader]]]) -> int:
+        '''
+        Adds (url, headers) chains, such as the HeaderResults of load_headers_many or crawl_headers, skipping the ones
+          that failed. Returns the number of rows added
+        '''
+        rows = self._rows
+        for chain in chains:
+            if chain[1] is not None:
+                self.add_chain(chain[0], chain[1])
+
+        return self._rows - rows
+
+    def _seal(self: PWN) -> None:
+        if self._chunk_rows == 0:
+            return None
+
+        for column in self._columns.values():
+            column.seal(self._chunk_rows)
+
+        self._sealed_lengths.append(self._chunk_rows)
+        self._chunk_rows = 0
+
+    def to_numpy(self: PWN) -> np.ma.MaskedArray:
+        '''
+        Returns a masked structured array with a field per column. Missing values are masked, and filled with False, 0,
+          NaN or an empty string underneath
+        '''
+        self._seal()
+        dtypes = {name: column.dtype() for name, column in self._columns.items()}
+        data = np.empty(self._rows, dtype=list(dtypes.items()))
+        mask = np.empty(self._rows, dtype=[(name, np.bool_) for name in dtypes])
+        for name, column in self._columns.items():
+            position = 0
+            for chunk in column.chunks:
+                values, chunk_mask = column.chunk_arrays(chunk, dtypes[name])
+                data[name][position:position + chunk.length] = values
+                mask[name][position:position + chunk.length] = chunk_mask
+                position += chunk.length
+
+        return np.ma.MaskedArray(data, mask=mask)
+
+    def to_arrow(self: PWN) -> 'pyarrow.Table':
+        '''
+        Returns a pyarrow.Table with a record batch per chunk and missing values as nulls. pyarrow is an optional
+          dependency, installed with `pip install astro-cloud[arrow]`
+        '''
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('ColumnarBuilder.to_arrow needs pyarrow, `pip install astro-cloud[arrow]`')
+
+        self._seal()
+        dtypes = {name: column.dtype() for name, column in self._columns.items()}
+        schema = pyarrow.schema([(name, pyarrow.string() if dtype.kind == 'U' else pyarrow.from_numpy_dtype(dtype))
+            for name, dtype in dtypes.items()])
+        batches: typing.List['pyarrow.RecordBatch'] = []
+        for chunk_idx, length in enumerate(self._sealed_lengths):
+            arrays: typing.List['pyarrow.Array'] = []
+            for field, column in zip(schema, self._columns.values()):
+                chunk = column.chunks[chunk_idx]
+                if chunk.values is None:
+                    arrays.append(pyarrow.nulls(length, type=field.type))
+                    continue
+
+                values, mask = column.chunk_arrays(chunk, dtypes[column.name])
+                arrays.append(pyarrow.array(values, type=field.type, mask=mask if chunk.mask is not None else None))
+
+            batches.append(pyarrow.RecordBatch.from_arrays(arrays, schema=schema))
+
+        return pyarrow.Table.from_batches(batches, schema=schema)
@@ -0,0 +1,358 @@
+import concurrent.futures
+import functools
+import itertools
+import threading
+import typing
+import zlib
+
+import numpy as np
+
+from astro_cloud.fits.cards import iter_cards
+from astro_cloud.fits.cutout import DEFAULT_MAX_GAP, ByteRange, normalize_key, read_byte_ranges, scale_image_data
+from astro_cloud.fits.datatypes import FITSHeader
+from astro_cloud.fits.table import descriptor_dtype, get_table_columns, load_table
+from astro_cloud.fits.utils import as_fits_dtype, get_data_offset, product
+from astro_cloud.transport import Transport
+
+DEFAULT_WORKERS: int = 8
+# Tile compression conventions, https://fits.gsfc.nasa.gov/registry/tilecompression.html
+DATA_COLUMNS: typing.List[str] = ['COMPRESSED_DATA', 'GZIP_COMPRESSED_DATA', 'UNCOMPRESSED_DATA']
+QUANTIZE_COLUMNS: typing.List[str] = ['ZSCALE', 'ZZERO', 'ZBLANK']
+# GZIP is decompressed with zlib, these go through astropy's codecs, which need astropy>=5.3. RICE falls back to
+#   rice_decode on older astropy
+ASTROPY_CODECS: typing.List[str] = ['RICE_1', 'RICE_ONE', 'PLIO_1', 'HCOMPRESS_1']
+RICE_CODECS: typing.List[str] = ['RICE_1', 'RICE_ONE']
+# BYTEPIX -> bits holding each block's FS value, and the FS value marking a block of raw, uncoded differences
+RICE_PARAMETERS: typing.Dict[int, typing.Tuple[int, int]] = {1: (3, 6), 2: (4, 14), 4: (5, 25)}
+# cfitsio's PLIO and HCOMPRESS decoders keep state in globals, so only one tile at a time goes through them
+SERIAL_CODECS: typing.List[str] = ['PLIO_1', 'HCOMPRESS_1']
+SERIAL_CODEC_LOCK: threading.Lock = threading.Lock()
+DITHER_RANDOM_COUNT: int = 10000
+# SUBTRACTIVE_DITHER_2 stores pixels that were exactly 0.0 as this value
+DITHER_ZERO_VALUE: int = -2147483646
+
+class CompressedImage(typing.NamedTuple):
+    '''
+    An image stored as a BINTABLE with ZIMAGE = T, one row per tile. Shapes are in numpy order, so the last axis is
+      ZNAXIS1, and tiles are numbered with ZNAXIS1 varying fastest
+    '''
+    shape: typing.Tuple[int, ...]
+    tile_shape: typing.Tuple[int, ...]
+    bitpix: int
+    compression: str
+    settings: typing.Dict[str, typing.Any]  # ZNAMEi = ZVALi
+    quantize: str
+    dither_seed: int
+    blank: int
+    bscale: float
+    bzero: float
+    heap_offset: int  # from the start of the file
+
+    @property
+    def grid(self: 'CompressedImage') -> typing.Tuple[int, ...]:
+        return tuple(-(-length // tile) for length, tile in zip(self.shape, self.tile_shape))
+
+def is_compressed_image(header: FITSHeader) -> bool:
+    if header.cards.get('XTENSION', None) not in ['BINTABLE']:
+        return False
+
+    return any(keyword == 'ZIMAGE' and value is True for keyword, value in iter_cards(header.raw))
+
+def read_compressed_image(header: FITSHeader) -> CompressedImage:
+    '''
+    Reads the Z keywords describing the image, from the raw header
+    '''
+    cards: typing.Dict[str, typing.Any] = {}
+    for keyword, value in iter_cards(header.raw):
+        cards.setdefault(keyword, value)
+
+    if cards.get('ZIMAGE', False) is not True:
+        raise NotImplementedError(f'XTENSION[{cards.get("XTENSION", None)}] is not a tile compressed image')
+
+    ndim: int = cards['ZNAXIS']
+    shape = tuple(cards[f'ZNAXIS{idx}'] for idx in range(ndim, 0, -1))
+    # Tiles default to one row of the image
+    tile_shape = tuple(cards.get(f'ZTILE{idx}', cards['ZNAXIS1'] if idx == 1 else 1) for idx in range(ndim, 0, -1))
+    settings: typing.Dict[str, typing.Any] = {}
+    idx = 1
+    while f'ZNAME{idx}' in cards:
+        settings[str(cards[f'ZNAME{idx}']).upper()] = cards.get(f'ZVAL{idx}', None)
+        idx += 1
+
+    theap: int = cards.get('THEAP', cards['NAXIS1'] * cards['NAXIS2'])
+    return CompressedImage(shape, tile_shape, cards['ZBITPIX'], cards['ZCMPTYPE'], settings,
+        cards.get('ZQUANTIZ', None), cards.get('ZDITHER0', 0), cards.get('ZBLANK', None),
+        cards.get('BSCALE', 1), cards.get('BZERO', 0), get_data_offset(header) + theap)
+
+@functools.lru_cache(maxsize=1)
+def dither_random_values() -> np.ndarray:
+    '''
+    The sequence of random numbers the FITS standard uses for subtractive dithering, a Park-Miller generator rounded
+      to float32 the way cfitsio stores it
+    '''
+    a: float = 16807.0
+    m: float = 2147483647.0
+    seed: float = 1.0
+    values = np.empty(DITHER_RANDOM_COUNT, dtype=np.float32)
+    for idx in range(DITHER_RANDOM_COUNT):
+        temp = a * seed
+        seed = temp - m * int(temp / m)
+        values[idx] = seed / m
+
+    return values.astype(np.float64)
+
+def dither_offsets(row: int, size: int) -> np.ndarray:
+    '''
+    The random offsets subtracted from the quantized pixels of a tile, row being the table row plus ZDITHER0 - 1.
+      With rows counting from 1, the first offset is picked by (row + ZDITHER0 - 2) % 10000
+    '''
+    values = dither_random_values()
+    offsets = np.empty(size, dtype=np.float64)
+    seed_idx = (row - 1) % DITHER_RANDOM_COUNT
+    position = 0
+    while position < size:
+        start = int(np.float32(values[seed_idx]) * np.float32(500.0))
+        count = min(DITHER_RANDOM_COUNT - start, size - position)
+        offsets[position:position + count] = values[start:start + count]
+        position += count
+        seed_idx = (seed_idx + 1) % DITHER_RANDOM_COUNT
+
+    return offsets
+
+def finalize_buffer(content: bytes, size: int, bitpix: int, lossless: bool) -> np.ndarray:
+    '''
+    Decompressed GZIP tiles carry no type, it follows from their size the way cfitsio works it out
+    '''
+    itemsize = len(content) // size if size else 1
+    if itemsize == 2:
+        dtype = '>i2'
+
+    elif itemsize in [4, 8]:
+        dtype = f'>f{itemsize}' if bitpix < 0 and lossless else f'>i{itemsize}'
+
+    else:
+        dtype = 'u1'
+
+    return np.frombuffer(content, dtype=dtype, count=size)
+
+def rice_decode(content: bytes, size: int, block_size: int = 32, bytepix: int = 4) -> np.ndarray:
+    '''
+    Decodes a RICE_1 tile the way cfitsio's fits_rdecomp does. The first pixel is stored as is, the rest as differences
+      from the previous pixel, folded to be positive, in blocks of block_size pixels. Each block starts with FS, after
+      which every difference is a unary coded quotient followed by FS low bits. FS of -1 means every difference in the
+      block is 0, and the largest FS means differences are stored uncoded. Only used where astropy's Rice1 isn't
+    '''
+    if not bytepix in RICE_PARAMETERS:
+        raise NotImplementedError(f'RICE_1 BYTEPIX[{bytepix}] not implemented')
+
+    fs_bits, fs_max = RICE_PARAMETERS[bytepix]
+    pixel_bits: int = bytepix * 8
+    mask: int = (1 << pixel_bits) - 1
+    # One '0' or '1' per bit, so runs of zeros are found and fields parsed by str methods, in C
+    bits: str = (np.unpackbits(np.frombuffer(content, dtype=np.uint8)[bytepix:]) + ord('0')).tobytes().decode('ascii')
+    last: int = int.from_bytes(content[:bytepix], 'big')
+    values: typing.List[int] = []
+    position: int = 0
+    while len(values) < size:
+        count = min(block_size, size - len(values))
+        fs = int(bits[position:position + fs_bits], 2) - 1
+        position += fs_bits
+        if fs < 0:
+            values.extend([last] * count)
+            continue
+
+        for _ in range(count):
+            if fs == fs_max:
+                diff = int(bits[position:position + pixel_bits], 2)
+                position += pixel_bits
+
+            else:
+                one = bits.find('1', position)
+                if one < 0:
+                    raise ValueError('RICE_1 tile ends before all of its pixels were decoded')
+
+                diff = (one - position) << fs
+                position = one + 1
+                if fs:
+                    diff |= int(bits[position:position + fs], 2)
+                    position += fs
+
+            diff = mask ^ (diff >> 1) if diff & 1 else diff >> 1
+            last = (last + diff) & mask
+            values.append(last)
+
+    return np.array(values, dtype=f'u{bytepix}').view(f'i{bytepix}')
+
+def decompress_tile(image: CompressedImage, compression: str, content: bytes, element_dtype: np.dtype,
+        tile_shape: typing.Tuple[int, ...], lossless: bool) -> np.ndarray:
+    '''
+    Returns the tile's pixels as stored, before any quantization is undone
+    '''
+    size = product(tile_shape)
+    if compression in ['GZIP_1', 'GZIP_2']:
+        # wbits 47 accepts gzip and zlib streams
+        content = zlib.decompress(content, 47)
+        if compression == 'GZIP_2' and size:
+            # Bytes are shuffled, every value's most significant byte first, then the next ...
+            itemsize = len(content) // size
+            content = np.frombuffer(content, dtype=np.uint8, count=size * itemsize).reshape(itemsize, size).T.tobytes()
+
+        return finalize_buffer(content, size, image.bitpix, lossless)
+
+    elif compression == 'NOCOMPRESS':
+        return finalize_buffer(content, size, image.bitpix, lossless)
+
+    elif compression not in ASTROPY_CODECS:
+        raise NotImplementedError(f'ZCMPTYPE[{compression}] not implemented')
+
+    try:
+        # Private, and only there from astropy 5.3 on
+        from astropy.io.fits.hdu.compressed import _codecs
+    except ImportError:
+        if compression in RICE_CODECS:
+            return rice_decode(content, size, image.settings.get('BLOCKSIZE', 32), image.settings.get('BYTEPIX', 4))
+
+        raise NotImplementedError(f'ZCMPTYPE[{compression}] needs astropy>=5.3 to decompress')
+
+    if compression in RICE_CODECS:
+        codec = _codecs.Rice1(blocksize=image.settings.get('BLOCKSIZE', 32), bytepix=image.settings.get('BYTEPIX', 4),
+            tilesize=size)
+
+    elif compression == 'PLIO_1':
+        codec = _codecs.PLIO1(tilesize=size)
+
+    else:
+        plane = tuple(axis for axis in tile_shape if axis != 1)
+        if len(plane) != 2:
+            raise NotImplementedError(f'HCOMPRESS_1 tiles must be two dimensional, not {tile_shape}')
+
+        codec = _codecs.HCompress1(scale=int(image.settings.get('SCALE', 0)), smooth=image.settings.get('SMOOTH', 0),
+            bytepix=8, nx=plane[0], ny=plane[1])
+
+    if compression in SERIAL_CODECS:
+        with SERIAL_CODEC_LOCK:
+            values = codec.decode(np.frombuffer(content, dtype=element_dtype))
+
+    else:
+        values = codec.decode(np.frombuffer(content, dtype=element_dtype))
+
+    return np.asarray(values).ravel()[:size]
+
+def dequantize_tile(image: CompressedImage, values: np.ndarray, row: int, scale: float, zero: float,
+        blank: int) -> np.ndarray:
+    '''
+    Turns quantized integers back into floats, blank pixels become NaN
+    '''
+    values = values.astype(values.dtype.newbyteorder('='))
+    pixels = values.astype(np.float64)
+    if image.quantize in ['SUBTRACTIVE_DITHER_1', 'SUBTRACTIVE_DITHER_2']:
+        pixels = (pixels - dither_offsets(row + image.dither_seed - 1, values.size) + 0.5) * scale + zero
+        if image.quantize == 'SUBTRACTIVE_DITHER_2':
+            pixels[values == DITHER_ZERO_VALUE] = 0.0
+
+    else:
+        pixels = pixels * scale + zero
+
+    if blank is not None:
+        pixels[values == blank] = np.nan
+
+    return pixels.astype(np.float32 if image.bitpix == -32 else np.float64)
+
+class TileRead(typing.NamedTuple):
+    tile: int  # row of the table, counting from 0
+    column: str
+    byte_range: ByteRange
+
+def load_compressed_cutout(url: str, header: FITSHeader, key: typing.Any, auth: 'requests.auth.AuthBase' = None,
+        transport: Transport = None, max_gap: int = DEFAULT_MAX_GAP, scale: bool = True,
+        workers: int = DEFAULT_WORKERS) -> np.ndarray:
+    '''
+    Reads image[key] from a tile compressed image. The tile descriptors are read from the table, then only the tiles
+      the cutout touches are fetched from the heap and decompressed, workers at a time. key follows load_cutout
+    '''
+    image = read_compressed_image(header)
+    selections = normalize_key(image.shape, key)
+    indices: typing.List[np.ndarray] = [np.arange(item, item + 1) if isinstance(item, int) else
+        np.asarray(item, dtype=np.int64) for item in selections]
+    quantized_dtype = np.dtype(np.float32 if image.bitpix == -32 else np.float64)
+    dtype = quantized_dtype if image.bitpix < 0 else as_fits_dtype(image.bitpix).newbyteorder('=')
+    squeeze = tuple(0 if isinstance(item, int) else slice(None) for item in selections)
+    if any(item.size == 0 for item in indices):
+        data = np.empty(tuple(item.size for item in indices), dtype=dtype)[squeeze]
+        return scale_image_data(data, image.bscale, image.bzero) if scale and image.bitpix > 0 else data
+
+    # The tiles each axis needs, and where each lands in a buffer holding only those tiles
+    axis_tiles: typing.List[np.ndarray] = []
+    axis_positions: typing.List[typing.Dict[int, int]] = []
+    buffer_indices: typing.List[np.ndarray] = []
+    for item, length, tile_length in zip(indices, image.shape, image.tile_shape):
+        tiles = np.unique(item // tile_length)
+        lengths = np.minimum(tile_length, length - tiles * tile_length)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        axis_tiles.append(tiles)
+        axis_positions.append(dict(zip(tiles.tolist(), starts.tolist())))
+        buffer_indices.append(starts[np.searchsorted(tiles, item // tile_length)] + item % tile_length)
+
+    grid = image.grid
+    table_columns = {column.name.upper(): column for column in get_table_columns(header)}
+    names = [name for name in DATA_COLUMNS + QUANTIZE_COLUMNS if name in table_columns]
+    tile_numbers = sorted(int(np.ravel_multi_index(combination, grid)) for combination in itertools.product(*axis_tiles))
+    first_tile = tile_numbers[0]
+    table = load_table(url, header, names, rows=range(first_tile, tile_numbers[-1] + 1), auth=auth,
+        transport=transport, max_gap=max_gap, scale=False)
+    table = {name.upper(): values for name, values in table.items()}
+
+    reads: typing.List[TileRead] = []
+    for tile in tile_numbers:
+        for name in DATA_COLUMNS:
+            if name in table and table[name][tile - first_tile][0] > 0:
+                count, offset = table[name][tile - first_tile]
+                itemsize = descriptor_dtype(table_columns[name]).itemsize
+                start = image.heap_offset + int(offset)
+                reads.append(TileRead(tile, name, ByteRange(start, start + int(count) * itemsize)))
+                break
+
+        else:
+            raise Exception(f'Tile[{tile}] has no data in any of {DATA_COLUMNS}')
+
+    content = read_byte_ranges(url, [read.byte_range for read in reads], max_gap, auth, transport)
+    positions = np.cumsum([0] + [read.byte_range.stop - read.byte_range.start for read in reads]).tolist()
+    quantized = 'ZSCALE' in table
+
+    def decode(read_idx: int) -> typing.Tuple[typing.Tuple[slice, ...], np.ndarray]:
+        read = reads[read_idx]
+        tile_index = np.unravel_index(read.tile, grid)
+        tile_shape = tuple(min(tile_length, length - idx * tile_length)
+            for idx, length, tile_length in zip(tile_index, image.shape, image.tile_shape))
+        data = bytes(content[positions[read_idx]:positions[read_idx + 1]])
+        element_dtype = descriptor_dtype(table_columns[read.column])
+        if read.column == 'UNCOMPRESSED_DATA':
+            values = np.frombuffer(data, dtype=element_dtype)
+
+        elif read.column == 'GZIP_COMPRESSED_DATA':
+            # Tiles that wouldn't quantize are stored losslessly
+            values = decompress_tile(image, 'GZIP_1', data, element_dtype, tile_shape, True)
+
+        else:
+            values = decompress_tile(image, image.compression, data, element_dtype, tile_shape, not quantized)
+            if quantized:
+                row = read.tile - first_tile
+                blank = table['ZBLANK'][row] if 'ZBLANK' in table else image.blank
+                values = dequantize_tile(image, values, read.tile + 1, table['ZSCALE'][row], table['ZZERO'][row],
+                    blank)
+
+        target = tuple(slice(tile_starts[int(idx)], tile_starts[int(idx)] + length)
+            for tile_starts, idx, length in zip(axis_positions, tile_index, tile_shape))
+        return target, values.reshape(tile_shape)
+
+    buffer = np.empty(tuple(sum(min(tile_length, length - tile * tile_length) for tile in tiles.tolist())
+        for tiles, length, tile_length in zip(axis_tiles, image.shape, image.tile_shape)), dtype=dtype)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(reads)))) as executor:
+        for target, values in executor.map(decode, range(len(reads))):
+            buffer[target] = values
+
+    data = buffer[np.ix_(*buffer_indices)][squeeze]
+    if scale and image.bitpix > 0:
+        data = scale_image_data(data, image.bscale, image.bzero)
+
+    return data
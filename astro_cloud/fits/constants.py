@@ -1,3 +1,5 @@
 BLOCK_SIZE = 2880
 END_CARD = 'END' + ' ' * 77
 ENCODING = 'utf-8'
+CARD_SIZE = 80
+GZIP_MAGIC = b'\x1f\x8b'
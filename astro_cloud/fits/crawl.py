@@ -0,0 +1,63 @@
+import functools
+import typing
+
+from astro_cloud.fits import load_headers
+from astro_cloud.fits.batch import HeaderResult, map_headers
+from astro_cloud.fits.constants import BLOCK_SIZE
+from astro_cloud.fits.datatypes import CloudService, PaymentSolution
+from astro_cloud.fits.index.base import prefetch_headers
+from astro_cloud.fits.index.cache import HeaderCache
+from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+from astro_cloud.listing.aws import LIST_MAX_KEYS, ObjectEntry, iter_pages
+from astro_cloud.metrics import Instrumentation
+from astro_cloud.transport import Transport
+
+DEFAULT_SUFFIXES: typing.Tuple[str, ...] = ('.fits', '.fit', '.fts')
+# Services listed with ListObjectsV2
+LISTABLE_SERVICES: typing.List[CloudService] = [CloudService.S3, CloudService.Spaces]
+
+def filter_objects(entries: typing.Iterable[ObjectEntry], suffixes: typing.Tuple[str, ...] = DEFAULT_SUFFIXES,
+        min_size: int = BLOCK_SIZE, max_size: int = None) -> typing.Iterator[ObjectEntry]:
+    '''
+    Keeps entries whose key ends with one of suffixes, case insensitively, and whose size is within
+      [min_size, max_size]. Anything smaller than a block can't be a FITS file. Pass suffixes=None to keep every key
+    '''
+    suffixes = tuple(suffix.lower() for suffix in suffixes) if suffixes else None
+    for entry in entries:
+        if suffixes and not entry.key.lower().endswith(suffixes):
+            continue
+
+        if min_size is not None and entry.size < min_size:
+            continue
+
+        if max_size is not None and entry.size > max_size:
+            continue
+
+        yield entry
+
+def crawl_headers(bucket_url: str, prefix: str = None, service: CloudService = CloudService.S3,
+        payment_solution: PaymentSolution = None, suffixes: typing.Tuple[str, ...] = DEFAULT_SUFFIXES,
+        min_size: int = BLOCK_SIZE, max_size: int = None, max_workers: int = 16, max_per_host: int = 4,
+        list_ahead: int = 2, max_keys: int = LIST_MAX_KEYS, transport: Transport = None, read_ahead: ReadAheadConfig = None,
+        cache: HeaderCache = None, instrumentation: Instrumentation = None) -> typing.Iterator[HeaderResult]:
+    '''
+    Lists every object under prefix in bucket_url and loads the headers of those passing the filters, yielding a
+      HeaderResult per object in completion order. Listing runs on a background thread up to list_ahead pages ahead,
+      so headers from the first page are being indexed while later pages are still being listed, and memory stays
+      bounded by list_ahead pages plus the map_headers backlog
+
+      crawl_headers('https://s3.us-east-1.amazonaws.com/stpubdata', 'tess/public/mast/', CloudService.S3,
+          PaymentSolution.AWSRequestPayer)
+    '''
+    if service not in LISTABLE_SERVICES:
+        raise NotImplementedError(f'Listing Cloud Service[{service}] not implemented')
+
+    pages = iter_pages(bucket_url, prefix, payment_solution, transport, max_keys=max_keys, service=service)
+    if list_ahead > 0:
+        pages = prefetch_headers(pages, list_ahead)
+
+    entries = filter_objects((entry for page in pages for entry in page.entries), suffixes, min_size, max_size)
+    loader = functools.partial(load_headers, service=service, payment_solution=payment_solution,
+        transport=transport, read_ahead=read_ahead, cache=cache, instrumentation=instrumentation)
+    return map_headers((entry.url for entry in entries), loader, max_workers=max_workers,
+        max_per_host=max_per_host)
@@ -0,0 +1,190 @@
+import bisect
+import typing
+
+import numpy as np
+
+from astro_cloud.fits.datatypes import FITSHeader
+from astro_cloud.fits.utils import as_fits_dtype, get_data_offset, get_image_shape
+from astro_cloud.transport import Transport, get_default_transport
+
+# Gaps smaller than this are cheaper to download than to request separately
+DEFAULT_MAX_GAP: int = 64 * 1024
+
+class ByteRange(typing.NamedTuple):
+    start: int
+    stop: int  # exclusive, unlike the HTTP Range header
+
+class CutoutPlan(typing.NamedTuple):
+    '''
+    Byte ranges relative to the start of the data unit, and how to turn their concatenation back into an array
+    '''
+    ranges: typing.List[ByteRange]
+    fetched_shape: typing.Tuple[int, ...]
+    run_axis: int
+    span_take: np.ndarray  # indices to take along run_axis when the selection isn't the whole span
+    squeeze_axes: typing.Tuple[int, ...]  # axes indexed with an int
+
+def normalize_key(shape: typing.Tuple[int, ...], key: typing.Any) -> typing.List[typing.Union[int, range]]:
+    '''
+    Turns a numpy style index of ints, slices and Ellipsis into one int or range per axis
+    '''
+    if not isinstance(key, tuple):
+        key = (key, )
+
+    if any(item is Ellipsis for item in key):
+        position = key.index(Ellipsis)
+        fill = (slice(None), ) * (len(shape) - len(key) + 1)
+        key = key[:position] + fill + key[position + 1:]
+
+    if len(key) > len(shape):
+        raise IndexError(f'Too many indices[{len(key)}] for an image with {len(shape)} axes')
+
+    key = key + (slice(None), ) * (len(shape) - len(key))
+    selections: typing.List[typing.Union[int, range]] = []
+    for item, length in zip(key, shape):
+        if isinstance(item, slice):
+            selections.append(range(*item.indices(length)))
+
+        else:
+            index = int(item)
+            if not -length <= index < length:
+                raise IndexError(f'Index[{index}] out of bounds for axis of length {length}')
+
+            selections.append(index % length)
+
+    return selections
+
+def plan_cutout(shape: typing.Tuple[int, ...], itemsize: int, key: typing.Any) -> CutoutPlan:
+    '''
+    The innermost axes that are selected in full are contiguous on disk. Together with the span of the first partially
+      selected axis they make up one run of bytes, which is repeated for every combination of the outer axes
+    '''
+    selections = normalize_key(shape, key)
+    indices: typing.List[range] = [range(item, item + 1) if isinstance(item, int) else item for item in selections]
+    ndim: int = len(shape)
+    run_axis: int = ndim - 1
+    while run_axis > 0 and indices[run_axis] == range(shape[run_axis]):
+        run_axis -= 1
+
+    selection = indices[run_axis]
+    if run_axis < ndim - 1 and len(selection) > 1 and selection.step != 1:
+        # Spanning a strided axis would fetch whole skipped sub-arrays
+        run_axis += 1
+        selection = indices[run_axis]
+
+    strides: typing.List[int] = [int(np.prod(shape[axis + 1:], dtype=np.int64)) for axis in range(ndim)]
+    squeeze_axes = tuple(axis for axis, item in enumerate(selections) if isinstance(item, int))
+    if any(len(item) == 0 for item in indices):
+        return CutoutPlan([], tuple(len(item) for item in indices), run_axis, None, squeeze_axes)
+
+    span_start: int = min(selection)
+    span_stop: int = max(selection) + 1
+    run_length: int = (span_stop - span_start) * strides[run_axis]
+    offsets = np.zeros((), dtype=np.int64) + span_start * strides[run_axis]
+    for axis in range(run_axis):
+        axis_offsets = np.asarray(indices[axis], dtype=np.int64) * strides[axis]
+        offsets = np.add.outer(offsets, axis_offsets)
+
+    ranges = [ByteRange(int(offset) * itemsize, (int(offset) + run_length) * itemsize) for offset in offsets.ravel()]
+    fetched_shape = tuple(len(indices[axis]) for axis in range(run_axis)) + (span_stop - span_start, ) + \
+        tuple(shape[run_axis + 1:])
+    span_take: np.ndarray = None
+    if selection != range(span_start, span_stop):
+        span_take = np.asarray(selection, dtype=np.int64) - span_start
+
+    return CutoutPlan(ranges, fetched_shape, run_axis, span_take, squeeze_axes)
+
+def merge_byte_ranges(ranges: typing.List[ByteRange], max_gap: int = DEFAULT_MAX_GAP) -> typing.List[ByteRange]:
+    '''
+    Merges ranges that overlap or are separated by no more than max_gap bytes
+    '''
+    merged: typing.List[ByteRange] = []
+    for byte_range in sorted(ranges):
+        if merged and byte_range.start - merged[-1].stop <= max_gap:
+            merged[-1] = ByteRange(merged[-1].start, max(merged[-1].stop, byte_range.stop))
+
+        else:
+            merged.append(byte_range)
+
+    return merged
+
+def fetch_byte_ranges(url: str, ranges: typing.List[ByteRange], auth: 'requests.auth.AuthBase' = None,
+        transport: Transport = None) -> typing.List[bytes]:
+    '''
+    Fetches every range, batched into multi-range requests where the server supports them
+    '''
+    transport = transport or get_default_transport()
+    contents = transport.read_ranges(url, [(byte_range.start, byte_range.stop - 1) for byte_range in ranges], auth=auth)
+    for byte_range, content in zip(ranges, contents):
+        if len(content) != byte_range.stop - byte_range.start:
+            raise Exception(f'Expected {byte_range.stop - byte_range.start} bytes, received {len(content)}')
+
+    return contents
+
+def read_byte_ranges(url: str, ranges: typing.List[ByteRange], max_gap: int = DEFAULT_MAX_GAP,
+        auth: 'requests.auth.AuthBase' = None, transport: Transport = None) -> bytearray:
+    '''
+    Fetches ranges, merging neighbours that are less than max_gap bytes apart, and returns the requested bytes
+      concatenated in the order the ranges were given
+    '''
+    merged = merge_byte_ranges(ranges, max_gap)
+    contents = fetch_byte_ranges(url, merged, auth, transport)
+    merged_starts: typing.List[int] = [byte_range.start for byte_range in merged]
+    output = bytearray(sum(byte_range.stop - byte_range.start for byte_range in ranges))
+    position: int = 0
+    for byte_range in ranges:
+        merged_idx = bisect.bisect_right(merged_starts, byte_range.start) - 1
+        start = byte_range.start - merged[merged_idx].start
+        length = byte_range.stop - byte_range.start
+        output[position:position + length] = memoryview(contents[merged_idx])[start:start + length]
+        position += length
+
+    return output
+
+def scale_image_data(data: np.ndarray, bscale: float, bzero: float) -> np.ndarray:
+    '''
+    Applies BSCALE and BZERO like astropy does, mapping the usual BZERO offsets onto unsigned integers
+    '''
+    if bscale == 1 and bzero == 0:
+        return data
+
+    if data.dtype.kind == 'i' and bscale == 1 and bzero == 1 << (data.dtype.itemsize * 8 - 1):
+        unsigned = np.dtype(f'u{data.dtype.itemsize}')
+        return data.view(unsigned) ^ unsigned.type(bzero)
+
+    float_dtype = np.float32 if data.dtype.itemsize <= 2 or data.dtype == np.float32 else np.float64
+    return (data * float_dtype(bscale) + float_dtype(bzero)).astype(float_dtype, copy=False)
+
+def load_cutout(url: str, header: FITSHeader, key: typing.Any, auth: 'requests.auth.AuthBase' = None,
+        transport: Transport = None, max_gap: int = DEFAULT_MAX_GAP, scale: bool = True) -> np.ndarray:
+    '''
+    Reads image[key] from the data unit following header, without downloading anything outside the cutout other
+      than gaps smaller than max_gap. key is a numpy style index over the numpy ordered shape, so for a TESS cube,
+      (NAXIS4, NAXIS3, NAXIS2, NAXIS1). The array is returned in native byte order, scaled by BSCALE and BZERO.
+      Tile compressed images, BINTABLEs with ZIMAGE = T, are read tile by tile with load_compressed_cutout
+    '''
+    if header.cards.get('XTENSION', None) in ['BINTABLE']:
+        from astro_cloud.fits.compressed import is_compressed_image, load_compressed_cutout
+
+        if is_compressed_image(header):
+            return load_compressed_cutout(url, header, key, auth, transport, max_gap, scale)
+
+    if header.cards.get('SIMPLE', False) is not True and header.cards.get('XTENSION', None) not in ['IMAGE']:
+        raise NotImplementedError(f'Cutouts of XTENSION[{header.cards.get("XTENSION", None)}] not implemented')
+
+    dtype = as_fits_dtype(header.cards['BITPIX'])
+    shape = get_image_shape(header)
+    plan = plan_cutout(shape, dtype.itemsize, key)
+    data_offset = get_data_offset(header)
+    ranges = [ByteRange(data_offset + byte_range.start, data_offset + byte_range.stop) for byte_range in plan.ranges]
+    content = read_byte_ranges(url, ranges, max_gap, auth, transport) if ranges else bytearray()
+    data = np.frombuffer(content, dtype=dtype).reshape(plan.fetched_shape)
+    if plan.span_take is not None:
+        data = np.take(data, plan.span_take, axis=plan.run_axis)
+
+    data = data[tuple(0 if axis in plan.squeeze_axes else slice(None) for axis in range(len(shape)))]
+    data = data.astype(dtype.newbyteorder('='))
+    if scale:
+        data = scale_image_data(data, header.fits.get('BSCALE', 1), header.fits.get('BZERO', 0))
+
+    return data
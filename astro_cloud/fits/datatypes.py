@@ -1,9 +1,10 @@
 import enum
 import typing
 
-import numpy as np
+from astro_cloud.fits.cards import parse_structural_cards
+from astro_cloud.fits.constants import ENCODING
 
-from astropy.io import fits
+PWN: typing.TypeVar = typing.TypeVar('PWN')
 
 class PaymentSolution(enum.Enum):
     AWSRequestPayer = 'aws-request-payer'
@@ -13,8 +14,87 @@ class CloudService(enum.Enum):
     ObjectStorage = 'google-cloud-platform-object-storage'
     BlobStorage = 'azure-blob-storage'
     Spaces = 'digital-ocean-spaces'
+    FileSystem = 'local-file-system'
 
-class FITSHeader(typing.NamedTuple):
+class FITSHeader:
+    '''
+    A header found at offset, length bytes long including its padding. Records built by the index modules keep the raw
+      header bytes and the structural cards needed to walk the file, and only build the astropy Header the first time
+      `fits` is accessed. It still unpacks like the (offset, length, fits) tuple it used to be
+    '''
+    __slots__ = ('offset', 'length', '_fits', '_raw', '_cards')
     offset: int
     length: int
-    fits: fits.Header
+    _fits: 'astropy.io.fits.Header'
+    _raw: bytes
+    _cards: typing.Dict[str, typing.Any]
+    def __init__(self: PWN, offset: int, length: int, fits: 'astropy.io.fits.Header' = None, raw: bytes = None,
+            cards: typing.Dict[str, typing.Any] = None) -> None:
+        if fits is None and raw is None:
+            raise ValueError('FITSHeader needs either an astropy Header or the raw header bytes')
+
+        self.offset = offset
+        self.length = length
+        self._fits = fits
+        self._raw = raw
+        self._cards = cards
+
+    @property
+    def fits(self: PWN) -> 'astropy.io.fits.Header':
+        if self._fits is None:
+            # astropy takes most of a second to import, so it's left until a Header is actually needed
+            from astropy.io import fits
+
+            self._fits = fits.Header.fromstring(self._raw.decode(ENCODING))
+
+        return self._fits
+
+    @property
+    def raw(self: PWN) -> bytes:
+        if self._raw is None:
+            self._raw = self._fits.tostring().encode(ENCODING)
+
+        return self._raw
+
+    @property
+    def cards(self: PWN) -> typing.Dict[str, typing.Any]:
+        '''
+        The structural keywords: SIMPLE or XTENSION, BITPIX, NAXIS, NAXISn, PCOUNT and GCOUNT
+        '''
+        if self._cards is None:
+            self._cards = parse_structural_cards(self.raw)
+
+        return self._cards
+
+    @property
+    def materialized(self: PWN) -> bool:
+        return self._fits is not None
+
+    def get(self: PWN, keyword: str, default: typing.Any = None) -> typing.Any:
+        '''
+        Looks keyword up in the structural cards before falling back to the astropy Header
+        '''
+        if keyword in self.cards:
+            return self._cards[keyword]
+
+        return self.fits.get(keyword, default)
+
+    def __iter__(self: PWN) -> typing.Iterator[typing.Any]:
+        return iter((self.offset, self.length, self.fits))
+
+    def __eq__(self: PWN, other: typing.Any) -> bool:
+        if not isinstance(other, FITSHeader):
+            return NotImplemented
+
+        return self.offset == other.offset and self.length == other.length and self.raw == other.raw
+
+    def __repr__(self: PWN) -> str:
+        kind = 'SIMPLE' if self.cards.get('SIMPLE', False) is True else self.cards.get('XTENSION', None)
+        return f'FITSHeader(offset={self.offset}, length={self.length}, kind={kind})'
+
+    def __getstate__(self: PWN) -> typing.Tuple[int, int, bytes, typing.Dict[str, typing.Any]]:
+        return (self.offset, self.length, self.raw, self.cards)
+
+    def __setstate__(self: PWN, state: typing.Tuple[int, int, bytes, typing.Dict[str, typing.Any]]) -> None:
+        self.offset, self.length, self._raw, self._cards = state
+        self._fits = None
@@ -1,41 +1,351 @@
-import requests
+import queue
+import threading
+import time
 import typing
 
-from astropy.io import fits
-
-from astro_cloud.fits.constants import END_CARD, BLOCK_SIZE, ENCODING
+from astro_cloud.fits.cards import parse_structural_cards
+from astro_cloud.fits.constants import END_CARD, BLOCK_SIZE, CARD_SIZE, ENCODING, GZIP_MAGIC
 from astro_cloud.fits.utils import find_next_header_offset
 from astro_cloud.fits.datatypes import FITSHeader
+from astro_cloud.fits.index.cache import CachedHeaders, HeaderCache, validators
+from astro_cloud.fits.index.read_ahead import AdaptiveReadAhead, ReadAheadConfig
+from astro_cloud.metrics import CallStats, Instrumentation, RequestSpan, TimedAuth, time_to_first_byte
+from astro_cloud.transport import AsyncTransport, Transport, get_default_transport
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+END_CARD_BYTES: bytes = END_CARD.encode(ENCODING)
+PREFETCH_POLL_INTERVAL: float = 0.1
+
+def find_end_card(buffer: typing.Union[bytes, bytearray, 'mmap.mmap'], start: int = 0, end: int = None) -> bool:
+    '''
+    Searches buffer[start:end] for the END card without copying it. END has to start on a card boundary, otherwise
+      it's part of another card's value or comment
+    '''
+    end = len(buffer) if end is None else end
+    position = buffer.find(END_CARD_BYTES, start, end)
+    while position != -1:
+        if (position - start) % CARD_SIZE == 0:
+            return True
+
+        position = buffer.find(END_CARD_BYTES, position + 1, end)
+
+    return False
+
+def parse_content_range_size(content_range: str) -> int:
+    '''
+    Content-Range: bytes 0-2879/1234567
+    '''
+    if content_range is None or not '/' in content_range:
+        return None
+
+    size = content_range.rsplit('/', 1)[-1]
+    if size == '*':
+        return None
+
+    return int(size)
+
+class HeaderScanner:
+    '''
+    Walks the Header and Data Units of a FITS file without doing any I/O. Ask `next_range` which bytes are needed,
+      fetch them and hand them to `feed`, which returns every header completed by those bytes. Bytes buffered past an
+      END card are kept when they cover the next header, and dropped when they belong to a data unit
+    '''
+    _buffer: bytearray
+    _buffer_offset: int
+    _scanned_blocks: int
+    _size: int
+    _done: bool
+    _needed_blocks: int
+    def __init__(self: PWN, offset: int = 0) -> None:
+        self._buffer = bytearray()
+        self._buffer_offset = offset
+        self._scanned_blocks = 0
+        self._size = None
+        self._done = False
+        self._needed_blocks = 0
+
+    @property
+    def done(self: PWN) -> bool:
+        return self._done
+
+    @property
+    def offset(self: PWN) -> int:
+        '''
+        Offset of the next byte that needs to be fetched
+        '''
+        return self._buffer_offset + len(self._buffer)
+
+    @property
+    def needed_blocks(self: PWN) -> int:
+        '''
+        Blocks of the last fed response used up to its last END card. When the response ends part way through a header,
+          all of the blocks were used and more are needed, which is reported as one more than was fed
+        '''
+        return self._needed_blocks
+
+    def next_range(self: PWN, blocks: int = 1) -> typing.Tuple[int, int]:
+        start = self.offset
+        end = start + blocks * BLOCK_SIZE - 1
+        if self._size is not None:
+            end = min(end, self._size - 1)
+
+        return start, end
+
+    def finish(self: PWN) -> None:
+        self._done = True
+
+    def feed(self: PWN, data: bytes, size: int = None) -> typing.List[FITSHeader]:
+        response_offset = self.offset
+        self._size = size if size is not None else self._size
+        self._buffer.extend(data)
+        headers: typing.List[FITSHeader] = []
+        last_end: int = None
+        while True:
+            header = self._scan()
+            if header is None:
+                break
+
+            headers.append(header)
+            last_end = header.offset + header.length
+            self._advance(find_next_header_offset(header))
+
+        if last_end is None or len(self._buffer) > 0:
+            self._needed_blocks = -(-len(data) // BLOCK_SIZE) + 1
+
+        else:
+            self._needed_blocks = -(-(last_end - response_offset) // BLOCK_SIZE)
+
+        if len(data) == 0 or (self._size is not None and self.offset >= self._size):
+            self._done = True
+
+        return headers
+
+    def _scan(self: PWN) -> FITSHeader:
+        while (self._scanned_blocks + 1) * BLOCK_SIZE <= len(self._buffer):
+            block_start = self._scanned_blocks * BLOCK_SIZE
+            self._scanned_blocks += 1
+            if find_end_card(self._buffer, block_start, block_start + BLOCK_SIZE):
+                length = self._scanned_blocks * BLOCK_SIZE
+                raw = bytes(self._buffer[:length])
+                if not raw.isascii():
+                    raise Exception("If this happens, it means the FITS file is invalid or the calculation is off")
+
+                return FITSHeader(self._buffer_offset, length, raw=raw, cards=parse_structural_cards(raw))
+
+        return None
+
+    def _advance(self: PWN, next_offset: int) -> None:
+        buffer_end = self.offset
+        if next_offset < buffer_end:
+            del self._buffer[:next_offset - self._buffer_offset]
+
+        else:
+            self._buffer.clear()
+
+        self._buffer_offset = next_offset
+        self._scanned_blocks = 0
+
+def record_request(instrumentation: Instrumentation, stats: CallStats, url: str, byte_range: typing.Tuple[int, int],
+        response: typing.Any, started: float, auth: TimedAuth) -> None:
+    elapsed: float = time.perf_counter() - started
+    signing_time: float = auth.take() if isinstance(auth, TimedAuth) else 0.0
+    span = RequestSpan(url, byte_range[0], byte_range[1], response.status_code, len(response.content),
+        time_to_first_byte(response), elapsed, signing_time, getattr(response, 'attempts', 1),
+        getattr(response, 'hedged', False), getattr(response, 'cached', False), getattr(response, 'hedge_sent', False))
+    instrumentation.record(stats, span)
+
+def iter_headers(url: str, auth: 'request.AuthBase', transport: Transport = None,
+        read_ahead: ReadAheadConfig = None, cache: HeaderCache = None,
+        instrumentation: Instrumentation = None) -> typing.Iterator[FITSHeader]:
+    '''
+    Lazily walks the file, yielding each header as soon as its END card has been read. Range requests are only issued
+      while the generator is being advanced, so breaking out of the loop or closing the generator stops the walk.
+      Without read_ahead, one block is requested at a time. With a ReadAheadConfig, the number of blocks per request
+      adapts to the header lengths, round trip time and throughput seen so far.
+
+    With a HeaderCache, a cached chain is revalidated with a conditional first request and returned on 304 Not
+      Modified. Otherwise the walk continues from that first response and the completed chain is cached.
+
+    With an Instrumentation, every request and the walk as a whole are timed and reported to it
+    '''
+    transport = transport or get_default_transport()
+    policy: AdaptiveReadAhead = AdaptiveReadAhead(read_ahead) if read_ahead else None
+    scanner = HeaderScanner()
+    cached: CachedHeaders = cache.get(url) if cache else None
+    conditional_headers: typing.Dict[str, str] = {}
+    if cached and cached.etag:
+        conditional_headers['If-None-Match'] = cached.etag
+
+    elif cached and cached.last_modified:
+        conditional_headers['If-Modified-Since'] = cached.last_modified
+
+    stats: CallStats = None
+    if instrumentation:
+        stats = instrumentation.begin(url)
+        auth = TimedAuth(auth) if auth else auth
 
-def load_headers(url: str, auth: 'request.AuthBase') -> typing.List[FITSHeader]:
-    offset: int = 0
-    headers: typing.List[FITSHeader] = []
-    read_blocks: typing.List[str] = []
-    header_data = []
-    while True:
-        response = requests.get(url, headers={
-            'Range': f'bytes={offset}-{offset + BLOCK_SIZE - 1}',
-        }, auth=auth)
-        if response.status_code in [206]:
+    chain: typing.List[FITSHeader] = []
+    etag: str = None
+    last_modified: str = None
+    try:
+        while not scanner.done:
+            blocks: int = policy.window if policy else 1
+            start, end = scanner.next_range(blocks)
+            started: float = time.perf_counter()
+            response = transport.read_range(url, start, end, auth=auth, headers=conditional_headers)
+            if stats:
+                record_request(instrumentation, stats, url, (start, end), response, started, auth)
+
+            if conditional_headers:
+                conditional_headers = {}
+                if response.status_code in [304]:
+                    if stats:
+                        stats.headers += len(cached.headers)
+
+                    yield from cached.headers
+                    return None
+
+            if response.status_code in [206]:
+                if start == 0 and response.content[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+                    raise NotImplementedError(f'url[{url}] is gzip compressed, use astro_cloud.fits.index.gzipped')
+
+                etag, last_modified = validators(response.headers)
+                size = parse_content_range_size(response.headers.get('Content-Range', None))
+                parse_started: float = time.perf_counter()
+                headers = scanner.feed(response.content, size)
+                if stats:
+                    stats.parse_time += time.perf_counter() - parse_started
+                    stats.headers += len(headers)
+
+                if policy:
+                    policy.observe(blocks, scanner.needed_blocks, time.perf_counter() - started, len(response.content))
+
+                if cache:
+                    chain.extend(headers)
+
+                yield from headers
+
+            elif response.status_code in [416]:
+                scanner.finish()
+
+            else:
+                raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+
+        if cache:
+            cache.put(url, etag, last_modified, chain)
+
+    finally:
+        if stats:
+            instrumentation.end(stats)
+
+def prefetch_headers(headers: typing.Iterator[FITSHeader], depth: int) -> typing.Iterator[FITSHeader]:
+    '''
+    Advances headers on a background thread, up to depth headers ahead of the consumer, so later HDUs are fetched while
+      earlier ones are being processed. Closing the returned generator stops the walk once the range request in flight
+      completes. Nothing here is specific to headers, crawl_headers lists pages ahead with it too
+    '''
+    items: queue.Queue = queue.Queue(maxsize=depth)
+    stop: threading.Event = threading.Event()
+
+    def put(item: typing.Tuple[str, typing.Any]) -> bool:
+        while not stop.is_set():
             try:
-                header_data.append(response.content.decode(ENCODING))
-            except UnicodeDecodeError:
-                raise Exception("If this happens, it means the FITS file is invalid or the calculation is off")
+                items.put(item, timeout=PREFETCH_POLL_INTERVAL)
+            except queue.Full:
+                continue
+
+            return True
+
+        return False
+
+    def produce() -> None:
+        try:
+            for header in headers:
+                if stop.is_set() or not put(('header', header)):
+                    break
 
             else:
-                if END_CARD in header_data[-1]:
-                    fits_header = fits.Header.fromstring(''.join(header_data))
-                    header = FITSHeader(offset, offset + BLOCK_SIZE, fits_header)
-                    headers.append(header)
-                    header_data = []
-                    offset = find_next_header_offset(header)
-
-                else:
-                    offset = offset + BLOCK_SIZE
-                    continue
-        elif response.status_code in [416]:
-            return headers
+                put(('done', None))
 
-        else:
-            raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+        except Exception as err:
+            put(('error', err))
+
+        finally:
+            if hasattr(headers, 'close'):
+                headers.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == 'header':
+                yield item
+
+            elif kind == 'error':
+                raise item
+
+            else:
+                break
+
+    finally:
+        stop.set()
+
+def load_headers(url: str, auth: 'request.AuthBase', transport: Transport = None,
+        read_ahead: ReadAheadConfig = None, cache: HeaderCache = None,
+        instrumentation: Instrumentation = None) -> typing.List[FITSHeader]:
+    return list(iter_headers(url, auth, transport, read_ahead, cache, instrumentation))
+
+async def aload_headers(url: str, auth: 'request.AuthBase', transport: AsyncTransport = None,
+        read_ahead: ReadAheadConfig = None, instrumentation: Instrumentation = None) -> typing.AsyncIterator[FITSHeader]:
+    '''
+    asyncio version of load_headers, yielding each header as soon as its END card has been read. Without a transport,
+      one is created for the walk and closed afterwards
+    '''
+    if transport is None:
+        async with AsyncTransport() as transport:
+            async for header in aload_headers(url, auth, transport, read_ahead, instrumentation):
+                yield header
+
+        return
+
+    policy: AdaptiveReadAhead = AdaptiveReadAhead(read_ahead) if read_ahead else None
+    scanner = HeaderScanner()
+    stats: CallStats = None
+    if instrumentation:
+        stats = instrumentation.begin(url)
+        auth = TimedAuth(auth) if auth else auth
+
+    try:
+        while not scanner.done:
+            blocks: int = policy.window if policy else 1
+            start, end = scanner.next_range(blocks)
+            started: float = time.perf_counter()
+            response = await transport.read_range(url, start, end, auth=auth)
+            if stats:
+                record_request(instrumentation, stats, url, (start, end), response, started, auth)
+
+            if response.status_code in [206]:
+                size = parse_content_range_size(response.headers.get('Content-Range', None))
+                parse_started: float = time.perf_counter()
+                headers = scanner.feed(response.content, size)
+                if stats:
+                    stats.parse_time += time.perf_counter() - parse_started
+                    stats.headers += len(headers)
+
+                if policy:
+                    policy.observe(blocks, scanner.needed_blocks, time.perf_counter() - started, len(response.content))
+
+                for header in headers:
+                    yield header
+
+            elif response.status_code in [416]:
+                scanner.finish()
+
+            else:
+                raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
 
+    finally:
+        if stats:
+            instrumentation.end(stats)
@@ -0,0 +1,147 @@
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import typing
+
+from astro_cloud.fits.datatypes import FITSHeader
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+DEFAULT_CACHE_LOCATION: str = os.path.expanduser('~/.cache/astro-cloud/headers.sqlite3')
+DEFAULT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+SQLITE_TIMEOUT: float = 30.0
+
+logger = logging.getLogger(__file__)
+
+SCHEMA: typing.List[str] = [
+    '''CREATE TABLE IF NOT EXISTS header_chains (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        chain TEXT NOT NULL,
+        cards BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        accessed REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS header_chains_accessed ON header_chains (accessed)',
+]
+
+class CachedHeaders(typing.NamedTuple):
+    url: str
+    etag: str
+    last_modified: str
+    headers: typing.List[FITSHeader]
+
+def validators(response_headers: typing.Mapping[str, str]) -> typing.Tuple[str, str]:
+    return response_headers.get('ETag', None), response_headers.get('Last-Modified', None)
+
+class HeaderCache:
+    '''
+    Persistent cache of parsed header chains, keyed by url and validated with the ETag or Last-Modified the server
+      returned when the chain was walked. Entries are evicted least recently used first once the cache grows past
+      max_bytes. SQLite takes care of locking, so processes on the same host can share one cache file
+    '''
+    _path: str
+    _max_bytes: int
+    def __init__(self: PWN, path: str = DEFAULT_CACHE_LOCATION, max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> None:
+        self._path = path
+        self._max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    @property
+    def path(self: PWN) -> str:
+        return self._path
+
+    @contextlib.contextmanager
+    def _connect(self: PWN) -> typing.Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self._path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+        try:
+            yield connection
+
+        finally:
+            connection.close()
+
+    def get(self: PWN, url: str) -> CachedHeaders:
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT etag, last_modified, chain, cards FROM header_chains WHERE url = ?', (url, )).fetchone()
+            if row is None:
+                return None
+
+            connection.execute('UPDATE header_chains SET accessed = ? WHERE url = ?', (time.time(), url))
+
+        etag, last_modified, chain, cards = row
+        headers: typing.List[FITSHeader] = []
+        for offset, length, start, end in json.loads(chain):
+            headers.append(FITSHeader(offset, length, raw=cards[start:end]))
+
+        return CachedHeaders(url, etag, last_modified, headers)
+
+    def put(self: PWN, url: str, etag: str, last_modified: str, headers: typing.List[FITSHeader]) -> None:
+        if etag is None and last_modified is None:
+            logger.info(f'Not caching url[{url}], the server returned neither ETag nor Last-Modified')
+            return None
+
+        chain: typing.List[typing.Tuple[int, int, int, int]] = []
+        cards: typing.List[bytes] = []
+        position: int = 0
+        for header in headers:
+            chain.append((header.offset, header.length, position, position + len(header.raw)))
+            cards.append(header.raw)
+            position += len(header.raw)
+
+        payload = b''.join(cards)
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute(
+                    'INSERT OR REPLACE INTO header_chains VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, etag, last_modified, json.dumps(chain), payload, len(payload), time.time()))
+                self._evict(connection)
+
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+            else:
+                connection.execute('COMMIT')
+
+    def _evict(self: PWN, connection: sqlite3.Connection) -> None:
+        total, = connection.execute('SELECT COALESCE(SUM(size), 0) FROM header_chains').fetchone()
+        if total <= self._max_bytes:
+            return None
+
+        rows = connection.execute('SELECT url, size FROM header_chains ORDER BY accessed ASC').fetchall()
+        evicted: typing.List[typing.Tuple[str]] = []
+        for url, size in rows[:-1]:
+            if total <= self._max_bytes:
+                break
+
+            evicted.append((url, ))
+            total -= size
+
+        connection.executemany('DELETE FROM header_chains WHERE url = ?', evicted)
+
+    def invalidate(self: PWN, url: str) -> None:
+        with self._connect() as connection:
+            connection.execute('DELETE FROM header_chains WHERE url = ?', (url, ))
+
+    def size(self: PWN) -> int:
+        with self._connect() as connection:
+            total, = connection.execute('SELECT COALESCE(SUM(size), 0) FROM header_chains').fetchone()
+            return total
+
+    def __contains__(self: PWN, url: str) -> bool:
+        with self._connect() as connection:
+            row = connection.execute('SELECT 1 FROM header_chains WHERE url = ?', (url, )).fetchone()
+            return row is not None
@@ -3,10 +3,36 @@ import typing
 from astro_cloud.auth.gcp import GCPAuth
 from astro_cloud.fits.datatypes import FITSHeader, PaymentSolution
 from astro_cloud.fits.index import base as index_base
+from astro_cloud.fits.index.cache import HeaderCache
+from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+from astro_cloud.metrics import Instrumentation
+from astro_cloud.transport import AsyncTransport, Transport
 
-def load_headers(url: str, payment_solution: PaymentSolution) -> typing.List[FITSHeader]:
+def load_auth(payment_solution: PaymentSolution) -> GCPAuth:
     if payment_solution is None:
-        return index_base.load_headers(url, auth=GCPAuth())
+        return GCPAuth()
 
     raise NotImplementedError(f'Unsupported Payment Solution[{payment_solution}]')
 
+def load_headers(url: str, payment_solution: PaymentSolution, transport: Transport = None,
+        read_ahead: ReadAheadConfig = None, cache: HeaderCache = None,
+        instrumentation: Instrumentation = None) -> typing.List[FITSHeader]:
+    return index_base.load_headers(url, auth=load_auth(payment_solution), transport=transport, read_ahead=read_ahead,
+        cache=cache, instrumentation=instrumentation)
+
+def iter_headers(url: str, payment_solution: PaymentSolution, transport: Transport = None,
+        read_ahead: ReadAheadConfig = None, prefetch: int = 0, cache: HeaderCache = None,
+        instrumentation: Instrumentation = None) -> typing.Iterator[FITSHeader]:
+    headers = index_base.iter_headers(url, auth=load_auth(payment_solution), transport=transport, read_ahead=read_ahead,
+        cache=cache, instrumentation=instrumentation)
+    if prefetch > 0:
+        return index_base.prefetch_headers(headers, prefetch)
+
+    return headers
+
+async def aload_headers(url: str, payment_solution: PaymentSolution, transport: AsyncTransport = None,
+        read_ahead: ReadAheadConfig = None, instrumentation: Instrumentation = None) -> typing.AsyncIterator[FITSHeader]:
+    auth = load_auth(payment_solution)
+    async for header in index_base.aload_headers(url, auth=auth, transport=transport, read_ahead=read_ahead,
+            instrumentation=instrumentation):
+        yield header
@@ -0,0 +1,288 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import typing
+
+from astro_cloud.fits.datatypes import FITSHeader
+from astro_cloud.fits.index.base import HeaderScanner, parse_content_range_size
+from astro_cloud.fits.index.cache import CachedHeaders, HeaderCache, validators
+from astro_cloud.transport import Transport, get_default_transport
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+DEFAULT_GZIP_INDEX_LOCATION: str = os.path.expanduser('~/.cache/astro-cloud/gzip-indexes')
+# Uncompressed bytes between seek points. Each point keeps a 32KiB window, so the index is about 3% of the
+#   uncompressed file, and a seek inflates at most this much to reach its target
+DEFAULT_SPACING: int = 1024 * 1024
+# Compressed bytes per range request once the index exists, and while the first pass streams the whole file
+DEFAULT_READ_SIZE: int = 64 * 1024
+STREAM_READ_SIZE: int = 4 * 1024 * 1024
+
+logger = logging.getLogger(__file__)
+
+def load_indexed_gzip() -> 'types.ModuleType':
+    try:
+        import indexed_gzip
+    except ImportError:
+        raise ImportError('Reading .fits.gz needs indexed_gzip, `pip install astro-cloud[gzip]`')
+
+    return indexed_gzip
+
+class RangeFile(io.RawIOBase):
+    '''
+    Read only file over HTTP range requests, for libraries that want something to seek and read. Each request asks for
+      at least read_size bytes and the response is kept, so small reads don't each cost a round trip
+    '''
+    _url: str
+    _auth: 'requests.auth.AuthBase'
+    _transport: Transport
+    _position: int
+    _size: int
+    _buffer: bytes
+    _buffer_offset: int
+    read_size: int
+    requests: int
+    bytes_received: int
+    etag: str
+    last_modified: str
+    def __init__(self: PWN, url: str, auth: 'requests.auth.AuthBase' = None, transport: Transport = None,
+            read_size: int = DEFAULT_READ_SIZE) -> None:
+        super().__init__()
+        self._url = url
+        self._auth = auth
+        self._transport = transport or get_default_transport()
+        self._position = 0
+        self._size = None
+        self._buffer = b''
+        self._buffer_offset = 0
+        self.read_size = read_size
+        self.requests = 0
+        self.bytes_received = 0
+        self.etag = None
+        self.last_modified = None
+
+    @property
+    def size(self: PWN) -> int:
+        if self._size is None:
+            self._fetch(0, self.read_size)
+
+        return self._size
+
+    def readable(self: PWN) -> bool:
+        return True
+
+    def seekable(self: PWN) -> bool:
+        return True
+
+    def tell(self: PWN) -> int:
+        return self._position
+
+    def seek(self: PWN, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+
+        else:
+            raise NotImplementedError(f'Unsupported whence[{whence}]')
+
+        return self._position
+
+    def readinto(self: PWN, target: bytearray) -> int:
+        if self._position >= self.size or len(target) == 0:
+            return 0
+
+        buffer_end = self._buffer_offset + len(self._buffer)
+        if not self._buffer_offset <= self._position < buffer_end:
+            self._fetch(self._position, max(len(target), self.read_size))
+            buffer_end = self._buffer_offset + len(self._buffer)
+
+        start = self._position - self._buffer_offset
+        length = min(len(target), buffer_end - self._position)
+        target[:length] = self._buffer[start:start + length]
+        self._position += length
+        return length
+
+    def _fetch(self: PWN, start: int, length: int) -> None:
+        end = start + length - 1
+        if self._size is not None:
+            end = min(end, self._size - 1)
+
+        response = self._transport.read_range(self._url, start, end, auth=self._auth)
+        if response.status_code not in [206]:
+            raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+
+        self.requests += 1
+        self.bytes_received += len(response.content)
+        self._size = parse_content_range_size(response.headers.get('Content-Range', None))
+        self.etag, self.last_modified = validators(response.headers)
+        self._buffer = response.content
+        self._buffer_offset = start
+
+class GzipIndexCache:
+    '''
+    Seek point indexes saved as files, one per url, next to the ETag, Last-Modified and size of the file they were
+      built from. An index is only used while the file still matches them
+    '''
+    _directory: str
+    def __init__(self: PWN, directory: str = DEFAULT_GZIP_INDEX_LOCATION) -> None:
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self: PWN) -> str:
+        return self._directory
+
+    def paths(self: PWN, url: str) -> typing.Tuple[str, str]:
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, f'{name}.gzidx'), os.path.join(self._directory, f'{name}.json')
+
+    def get(self: PWN, url: str, etag: str, last_modified: str, size: int) -> str:
+        '''
+        Path of the index built from this version of url, or None
+        '''
+        index_path, metadata_path = self.paths(url)
+        try:
+            with open(metadata_path, 'r') as stream:
+                metadata = json.load(stream)
+
+        except (OSError, ValueError):
+            return None
+
+        if metadata.get('size', None) != size or (metadata.get('etag', None), metadata.get('last_modified', None)) != \
+                (etag, last_modified) or not os.path.exists(index_path):
+            return None
+
+        return index_path
+
+    def put(self: PWN, url: str, gzip_file: 'indexed_gzip.IndexedGzipFile', etag: str, last_modified: str,
+            size: int) -> None:
+        if etag is None and last_modified is None:
+            logger.info(f'Not saving the index of url[{url}], the server returned neither ETag nor Last-Modified')
+            return None
+
+        index_path, metadata_path = self.paths(url)
+        gzip_file.export_index(f'{index_path}.tmp')
+        os.replace(f'{index_path}.tmp', index_path)
+        with open(f'{metadata_path}.tmp', 'w') as stream:
+            json.dump({'url': url, 'etag': etag, 'last_modified': last_modified, 'size': size}, stream)
+
+        os.replace(f'{metadata_path}.tmp', metadata_path)
+
+    def invalidate(self: PWN, url: str) -> None:
+        for path in self.paths(url):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __contains__(self: PWN, url: str) -> bool:
+        return all(os.path.exists(path) for path in self.paths(url))
+
+class GzipFile(typing.NamedTuple):
+    '''
+    An indexed view of the uncompressed stream, and the RangeFile it reads through. points is the number of seek
+      points the file was opened with, seeking past the last one adds more
+    '''
+    stream: 'indexed_gzip.IndexedGzipFile'
+    raw: RangeFile
+    points: int
+
+def count_seek_points(stream: 'indexed_gzip.IndexedGzipFile') -> int:
+    return sum(1 for _ in stream.seek_points())
+
+def open_gzip(url: str, auth: 'requests.auth.AuthBase' = None, transport: Transport = None,
+        index_cache: GzipIndexCache = None, spacing: int = DEFAULT_SPACING,
+        read_size: int = DEFAULT_READ_SIZE) -> GzipFile:
+    '''
+    Opens a gzip compressed file over HTTP for seeking and reading in the uncompressed stream. A saved index is
+      imported when index_cache has one for this version of the file. Seeking past the last seek point inflates
+      everything up to the target, adding seek points every spacing bytes, and save_index stores them
+    '''
+    indexed_gzip = load_indexed_gzip()
+    raw = RangeFile(url, auth, transport, read_size)
+    # The first request finds the size and validators
+    size = raw.size
+    index_path = index_cache.get(url, raw.etag, raw.last_modified, size) if index_cache else None
+    if index_path is None:
+        raw.read_size = max(read_size, STREAM_READ_SIZE)
+
+    stream = indexed_gzip.IndexedGzipFile(fileobj=raw, spacing=spacing, readbuf_size=read_size,
+        buffer_size=read_size, index_file=index_path)
+    return GzipFile(stream, raw, count_seek_points(stream) if index_path else 0)
+
+def save_index(url: str, gzip_file: GzipFile, index_cache: GzipIndexCache) -> None:
+    '''
+    Saves the seek points when the reads since opening added any. The index doesn't have to cover the whole file, a
+      later seek past its end carries on from the last point
+    '''
+    if count_seek_points(gzip_file.stream) > gzip_file.points:
+        index_cache.put(url, gzip_file.stream, gzip_file.raw.etag, gzip_file.raw.last_modified, gzip_file.raw.size)
+
+def seek_headers(gzip_file: GzipFile) -> typing.Iterator[FITSHeader]:
+    '''
+    Seeks from header to header. With an index each seek starts inflating at the closest seek point before it,
+      without one the seek inflates everything up to it, adding seek points along the way
+    '''
+    scanner = HeaderScanner()
+    while not scanner.done:
+        start, end = scanner.next_range()
+        gzip_file.stream.seek(start)
+        yield from scanner.feed(gzip_file.stream.read(end - start + 1))
+
+def iter_headers(url: str, auth: 'requests.auth.AuthBase' = None, transport: Transport = None,
+        index_cache: GzipIndexCache = None, cache: HeaderCache = None, spacing: int = DEFAULT_SPACING,
+        read_size: int = DEFAULT_READ_SIZE) -> typing.Iterator[FITSHeader]:
+    '''
+    Walks the headers of a .fits.gz, offsets are in the uncompressed stream. Without a saved index the file is
+      streamed once, seek points being added on the way, and the index is saved to index_cache when the walk
+      completes. With one, only the compressed bytes between each header and the seek point before it are fetched.
+      A HeaderCache holding the chain of this version of the file answers without any seeking at all
+    '''
+    gzip_file = open_gzip(url, auth, transport, index_cache, spacing, read_size)
+    try:
+        cached: CachedHeaders = cache.get(url) if cache else None
+        if cached and (cached.etag, cached.last_modified) == (gzip_file.raw.etag, gzip_file.raw.last_modified):
+            yield from cached.headers
+            return None
+
+        chain: typing.List[FITSHeader] = []
+        for header in seek_headers(gzip_file):
+            chain.append(header)
+            yield header
+
+        if index_cache:
+            save_index(url, gzip_file, index_cache)
+
+        if cache:
+            cache.put(url, gzip_file.raw.etag, gzip_file.raw.last_modified, chain)
+
+    finally:
+        gzip_file.stream.close()
+
+def load_headers(url: str, auth: 'requests.auth.AuthBase' = None, transport: Transport = None,
+        index_cache: GzipIndexCache = None, cache: HeaderCache = None, spacing: int = DEFAULT_SPACING,
+        read_size: int = DEFAULT_READ_SIZE) -> typing.List[FITSHeader]:
+    return list(iter_headers(url, auth, transport, index_cache, cache, spacing, read_size))
+
+def read_range(url: str, start: int, stop: int, auth: 'requests.auth.AuthBase' = None, transport: Transport = None,
+        index_cache: GzipIndexCache = None, spacing: int = DEFAULT_SPACING, read_size: int = DEFAULT_READ_SIZE) -> bytes:
+    '''
+    Reads bytes start to stop, exclusive, of the uncompressed stream. With a saved index this costs the compressed
+      bytes from the seek point before start to stop
+    '''
+    gzip_file = open_gzip(url, auth, transport, index_cache, spacing, read_size)
+    try:
+        gzip_file.stream.seek(start)
+        content = gzip_file.stream.read(stop - start)
+        if index_cache:
+            save_index(url, gzip_file, index_cache)
+
+        return content
+
+    finally:
+        gzip_file.stream.close()
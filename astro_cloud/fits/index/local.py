@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import mmap
+import os
+import time
+import typing
+
+from urllib.parse import unquote, urlparse
+
+from astro_cloud.fits.cards import parse_structural_cards
+from astro_cloud.fits.constants import BLOCK_SIZE
+from astro_cloud.fits.datatypes import FITSHeader, PaymentSolution
+from astro_cloud.fits.index.base import find_end_card
+from astro_cloud.fits.index.cache import HeaderCache
+from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+from astro_cloud.metrics import CallStats, Instrumentation
+from astro_cloud.fits.utils import find_next_header_offset
+from astro_cloud.transport import AsyncTransport, Transport
+
+def url_to_path(url: str) -> str:
+    '''
+    Accepts file:// urls as well as plain paths
+    '''
+    url_parts = urlparse(url)
+    if url_parts.scheme == 'file':
+        return unquote(url_parts.path)
+
+    return url
+
+def walk_headers(buffer: typing.Union[bytes, 'mmap.mmap']) -> typing.Iterator[FITSHeader]:
+    '''
+    Walks headers in a buffer holding a whole FITS file. END cards are searched for and structural cards parsed in
+      place through a memoryview of the buffer. Each header is copied out once, since the buffer may be closed before
+      the header's astropy Header is built
+    '''
+    view = memoryview(buffer)
+    size: int = len(buffer)
+    offset: int = 0
+    try:
+        while offset + BLOCK_SIZE <= size:
+            block_start: int = offset
+            while block_start + BLOCK_SIZE <= size and not find_end_card(buffer, block_start, block_start + BLOCK_SIZE):
+                block_start += BLOCK_SIZE
+
+            if block_start + BLOCK_SIZE > size:
+                break
+
+            length: int = block_start + BLOCK_SIZE - offset
+            cards = parse_structural_cards(view, offset, offset + length)
+            raw = bytes(view[offset:offset + length])
+            if not raw.isascii():
+                raise Exception("If this happens, it means the FITS file is invalid or the calculation is off")
+
+            header = FITSHeader(offset, length, raw=raw, cards=cards)
+            yield header
+            offset = find_next_header_offset(header)
+
+    finally:
+        view.release()
+
+def iter_headers(url: str, payment_solution: PaymentSolution = None, transport: Transport = None,
+        read_ahead: ReadAheadConfig = None, prefetch: int = 0, cache: HeaderCache = None,
+        instrumentation: Instrumentation = None) -> typing.Iterator[FITSHeader]:
+    '''
+    Same records as the cloud index modules, read from a memory-mapped local file. transport, read_ahead, prefetch and
+      cache are accepted so every CloudService shares one signature, and are ignored. An Instrumentation sees no
+      requests, only the headers and the time spent parsing them
+    '''
+    if payment_solution is not None:
+        raise NotImplementedError(f'Unsupported Payment Solution[{payment_solution}]')
+
+    stats: CallStats = instrumentation.begin(url) if instrumentation else None
+    try:
+        with open(url_to_path(url), 'rb') as stream:
+            if os.fstat(stream.fileno()).st_size == 0:
+                return None
+
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if stats is None:
+                    yield from walk_headers(buffer)
+                    return None
+
+                headers = walk_headers(buffer)
+                try:
+                    while True:
+                        parse_started: float = time.perf_counter()
+                        header = next(headers, None)
+                        stats.parse_time += time.perf_counter() - parse_started
+                        if header is None:
+                            break
+
+                        stats.headers += 1
+                        yield header
+
+                finally:
+                    # Releases the memoryview walk_headers holds, the mmap can't be closed while it's exported
+                    headers.close()
+
+    finally:
+        if stats:
+            instrumentation.end(stats)
+
+def load_headers(url: str, payment_solution: PaymentSolution = None, transport: Transport = None,
+        read_ahead: ReadAheadConfig = None, cache: HeaderCache = None,
+        instrumentation: Instrumentation = None) -> typing.List[FITSHeader]:
+    return list(iter_headers(url, payment_solution, instrumentation=instrumentation))
+
+async def aload_headers(url: str, payment_solution: PaymentSolution = None, transport: AsyncTransport = None,
+        read_ahead: ReadAheadConfig = None, instrumentation: Instrumentation = None) -> typing.AsyncIterator[FITSHeader]:
+    '''
+    The file is mapped and walked on the loop's default executor, so page faults on a cold file don't block the loop
+    '''
+    loop = asyncio.get_running_loop()
+    headers = await loop.run_in_executor(None, functools.partial(load_headers, url, payment_solution,
+        instrumentation=instrumentation))
+    for header in headers:
+        yield header
@@ -0,0 +1,84 @@
+import math
+import typing
+
+from astro_cloud.fits.constants import BLOCK_SIZE
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+class ReadAheadConfig(typing.NamedTuple):
+    initial_blocks: int = 4
+    min_blocks: int = 1
+    max_blocks: int = 128
+    smoothing: float = 0.3  # weight given to the newest sample in the moving averages
+
+class AdaptiveReadAhead:
+    '''
+    Decides how many blocks to request at a time while scanning for END cards. The window grows when a header needed
+      more blocks than were requested and shrinks back toward the typical header length when it overshoots. Blocks that
+      can be transferred within one round trip are nearly free, so the bandwidth-delay product measured from the
+      responses decides how much overshoot is tolerated
+    '''
+    _config: ReadAheadConfig
+    _window: int
+    _needed_blocks: float
+    _round_trip: float
+    _throughput: float
+    def __init__(self: PWN, config: ReadAheadConfig = None) -> None:
+        self._config = config or ReadAheadConfig()
+        self._window = self._clamp(self._config.initial_blocks)
+        self._needed_blocks = None
+        self._round_trip = None
+        self._throughput = None
+
+    @property
+    def window(self: PWN) -> int:
+        return self._window
+
+    @property
+    def round_trip(self: PWN) -> float:
+        return self._round_trip
+
+    @property
+    def throughput(self: PWN) -> float:
+        return self._throughput
+
+    def _clamp(self: PWN, blocks: int) -> int:
+        return max(self._config.min_blocks, min(self._config.max_blocks, int(blocks)))
+
+    def _average(self: PWN, average: float, sample: float) -> float:
+        if average is None:
+            return sample
+
+        return (1 - self._config.smoothing) * average + self._config.smoothing * sample
+
+    def free_blocks(self: PWN) -> int:
+        '''
+        Number of blocks that can be transferred in the time of one round trip. Until throughput has been measured,
+          the current window is assumed to be free
+        '''
+        if self._round_trip is None or self._throughput is None:
+            return self._window
+
+        return int(self._round_trip * self._throughput / BLOCK_SIZE)
+
+    def observe(self: PWN, requested_blocks: int, needed_blocks: int, elapsed: float, length: int) -> None:
+        '''
+        requested_blocks is the window that was requested, needed_blocks is how many of those blocks were used up to the
+          last END card found. needed_blocks > requested_blocks means the header continues past the response. elapsed
+          and length describe the response, and feed the round trip and throughput estimates
+        '''
+        if length <= BLOCK_SIZE or self._round_trip is None or elapsed < self._round_trip:
+            # Small responses are dominated by latency
+            self._round_trip = self._average(self._round_trip, elapsed)
+
+        transfer = elapsed - self._round_trip
+        if length > BLOCK_SIZE and transfer > 0:
+            self._throughput = self._average(self._throughput, length / transfer)
+
+        self._needed_blocks = self._average(self._needed_blocks, min(needed_blocks, requested_blocks))
+        if needed_blocks > requested_blocks:
+            self._window = self._clamp(max(needed_blocks, requested_blocks * 2))
+
+        else:
+            expected = math.ceil(self._needed_blocks)
+            self._window = self._clamp(max(expected, min(self._window, self.free_blocks())))
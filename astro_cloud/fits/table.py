@@ -0,0 +1,324 @@
+import re
+import typing
+
+import numpy as np
+
+from astro_cloud.fits.cards import parse_cards
+from astro_cloud.fits.cutout import DEFAULT_MAX_GAP, ByteRange, read_byte_ranges, scale_image_data
+from astro_cloud.fits.datatypes import FITSHeader
+from astro_cloud.fits.utils import get_data_offset
+from astro_cloud.transport import Transport
+
+TFORM_PATTERN = re.compile(r'^\s*(\d*)\s*([LXBIJKAEDCMPQ])(.*)$')
+TDIM_PATTERN = re.compile(r'^\s*\((.*)\)\s*$')
+# Big-endian type of one element of each TFORM data type
+TFORM_DTYPES: typing.Dict[str, str] = {
+    'L': 'u1',
+    'X': 'u1',
+    'B': 'u1',
+    'I': '>i2',
+    'J': '>i4',
+    'K': '>i8',
+    'A': 'S1',
+    'E': '>f4',
+    'D': '>f8',
+    'C': '>c8',
+    'M': '>c16',
+    'P': '>i4',
+    'Q': '>i8',
+}
+# Variable length array descriptors, (element count, heap offset), whatever the repeat count
+DESCRIPTOR_CODES: str = 'PQ'
+
+class TableColumn(typing.NamedTuple):
+    '''
+    One field of a BINTABLE row. offset is from the start of the row, shape is the numpy ordered TDIMn, or
+      (repeat, ) when there isn't one
+    '''
+    index: int  # n in TTYPEn, counting from 1
+    name: str
+    format: str
+    code: str
+    repeat: int
+    offset: int
+    width: int
+    shape: typing.Tuple[int, ...]
+    scale: float
+    zero: float
+
+    @property
+    def field_dtype(self: 'TableColumn') -> np.dtype:
+        '''
+        How the column is laid out inside a row, the way np.frombuffer needs it
+        '''
+        if self.code == 'A':
+            return np.dtype(f'S{self.repeat}')
+
+        elif self.code == 'X':
+            return np.dtype((np.uint8, (self.width, )))
+
+        elif self.code in DESCRIPTOR_CODES:
+            return np.dtype((TFORM_DTYPES[self.code], (2, )))
+
+        elif self.repeat == 1:
+            return np.dtype(TFORM_DTYPES[self.code])
+
+        return np.dtype((TFORM_DTYPES[self.code], (self.repeat, )))
+
+class TablePlan(typing.NamedTuple):
+    '''
+    Byte ranges relative to the start of the data unit, and the layout of the bytes they return for each row. When the
+      rows are read as one block every row is fetched whole and row_step picks the selected ones out of it
+    '''
+    ranges: typing.List[ByteRange]
+    row_dtype: np.dtype
+    rows: int
+    row_step: int
+
+def parse_tform(tform: str) -> typing.Tuple[int, str]:
+    '''
+    TFORMn = 'rTa', returns (r, T). The repeat count defaults to 1
+    '''
+    match = TFORM_PATTERN.match(tform)
+    if match is None:
+        raise NotImplementedError(f'TFORM[{tform}] not implemented')
+
+    return int(match.group(1) or 1), match.group(2)
+
+def parse_tdim(tdim: str) -> typing.Tuple[int, ...]:
+    '''
+    TDIMn = '(a,b,c)' varies a fastest, so it's the last axis of the numpy shape
+    '''
+    match = TDIM_PATTERN.match(tdim)
+    if match is None:
+        raise NotImplementedError(f'TDIM[{tdim}] not implemented')
+
+    return tuple(int(axis) for axis in reversed(match.group(1).split(',')))
+
+def descriptor_dtype(column: TableColumn) -> np.dtype:
+    '''
+    Type of the elements a P or Q column points at in the heap, TFORMn = 'rPt(max)'
+    '''
+    match = TFORM_PATTERN.match(column.format)
+    code = match.group(3).strip()[:1]
+    if column.code not in DESCRIPTOR_CODES or code not in TFORM_DTYPES or code in 'AXPQ':
+        raise NotImplementedError(f'Heap elements of TFORM[{column.format}] not implemented')
+
+    return np.dtype(TFORM_DTYPES[code])
+
+def column_width(code: str, repeat: int) -> int:
+    if code == 'X':
+        return -(-repeat // 8)
+
+    elif code in DESCRIPTOR_CODES:
+        return 2 * np.dtype(TFORM_DTYPES[code]).itemsize if repeat else 0
+
+    return repeat * np.dtype(TFORM_DTYPES[code]).itemsize
+
+def get_table_columns(header: FITSHeader) -> typing.List[TableColumn]:
+    '''
+    Lays out the columns of a BINTABLE from its TFIELDS, TTYPEn, TFORMn, TDIMn, TSCALn and TZEROn cards. The cards are
+      read from the raw header, an astropy Header isn't built
+    '''
+    if header.cards.get('XTENSION', None) not in ['BINTABLE']:
+        raise NotImplementedError(f'Tables of XTENSION[{header.cards.get("XTENSION", None)}] not implemented')
+
+    fields: int = parse_cards(header.raw, ['TFIELDS']).get('TFIELDS', 0)
+    keywords: typing.List[str] = []
+    for idx in range(1, fields + 1):
+        keywords.extend([f'TTYPE{idx}', f'TFORM{idx}', f'TDIM{idx}', f'TSCAL{idx}', f'TZERO{idx}'])
+
+    cards = parse_cards(header.raw, frozenset(keywords))
+    columns: typing.List[TableColumn] = []
+    offset: int = 0
+    for idx in range(1, fields + 1):
+        tform = cards[f'TFORM{idx}']
+        repeat, code = parse_tform(tform)
+        width = column_width(code, repeat)
+        shape: typing.Tuple[int, ...] = (repeat, )
+        if f'TDIM{idx}' in cards and code not in 'AXPQ':
+            shape = parse_tdim(cards[f'TDIM{idx}'])
+
+        name = str(cards.get(f'TTYPE{idx}', f'COL{idx}'))
+        columns.append(TableColumn(idx, name, tform, code, repeat, offset, width, shape,
+            cards.get(f'TSCAL{idx}', 1), cards.get(f'TZERO{idx}', 0)))
+        offset += width
+
+    if offset != header.cards['NAXIS1']:
+        raise Exception(f'Columns add up to {offset} bytes, NAXIS1 is {header.cards["NAXIS1"]}')
+
+    return columns
+
+def select_columns(columns: typing.List[TableColumn],
+        names: typing.Iterable[typing.Union[str, int]] = None) -> typing.List[TableColumn]:
+    '''
+    Looks columns up by TTYPEn, ignoring case like astropy, or by n
+    '''
+    if names is None:
+        return list(columns)
+
+    by_name: typing.Dict[str, TableColumn] = {}
+    for column in reversed(columns):
+        by_name[column.name.upper()] = column
+
+    selected: typing.List[TableColumn] = []
+    for name in names:
+        if isinstance(name, int):
+            if not 1 <= name <= len(columns):
+                raise KeyError(f'Column[{name}] not found, the table has {len(columns)} columns')
+
+            selected.append(columns[name - 1])
+
+        elif name.upper() in by_name:
+            selected.append(by_name[name.upper()])
+
+        else:
+            raise KeyError(f'Column[{name}] not found')
+
+    return selected
+
+def merge_column_runs(columns: typing.List[TableColumn], max_gap: int) -> typing.List[ByteRange]:
+    '''
+    Byte ranges within a row covering columns, neighbours closer than max_gap merged
+    '''
+    runs: typing.List[ByteRange] = []
+    for column in sorted(columns, key=lambda column: column.offset):
+        if column.width == 0:
+            continue
+
+        elif runs and column.offset - runs[-1].stop <= max_gap:
+            runs[-1] = ByteRange(runs[-1].start, max(runs[-1].stop, column.offset + column.width))
+
+        else:
+            runs.append(ByteRange(column.offset, column.offset + column.width))
+
+    return runs
+
+def plan_table_read(columns: typing.List[TableColumn], row_width: int, rows: range,
+        max_gap: int = DEFAULT_MAX_GAP) -> TablePlan:
+    '''
+    Each selected row needs the runs of bytes holding the selected columns. When the gaps between runs, including the
+      one from the last run of a row to the first of the next selected row, are all under max_gap, the rows are read
+      as one block. Otherwise each run of each row is its own range, and only the selected bytes are downloaded
+    '''
+    runs = merge_column_runs(columns, max_gap)
+    if not runs or len(rows) == 0:
+        return TablePlan([], None, len(rows), 1)
+
+    fetched = list({column.index: column for column in columns if column.width}.values())
+    def record_dtype(starts: typing.Dict[int, int], itemsize: int) -> np.dtype:
+        return np.dtype({
+            'names': [f'c{column.index}' for column in fetched],
+            'formats': [column.field_dtype for column in fetched],
+            'offsets': [starts[column.index] for column in fetched],
+            'itemsize': itemsize,
+        })
+
+    wrap_gap = abs(rows.step) * row_width - runs[-1].stop + runs[0].start
+    if len(runs) == 1 and (len(rows) == 1 or wrap_gap <= max_gap):
+        first, last = rows[0], rows[-1]
+        if rows.step < 0:
+            first, last = last, first
+
+        start = first * row_width + runs[0].start
+        stop = last * row_width + runs[-1].stop
+        row_dtype = record_dtype({column.index: column.offset - runs[0].start for column in fetched}, row_width)
+        return TablePlan([ByteRange(start, stop)], row_dtype, len(rows), rows.step)
+
+    # Pack the runs of a row together, and find where each column lands in the packed row
+    packed_starts: typing.Dict[int, int] = {}
+    run_positions: typing.List[int] = []
+    position: int = 0
+    for run in runs:
+        run_positions.append(position)
+        position += run.stop - run.start
+
+    for column in fetched:
+        for run, run_position in zip(runs, run_positions):
+            if run.start <= column.offset < run.stop:
+                packed_starts[column.index] = run_position + column.offset - run.start
+                break
+
+    ranges = [ByteRange(row * row_width + run.start, row * row_width + run.stop) for row in rows for run in runs]
+    return TablePlan(ranges, record_dtype(packed_starts, position), len(rows), 1)
+
+def normalize_rows(total: int, rows: typing.Union[slice, range, int] = None) -> range:
+    if rows is None:
+        return range(total)
+
+    elif isinstance(rows, range):
+        rows = slice(rows.start, rows.stop, rows.step)
+
+    elif not isinstance(rows, slice):
+        index = int(rows)
+        if not -total <= index < total:
+            raise IndexError(f'Row[{index}] out of bounds for a table of {total} rows')
+
+        return range(index % total, index % total + 1)
+
+    return range(*rows.indices(total))
+
+def decode_column(column: TableColumn, data: np.ndarray, scale: bool) -> np.ndarray:
+    '''
+    Turns the big-endian field of a column into a native array, one row per entry
+    '''
+    rows = data.shape[0]
+    if column.code in DESCRIPTOR_CODES:
+        return data.astype(data.dtype.base.newbyteorder('=')).astype(np.int64)
+
+    elif column.width == 0:
+        return np.empty((rows, 0), dtype=np.dtype(TFORM_DTYPES[column.code]).newbyteorder('='))
+
+    elif column.code == 'A':
+        return np.char.rstrip(data.astype(f'U{column.repeat}'))
+
+    elif column.code == 'X':
+        return np.unpackbits(data, axis=-1)[:, :column.repeat].astype(np.bool_)
+
+    elif column.code == 'L':
+        values = data == ord('T')
+
+    else:
+        values = data.astype(data.dtype.base.newbyteorder('='))
+        if scale and column.code not in 'CM':
+            values = scale_image_data(values, column.scale, column.zero)
+
+    if column.shape != (1, ):
+        values = values.reshape((rows, ) + column.shape)
+
+    return values
+
+def load_table(url: str, header: FITSHeader, columns: typing.Iterable[typing.Union[str, int]] = None,
+        rows: typing.Union[slice, range, int] = None, auth: 'requests.auth.AuthBase' = None,
+        transport: Transport = None, max_gap: int = DEFAULT_MAX_GAP,
+        scale: bool = True) -> typing.Dict[str, np.ndarray]:
+    '''
+    Reads columns of rows from the BINTABLE following header, returning an array per column keyed by TTYPEn, in the
+      order asked for. Only the bytes of the selected columns are downloaded, apart from gaps smaller than max_gap,
+      so one column of a wide light curve table costs a fraction of the table. Arrays come back in native byte order,
+      scaled by TSCALn and TZEROn, with L columns as bool, X columns as bool bits and A columns as str. Variable length
+      array columns, P and Q, come back as (element count, heap offset) descriptors, see descriptor_dtype
+    '''
+    table_columns = get_table_columns(header)
+    selected = select_columns(table_columns, columns)
+    row_width: int = header.cards['NAXIS1']
+    selected_rows = normalize_rows(header.cards['NAXIS2'], rows)
+    plan = plan_table_read(selected, row_width, selected_rows, max_gap)
+    data_offset = get_data_offset(header)
+    ranges = [ByteRange(data_offset + byte_range.start, data_offset + byte_range.stop) for byte_range in plan.ranges]
+    content = read_byte_ranges(url, ranges, max_gap, auth, transport) if ranges else bytearray()
+    records: np.ndarray = None
+    if ranges:
+        # A block read stops at the end of the last selected column, so its final row comes up short
+        content.extend(bytes(-len(content) % plan.row_dtype.itemsize))
+        records = np.frombuffer(content, dtype=plan.row_dtype)[::abs(plan.row_step)]
+        if plan.row_step < 0:
+            records = records[::-1]
+
+    output: typing.Dict[str, np.ndarray] = {}
+    for column in selected:
+        data = records[f'c{column.index}'] if column.width and records is not None else \
+            np.zeros((plan.rows, ) + column.field_dtype.shape, dtype=column.field_dtype.base)
+        output[column.name] = decode_column(column, data, scale)
+
+    return output
@@ -1,13 +1,31 @@
-import numpy as np
+import functools
+import operator
+import typing
 
 from astro_cloud.fits.constants import BLOCK_SIZE
 from astro_cloud.fits.datatypes import FITSHeader
 
-def as_np_dtype(bitpix: int) -> np.dtype:
+BITPIX_ITEMSIZE: typing.Dict[int, int] = {8: 1, 16: 2, 32: 4, 64: 8, -32: 4, -64: 8}
+
+def bitpix_itemsize(bitpix: int) -> int:
+    '''
+    Bytes per value for BITPIX, without importing numpy just to walk the headers
+    '''
+    try:
+        return BITPIX_ITEMSIZE[bitpix]
+    except KeyError:
+        raise NotImplementedError(f'BITPIX[{bitpix}] not implemented')
+
+def product(values: typing.Iterable[int]) -> int:
+    return functools.reduce(operator.mul, values, 1)
+
+def as_np_dtype(bitpix: int) -> 'np.dtype':
     '''
     Image XTENSION has a BITPIX header that represents a datatype. This function takes that header and converts
         it to np.dtype
     '''
+    import numpy as np
+
     if bitpix == 8:
         return np.dtype(np.uint8)
 
@@ -17,6 +35,9 @@ def as_np_dtype(bitpix: int) -> np.dtype:
     elif bitpix == 32:
         return np.dtype(np.uint32)
 
+    elif bitpix == 64:
+        return np.dtype(np.uint64)
+
     elif bitpix == -32:
         return np.dtype(np.float32)
 
@@ -25,31 +46,81 @@ def as_np_dtype(bitpix: int) -> np.dtype:
 
     raise NotImplementedError(f'BITPIX[{bitpix}] not implemented')
 
+def as_fits_dtype(bitpix: int) -> 'np.dtype':
+    '''
+    Data in a FITS file is big-endian, and integers are signed apart from BITPIX 8. Unsigned integers are stored with
+        an offset in BZERO
+    '''
+    import numpy as np
+
+    if bitpix == 8:
+        return np.dtype('>u1')
+
+    elif bitpix == 16:
+        return np.dtype('>i2')
+
+    elif bitpix == 32:
+        return np.dtype('>i4')
+
+    elif bitpix == 64:
+        return np.dtype('>i8')
+
+    elif bitpix == -32:
+        return np.dtype('>f4')
+
+    elif bitpix == -64:
+        return np.dtype('>f8')
+
+    raise NotImplementedError(f'BITPIX[{bitpix}] not implemented')
+
+def get_data_offset(header: FITSHeader) -> int:
+    return header.offset + header.length
+
+def get_image_shape(header: FITSHeader) -> typing.Tuple[int, ...]:
+    '''
+    NAXIS1 varies fastest, so it's the last axis of the equivalent numpy shape
+    '''
+    return tuple(header.cards[f'NAXIS{idx}'] for idx in range(header.cards['NAXIS'], 0, -1))
+
+def pad_to_block(length: int) -> int:
+    '''
+    Header and Data Units are padded with fill to a multiple of BLOCK_SIZE
+    '''
+    return -(-length // BLOCK_SIZE) * BLOCK_SIZE
+
 def find_next_header_offset(header: FITSHeader) -> int:
     '''
     Each FITS XTENSION has enough information to predict the next location of the next XTENSION header. Here we'll
         take in the offset and length and return a new offset which includes the data length difference
     '''
-    if header.fits.get('SIMPLE', False) is True:
+    if header.cards.get('SIMPLE', False) is True:
         # Primary Header
-        return header.offset + header.length
+        if header.cards.get('NAXIS', 0) == 0:
+            return header.offset + header.length
+
+        B: int = bitpix_itemsize(header.cards['BITPIX'])
+        N: typing.List[int] = [header.cards[f'NAXIS{idx}'] for idx in range(1, header.cards['NAXIS'] + 1)]
+        S: int = B * product(N)
+        return pad_to_block(S) + header.offset + header.length
 
-    elif header.fits.get('XTENSION', None) in ['IMAGE']:
+    elif header.cards.get('XTENSION', None) in ['IMAGE']:
         # https://ui.adsabs.harvard.edu/abs/1994A%26AS..105...53P/abstract
         # http://articles.adsabs.harvard.edu/pdf/1994A%26AS..105...53P
-        B: int = as_np_dtype(header.fits['BITPIX']).itemsize
-        G: int = header.fits['GCOUNT']
-        P: int = header.fits['PCOUNT']
-        N: typing.List[int] = [header.fits[f'NAXIS{idx}'] for idx in range(1, header.fits['NAXIS'] + 1)]
-        S: int = B * G * (P + np.prod(N))
-        return int(S / BLOCK_SIZE) * BLOCK_SIZE + header.offset + header.length
-
-    elif header.fits.get('XTENSION', None) in ['BINTABLE']:
+        B: int = bitpix_itemsize(header.cards['BITPIX'])
+        G: int = header.cards['GCOUNT']
+        P: int = header.cards['PCOUNT']
+        N: typing.List[int] = [header.cards[f'NAXIS{idx}'] for idx in range(1, header.cards['NAXIS'] + 1)]
+        S: int = B * G * (P + product(N)) if N else 0
+        return pad_to_block(S) + header.offset + header.length
+
+    elif header.cards.get('XTENSION', None) in ['BINTABLE']:
         # NAXIS1 = number of bytes per row
         # NAXIS2 = number of rows in the table
-        return header.fits['NAXIS1'] * header.fits['NAXIS2'] + header.offset + header.length
+        # PCOUNT = number of bytes in the heap following the table
+        S: int = header.cards['NAXIS1'] * header.cards['NAXIS2'] + header.cards.get('PCOUNT', 0)
+        return pad_to_block(S) + header.offset + header.length
 
-    elif header.fits.get('XTENSION', None) in ['TABLE']:
+    elif header.cards.get('XTENSION', None) in ['TABLE']:
         raise NotImplementedError('TABLE')
 
     else:
@@ -57,4 +128,3 @@ def find_next_header_offset(header: FITSHeader) -> int:
         pass
 
     raise NotImplementedError
-
@@ -0,0 +1,113 @@
+import logging
+import typing
+
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+from astro_cloud.auth.aws import AWSAuth
+from astro_cloud.auth.digital_ocean import DigitalOceanAuth
+from astro_cloud.fits.datatypes import CloudService, PaymentSolution
+from astro_cloud.transport import Transport, get_default_transport
+
+logger = logging.getLogger(__file__)
+
+S3_NAMESPACE: str = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+LIST_MAX_KEYS: int = 1000  # the most S3 returns in one page
+QUERY_SAFE_CHARS: str = '-_.~'
+
+class ObjectEntry(typing.NamedTuple):
+    key: str
+    size: int
+    etag: str
+    last_modified: str
+    url: str
+
+class ListPage(typing.NamedTuple):
+    entries: typing.List[ObjectEntry]
+    continuation_token: str  # None on the last page
+
+# Spaces listings are signed with the same keys and region as the header loads of the bucket
+AUTH_CLASSES: typing.Dict[CloudService, typing.Type[AWSAuth]] = {
+    CloudService.S3: AWSAuth,
+    CloudService.Spaces: DigitalOceanAuth,
+}
+
+def load_auth(payment_solution: PaymentSolution, service: CloudService = CloudService.S3) -> AWSAuth:
+    auth_class = AUTH_CLASSES.get(service, None)
+    if auth_class is None:
+        raise NotImplementedError(f'Listing Cloud Service[{service}] not implemented')
+
+    if payment_solution is None:
+        return auth_class()
+
+    elif payment_solution is PaymentSolution.AWSRequestPayer:
+        return auth_class(request_payer=True)
+
+    raise NotImplementedError(f'Unsupported Payment Solution[{payment_solution}]')
+
+def build_list_url(bucket_url: str, prefix: str = None, continuation_token: str = None, start_after: str = None,
+        max_keys: int = LIST_MAX_KEYS) -> str:
+    '''
+    Builds the ListObjectsV2 url with every parameter encoded the way SigV4 canonicalises it, so the url that is sent
+      is the url that was signed
+    '''
+    parameters: typing.List[typing.Tuple[str, str]] = [('list-type', '2'), ('max-keys', str(max_keys))]
+    if prefix:
+        parameters.append(('prefix', prefix))
+
+    if continuation_token:
+        parameters.append(('continuation-token', continuation_token))
+
+    elif start_after:
+        parameters.append(('start-after', start_after))
+
+    query = '&'.join(f'{key}={quote(value, safe=QUERY_SAFE_CHARS)}' for key, value in parameters)
+    return f'{bucket_url.rstrip("/")}?{query}'
+
+def parse_list_page(bucket_url: str, content: bytes) -> ListPage:
+    '''
+    Parses a ListBucketResult. Object urls are path-style, bucket_url/key
+    '''
+    root = ElementTree.fromstring(content)
+    entries: typing.List[ObjectEntry] = []
+    for element in root.iter(f'{S3_NAMESPACE}Contents'):
+        key = element.findtext(f'{S3_NAMESPACE}Key')
+        entries.append(ObjectEntry(
+            key,
+            int(element.findtext(f'{S3_NAMESPACE}Size', '0')),
+            element.findtext(f'{S3_NAMESPACE}ETag', None),
+            element.findtext(f'{S3_NAMESPACE}LastModified', None),
+            f'{bucket_url.rstrip("/")}/{quote(key, safe="/-_.~")}'))
+
+    truncated = root.findtext(f'{S3_NAMESPACE}IsTruncated', 'false') == 'true'
+    continuation_token = root.findtext(f'{S3_NAMESPACE}NextContinuationToken', None) if truncated else None
+    return ListPage(entries, continuation_token)
+
+def iter_pages(bucket_url: str, prefix: str = None, payment_solution: PaymentSolution = None,
+        transport: Transport = None, start_after: str = None, max_keys: int = LIST_MAX_KEYS,
+        service: CloudService = CloudService.S3) -> typing.Iterator[ListPage]:
+    '''
+    Lists bucket_url, a path-style S3 or Spaces bucket url, one ListObjectsV2 page at a time. A page is only requested
+      once the previous one has been consumed
+    '''
+    transport = transport or get_default_transport()
+    auth = load_auth(payment_solution, service)
+    continuation_token: str = None
+    while True:
+        url = build_list_url(bucket_url, prefix, continuation_token, start_after, max_keys)
+        response = transport.get(url, auth=auth)
+        if response.status_code not in [200]:
+            raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+
+        page = parse_list_page(bucket_url, response.content)
+        yield page
+        if page.continuation_token is None:
+            break
+
+        continuation_token = page.continuation_token
+
+def list_objects(bucket_url: str, prefix: str = None, payment_solution: PaymentSolution = None,
+        transport: Transport = None, start_after: str = None, max_keys: int = LIST_MAX_KEYS,
+        service: CloudService = CloudService.S3) -> typing.Iterator[ObjectEntry]:
+    for page in iter_pages(bucket_url, prefix, payment_solution, transport, start_after, max_keys, service):
+        yield from page.entries
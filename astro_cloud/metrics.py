@@ -0,0 +1,179 @@
+import threading
+import time
+import typing
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+BYTES_PER_GB: int = 1024 ** 3
+
+class CostModel(typing.NamedTuple):
+    '''
+    Prices in USD for GETs billed to the requester, S3 Standard in us-east-1 with transfer out to the internet. Transfer
+      within the same region is free, set transfer_per_gb to 0 when running there
+    '''
+    get_per_thousand: float = 0.0004
+    transfer_per_gb: float = 0.09
+
+DEFAULT_COST_MODEL: CostModel = CostModel()
+
+class RequestSpan(typing.NamedTuple):
+    url: str
+    start: int
+    end: int  # inclusive, like the HTTP Range header
+    status_code: int
+    bytes_received: int
+    time_to_first_byte: float  # None when the transport can't tell
+    elapsed: float
+    signing_time: float
+    attempts: int = 1  # more than 1 when the request was retried
+    hedged: bool = False  # a duplicate request was sent and answered first
+    cached: bool = False  # served from a BlockCache, no request was sent
+    # a duplicate request was sent, whichever answered first. Both are billed, and as they ask for the same range,
+    #   the one whose response wasn't used is taken to have received as many bytes
+    hedge_sent: bool = False
+
+class CallStats:
+    '''
+    Totals for one load_headers call, or for every call an Instrumentation has seen. parse_time covers finding END
+      cards and the structural cards, astropy Headers are built later, when FITSHeader.fits is first read. Ranges a
+      BlockCache served count as cache_hits, not as requests or bytes_received. A range a duplicate was sent for
+      counts as two requests and one of hedges_sent, and as one of hedges too when the duplicate answered first
+    '''
+    url: str
+    spans: typing.List[RequestSpan]
+    requests: int
+    bytes_received: int
+    cache_hits: int
+    headers: int
+    retries: int
+    hedges: int
+    hedges_sent: int
+    signing_time: float
+    parse_time: float
+    wall_time: float
+    def __init__(self: PWN, url: str = None) -> None:
+        self.url = url
+        self.spans = []
+        self.requests = 0
+        self.bytes_received = 0
+        self.cache_hits = 0
+        self.headers = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedges_sent = 0
+        self.signing_time = 0.0
+        self.parse_time = 0.0
+        self.wall_time = 0.0
+
+    def estimate_cost(self: PWN, cost_model: CostModel = DEFAULT_COST_MODEL) -> float:
+        '''
+        What the requests would cost a requester-pays bucket's requester, in USD
+        '''
+        return self.requests * cost_model.get_per_thousand / 1000 + \
+            self.bytes_received * cost_model.transfer_per_gb / BYTES_PER_GB
+
+    def add(self: PWN, other: 'CallStats') -> None:
+        self.requests += other.requests
+        self.bytes_received += other.bytes_received
+        self.cache_hits += other.cache_hits
+        self.headers += other.headers
+        self.retries += other.retries
+        self.hedges += other.hedges
+        self.hedges_sent += other.hedges_sent
+        self.signing_time += other.signing_time
+        self.parse_time += other.parse_time
+        self.wall_time += other.wall_time
+
+    def __repr__(self: PWN) -> str:
+        return f'CallStats(url={self.url}, requests={self.requests}, bytes_received={self.bytes_received}, ' \
+            f'cache_hits={self.cache_hits}, headers={self.headers}, retries={self.retries}, hedges={self.hedges}, ' \
+            f'hedges_sent={self.hedges_sent}, signing_time={self.signing_time:.6f}, ' \
+            f'parse_time={self.parse_time:.6f}, wall_time={self.wall_time:.6f})'
+
+class TimedAuth:
+    '''
+    Wraps a requests AuthBase, adding the time spent signing to elapsed
+    '''
+    _auth: 'requests.auth.AuthBase'
+    elapsed: float
+    def __init__(self: PWN, auth: 'requests.auth.AuthBase') -> None:
+        self._auth = auth
+        self.elapsed = 0.0
+
+    def __call__(self: PWN, request: 'requests.PreparedRequest') -> 'requests.PreparedRequest':
+        started = time.perf_counter()
+        try:
+            return self._auth(request)
+
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def take(self: PWN) -> float:
+        elapsed, self.elapsed = self.elapsed, 0.0
+        return elapsed
+
+class Instrumentation:
+    '''
+    Pass an Instrumentation to load_headers, iter_headers or load_headers_many to find out where the time went.
+      on_request is called with a RequestSpan as each range request completes, and on_complete with the CallStats of
+      each call once it finishes. totals accumulates every call, and is safe to share between threads. Without an
+      Instrumentation nothing is timed or recorded
+    '''
+    on_request: typing.Callable[[RequestSpan], None]
+    on_complete: typing.Callable[[CallStats], None]
+    record_spans: bool
+    _totals: CallStats
+    _lock: threading.Lock
+    def __init__(self: PWN, on_request: typing.Callable[[RequestSpan], None] = None,
+            on_complete: typing.Callable[[CallStats], None] = None, record_spans: bool = True) -> None:
+        self.on_request = on_request
+        self.on_complete = on_complete
+        self.record_spans = record_spans
+        self._totals = CallStats()
+        self._lock = threading.Lock()
+
+    @property
+    def totals(self: PWN) -> CallStats:
+        return self._totals
+
+    def begin(self: PWN, url: str) -> CallStats:
+        stats = CallStats(url)
+        stats.wall_time = time.perf_counter()
+        return stats
+
+    def record(self: PWN, stats: CallStats, span: RequestSpan) -> None:
+        if span.cached:
+            stats.cache_hits += 1
+
+        else:
+            requests = 1 + int(span.hedge_sent)
+            stats.requests += requests
+            stats.bytes_received += span.bytes_received * requests
+
+        stats.signing_time += span.signing_time
+        stats.retries += span.attempts - 1
+        stats.hedges += int(span.hedged)
+        stats.hedges_sent += int(span.hedge_sent)
+        if self.record_spans:
+            stats.spans.append(span)
+
+        if self.on_request:
+            self.on_request(span)
+
+    def end(self: PWN, stats: CallStats) -> None:
+        stats.wall_time = time.perf_counter() - stats.wall_time
+        with self._lock:
+            self._totals.add(stats)
+
+        if self.on_complete:
+            self.on_complete(stats)
+
+def time_to_first_byte(response: typing.Any) -> float:
+    '''
+    requests sets Response.elapsed once the response headers have been parsed, RangeResponse carries the same
+    '''
+    elapsed = getattr(response, 'elapsed', None)
+    if elapsed is None:
+        return None
+
+    return elapsed if isinstance(elapsed, float) else elapsed.total_seconds()
@@ -0,0 +1,612 @@
+import collections
+import concurrent.futures
+import logging
+import random
+import re
+import threading
+import time
+import typing
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+logger = logging.getLogger(__file__)
+
+# Apache2 refuses more than 200 ranges per request by default (MaxRanges), stay well below that and header size limits
+MULTIRANGE_MAX_RANGES: int = 64
+MULTIRANGE_MAX_WORKERS: int = 8
+MULTIRANGE_CHUNK_SIZE: int = 64 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+BOUNDARY_PATTERN = re.compile(r'boundary="?([^";]+)"?')
+
+class RangeResponse(typing.NamedTuple):
+    status_code: int
+    content: bytes
+    headers: typing.Mapping[str, str]
+    elapsed: float = None  # seconds until the response headers arrived
+    attempts: int = 1
+    hedged: bool = False  # the duplicate request's response
+    cached: bool = False  # served from a BlockCache without sending a request
+    hedge_sent: bool = False  # a duplicate request was sent, whichever answered first
+
+def parse_content_range(content_range: str) -> typing.Tuple[int, int]:
+    '''
+    Content-Range: bytes 0-2879/1234567 -> (0, 2879)
+    '''
+    match = CONTENT_RANGE_PATTERN.match(content_range or '')
+    if match is None:
+        return None
+
+    return int(match.group(1)), int(match.group(2))
+
+class MultipartByteRangesParser:
+    '''
+    Incremental parser for multipart/byteranges bodies. feed chunks as they arrive, each call returns the parts
+      completed so far as ((start, end), content). Only the part being received is held in memory
+    '''
+    _delimiter: bytes
+    _buffer: bytearray
+    _part_range: typing.Tuple[int, int]
+    _done: bool
+    def __init__(self: PWN, boundary: str) -> None:
+        self._delimiter = f'--{boundary}'.encode('ascii')
+        self._buffer = bytearray()
+        self._part_range = None
+        self._done = False
+
+    @property
+    def done(self: PWN) -> bool:
+        return self._done
+
+    def feed(self: PWN, chunk: bytes) -> typing.List[typing.Tuple[typing.Tuple[int, int], bytes]]:
+        self._buffer.extend(chunk)
+        parts: typing.List[typing.Tuple[typing.Tuple[int, int], bytes]] = []
+        while not self._done:
+            if self._part_range is None:
+                position = self._buffer.find(self._delimiter)
+                if position == -1:
+                    break
+
+                after = position + len(self._delimiter)
+                if self._buffer[after:after + 2] == b'--':
+                    self._done = True
+                    break
+
+                headers_end = self._buffer.find(b'\r\n\r\n', after)
+                if headers_end == -1:
+                    break
+
+                part_headers = bytes(self._buffer[after:headers_end]).decode('latin-1').split('\r\n')
+                for line in part_headers:
+                    key, _, value = line.partition(':')
+                    if key.strip().lower() == 'content-range':
+                        self._part_range = parse_content_range(value.strip())
+
+                if self._part_range is None:
+                    raise Exception('multipart/byteranges part is missing its Content-Range')
+
+                del self._buffer[:headers_end + 4]
+
+            length = self._part_range[1] - self._part_range[0] + 1
+            if len(self._buffer) < length:
+                break
+
+            parts.append((self._part_range, bytes(self._buffer[:length])))
+            del self._buffer[:length]
+            self._part_range = None
+
+        return parts
+
+def extract_ranges(ranges: typing.List[typing.Tuple[int, int]],
+        parts: typing.List[typing.Tuple[typing.Tuple[int, int], bytes]]) -> typing.List[bytes]:
+    '''
+    Servers may coalesce overlapping or neighbouring ranges into one part, so every requested range is looked up in
+      whichever part contains it. Ranges no part covers are None
+    '''
+    contents: typing.List[bytes] = []
+    for start, end in ranges:
+        content = None
+        for (part_start, part_end), part in parts:
+            if part_start <= start and end <= part_end:
+                content = part[start - part_start:end - part_start + 1]
+                break
+
+        contents.append(content)
+
+    return contents
+
+class RetryPolicy(typing.NamedTuple):
+    '''
+    Retries GETs answered with one of retry_statuses, or that failed to connect or timed out, after a delay drawn
+      uniformly between 0 and base_delay * 2 ** retry, capped at max_delay. A Retry-After header is honoured up to
+      max_delay. S3 answers 503 SlowDown when a prefix is being read too quickly
+    '''
+    max_attempts: int = 4
+    base_delay: float = 0.1
+    max_delay: float = 10.0
+    retry_statuses: typing.Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    def backoff(self: 'RetryPolicy', retry: int, retry_after: str = None) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(self.max_delay, float(retry_after)))
+
+        return delay
+
+class HedgePolicy(typing.NamedTuple):
+    '''
+    Sends a duplicate range request when the first hasn't answered within the percentile of the latencies seen for
+      that host, and takes whichever answers first. Nothing is hedged until min_samples latencies have been seen.
+      Costs at most (1 - percentile) more requests
+    '''
+    percentile: float = 0.95
+    min_samples: int = 20
+    min_delay: float = 0.005
+    window: int = 256  # number of recent latencies per host the percentile is taken over
+
+class TransportConfig(typing.NamedTuple):
+    pool_connections: int = 16  # number of per-host connection pools kept alive
+    pool_maxsize: int = 16  # number of connections kept alive in each per-host pool
+    pool_block: bool = False  # block when a pool is exhausted, rather than opening a throw-away connection
+    keep_alive: bool = True
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0  # seconds between bytes, not for the whole response
+    retry: RetryPolicy = RetryPolicy()
+    hedge: HedgePolicy = None
+
+class LatencyTracker:
+    '''
+    Recent request latencies per host, for HedgePolicy
+    '''
+    _window: int
+    _samples: typing.Dict[str, typing.Deque[float]]
+    _lock: threading.Lock
+    def __init__(self: PWN, window: int) -> None:
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def add(self: PWN, host: str, latency: float) -> None:
+        with self._lock:
+            samples = self._samples.get(host, None)
+            if samples is None:
+                samples = self._samples[host] = collections.deque(maxlen=self._window)
+
+            samples.append(latency)
+
+    def percentile(self: PWN, host: str, percentile: float, min_samples: int) -> float:
+        '''
+        Returns None until min_samples latencies have been seen for host
+        '''
+        with self._lock:
+            samples = sorted(self._samples.get(host, ()))
+
+        if len(samples) < max(min_samples, 1):
+            return None
+
+        return samples[min(len(samples) - 1, int(percentile * len(samples)))]
+
+def create_session(config: TransportConfig) -> requests.Session:
+    '''
+    Creates a requests.Session with per-host connection pools. urllib3 keeps one pool per scheme, host and port, and
+      each pool holds up to `pool_maxsize` keep-alive connections
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=config.pool_connections,
+        pool_maxsize=config.pool_maxsize,
+        pool_block=config.pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not config.keep_alive:
+        session.headers['Connection'] = 'close'
+
+    return session
+
+def prepare_request(method: str, url: str, headers: typing.Dict[str, str],
+        auth: 'requests.auth.AuthBase') -> requests.PreparedRequest:
+    '''
+    Runs a requests AuthBase against a PreparedRequest without sending it, so the same auth classes sign requests for
+      clients other than requests. Send prepared.url as-is, it's the url that was signed
+    '''
+    return requests.Request(method, url, headers=headers, auth=auth).prepare()
+
+class Transport:
+    '''
+    Transport shared by every index module. It owns a requests.Session so TCP and TLS handshakes are paid once per
+      connection instead of once per block. A caller-supplied session is used as-is. With a BlockCache, range reads
+      without extra headers are served from it, conditional requests always go to the server
+    '''
+    _config: TransportConfig
+    _session: requests.Session
+    _block_cache: 'BlockCache'
+    _single_range_hosts: typing.Set[str]
+    _latencies: LatencyTracker
+    _hedge_executor: concurrent.futures.ThreadPoolExecutor
+    _hedge_lock: threading.Lock
+    def __init__(self: PWN, config: TransportConfig = None, session: requests.Session = None,
+            block_cache: 'BlockCache' = None) -> None:
+        self._config = config or TransportConfig()
+        self._session = session or create_session(self._config)
+        self._block_cache = block_cache
+        self._single_range_hosts = set()
+        self._latencies = LatencyTracker(self._config.hedge.window) if self._config.hedge else None
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+
+    @property
+    def config(self: PWN) -> TransportConfig:
+        return self._config
+
+    @property
+    def session(self: PWN) -> requests.Session:
+        return self._session
+
+    @property
+    def block_cache(self: PWN) -> 'BlockCache':
+        return self._block_cache
+
+    def get(self: PWN, url: str, headers: typing.Dict[str, str] = None, auth: 'requests.auth.AuthBase' = None,
+            **kwargs) -> requests.Response:
+        '''
+        GETs url, retrying as the RetryPolicy allows. Each attempt is signed again. Once the attempts run out the last
+          response is returned, or the last connection error raised. The response's attempts attribute holds the
+          number of attempts made
+        '''
+        retry: RetryPolicy = self._config.retry or RetryPolicy(max_attempts=1)
+        kwargs.setdefault('timeout', (self._config.connect_timeout, self._config.read_timeout))
+        for attempt in range(1, retry.max_attempts + 1):
+            try:
+                response = self._session.get(url, headers=headers or {}, auth=auth, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                if attempt >= retry.max_attempts:
+                    raise
+
+                delay = retry.backoff(attempt - 1)
+                logger.info(f'Retrying url[{url}] in {delay:.3f}s after {err.__class__.__name__}')
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in retry.retry_statuses or attempt >= retry.max_attempts:
+                response.attempts = attempt
+                return response
+
+            delay = retry.backoff(attempt - 1, response.headers.get('Retry-After', None))
+            logger.info(f'Retrying url[{url}] in {delay:.3f}s after HTTP Code: {response.status_code}')
+            response.close()
+            time.sleep(delay)
+
+    def read_range(self: PWN, url: str, start: int, end: int, auth: 'requests.auth.AuthBase' = None,
+            headers: typing.Dict[str, str] = None) -> requests.Response:
+        '''
+        Requests the inclusive byte range [start, end] of url, hedged when the config has a HedgePolicy
+        '''
+        if self._block_cache is not None and not headers:
+            return self._block_cache.read_range(url, start, end,
+                lambda fetch_start, fetch_end: self._read_range(url, fetch_start, fetch_end, auth, headers))
+
+        return self._read_range(url, start, end, auth, headers)
+
+    def _read_range(self: PWN, url: str, start: int, end: int, auth: 'requests.auth.AuthBase',
+            headers: typing.Dict[str, str]) -> requests.Response:
+        range_headers: typing.Dict[str, str] = dict(headers or {})
+        range_headers['Range'] = f'bytes={start}-{end}'
+        if self._config.hedge is None:
+            return self.get(url, headers=range_headers, auth=auth)
+
+        return self._hedged_get(url, range_headers, auth)
+
+    def _timed_get(self: PWN, url: str, headers: typing.Dict[str, str], auth: 'requests.auth.AuthBase',
+            running: threading.Event = None) -> requests.Response:
+        if running is not None:
+            running.set()
+
+        started: float = time.perf_counter()
+        response = self.get(url, headers=headers, auth=auth)
+        self._latencies.add(urlparse(url).netloc, time.perf_counter() - started)
+        return response
+
+    def _hedged_get(self: PWN, url: str, headers: typing.Dict[str, str],
+            auth: 'requests.auth.AuthBase') -> requests.Response:
+        hedge: HedgePolicy = self._config.hedge
+        threshold = self._latencies.percentile(urlparse(url).netloc, hedge.percentile, hedge.min_samples)
+        if threshold is None:
+            return self._timed_get(url, headers, auth)
+
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._config.pool_maxsize, thread_name_prefix='astro-cloud-hedge')
+
+            executor = self._hedge_executor
+
+        running = threading.Event()
+        first = executor.submit(self._timed_get, url, headers, auth, running)
+        # The threshold is a request latency, time spent queued for a worker doesn't count towards it
+        running.wait()
+        try:
+            return first.result(timeout=max(threshold, hedge.min_delay))
+        except concurrent.futures.TimeoutError:
+            pass
+
+        logger.info(f'Hedging url[{url}] Range[{headers["Range"]}] after {threshold:.3f}s')
+        second = executor.submit(self.get, url, headers, auth)
+        pending = {first, second}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    response = future.result()
+                    # Both requests are billed, only when the duplicate's response is the one used did hedging help
+                    response.hedge_sent = True
+                    response.hedged = future is second
+                    return response
+
+        # Both failed, the first request's error is the one to report
+        return first.result()
+
+    def read_ranges(self: PWN, url: str, ranges: typing.List[typing.Tuple[int, int]],
+            auth: 'requests.auth.AuthBase' = None, headers: typing.Dict[str, str] = None) -> typing.List[bytes]:
+        '''
+        Requests many inclusive byte ranges of url, returning their contents in the same order. Ranges are batched into
+          `Range: bytes=a-b,c-d,...` requests and the multipart/byteranges responses are parsed as they stream in. If a
+          host ignores multiple ranges, answering 200 or a single part that doesn't cover them all, the body is
+          abandoned and the ranges are requested in parallel one at a time, which is remembered for that host
+        '''
+        if self._block_cache is not None and not headers:
+            return self._block_cache.read_ranges(url, ranges,
+                lambda fetch_start, fetch_end: self._read_range(url, fetch_start, fetch_end, auth, headers),
+                lambda fetch_ranges: self._read_ranges(url, fetch_ranges, auth, headers))
+
+        return self._read_ranges(url, ranges, auth, headers)
+
+    def _read_ranges(self: PWN, url: str, ranges: typing.List[typing.Tuple[int, int]],
+            auth: 'requests.auth.AuthBase', headers: typing.Dict[str, str]) -> typing.List[bytes]:
+        contents: typing.List[bytes] = [None] * len(ranges)
+        host: str = urlparse(url).netloc
+        if len(ranges) > 1 and not host in self._single_range_hosts:
+            for batch_start in range(0, len(ranges), MULTIRANGE_MAX_RANGES):
+                batch = ranges[batch_start:batch_start + MULTIRANGE_MAX_RANGES]
+                batch_contents = self._read_multirange(url, batch, auth, headers)
+                if batch_contents is None:
+                    self._single_range_hosts.add(host)
+                    break
+
+                contents[batch_start:batch_start + len(batch)] = batch_contents
+
+        missing: typing.List[int] = [idx for idx, content in enumerate(contents) if content is None]
+        if len(missing) == 1:
+            contents[missing[0]] = self._read_single_range(url, ranges[missing[0]], auth, headers)
+
+        elif len(missing) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MULTIRANGE_MAX_WORKERS) as executor:
+                futures = {idx: executor.submit(self._read_single_range, url, ranges[idx], auth, headers)
+                    for idx in missing}
+                for idx, future in futures.items():
+                    contents[idx] = future.result()
+
+        return contents
+
+    def _read_single_range(self: PWN, url: str, byte_range: typing.Tuple[int, int], auth: 'requests.auth.AuthBase',
+            headers: typing.Dict[str, str]) -> bytes:
+        response = self._read_range(url, byte_range[0], byte_range[1], auth, headers)
+        if response.status_code not in [206]:
+            raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+
+        return response.content
+
+    def _read_multirange(self: PWN, url: str, ranges: typing.List[typing.Tuple[int, int]],
+            auth: 'requests.auth.AuthBase', headers: typing.Dict[str, str]) -> typing.List[bytes]:
+        range_headers: typing.Dict[str, str] = dict(headers or {})
+        range_headers['Range'] = 'bytes=' + ','.join(f'{start}-{end}' for start, end in ranges)
+        with self.get(url, headers=range_headers, auth=auth, stream=True) as response:
+            content_type = response.headers.get('Content-Type', '')
+            if response.status_code in [206] and content_type.startswith('multipart/byteranges'):
+                boundary = BOUNDARY_PATTERN.search(content_type)
+                if boundary is None:
+                    logger.info(f'Host[{urlparse(url).netloc}] answered multiple ranges without a multipart boundary')
+                    return None
+
+                parser = MultipartByteRangesParser(boundary.group(1))
+                parts: typing.List[typing.Tuple[typing.Tuple[int, int], bytes]] = []
+                for chunk in response.iter_content(MULTIRANGE_CHUNK_SIZE):
+                    parts.extend(parser.feed(chunk))
+
+                return extract_ranges(ranges, parts)
+
+            elif response.status_code in [206]:
+                part_range = parse_content_range(response.headers.get('Content-Range', None))
+                covered = part_range is not None and all(
+                    part_range[0] <= start and end <= part_range[1] for start, end in ranges)
+                if covered and part_range[1] - part_range[0] <= sum(end - start + 1 for start, end in ranges) * 2:
+                    return extract_ranges(ranges, [(part_range, response.content)])
+
+                logger.info(f'Host[{urlparse(url).netloc}] answered multiple ranges with a single part')
+                return None
+
+            elif response.status_code in [200]:
+                # Closing the response abandons the body, which may well be the whole object
+                logger.info(f'Host[{urlparse(url).netloc}] ignores multiple ranges')
+                return None
+
+            raise NotImplementedError(f'Unable to handle HTTP Code: {response.status_code}')
+
+    def close(self: PWN) -> None:
+        with self._hedge_lock:
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
+
+        self._session.close()
+
+    def __enter__(self: PWN) -> PWN:
+        return self
+
+    def __exit__(self: PWN, *args) -> None:
+        self.close()
+
+_default_transport: Transport = None
+_default_transport_lock: threading.Lock = threading.Lock()
+
+def get_default_transport() -> Transport:
+    '''
+    Returns the process-wide Transport used when a caller doesn't supply one
+    '''
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = Transport()
+
+        return _default_transport
+
+def set_default_transport(transport: Transport) -> None:
+    global _default_transport
+    with _default_transport_lock:
+        _default_transport = transport
+
+class AsyncTransport:
+    '''
+    asyncio counterpart of Transport, backed by an aiohttp.ClientSession. aiohttp is an optional dependency, installed
+      with `pip install astro-cloud[async]`. The session is created on first use, inside the running event loop
+    '''
+    _config: TransportConfig
+    _session: 'aiohttp.ClientSession'
+    _owns_session: bool
+    _latencies: LatencyTracker
+    def __init__(self: PWN, config: TransportConfig = None, session: 'aiohttp.ClientSession' = None) -> None:
+        self._config = config or TransportConfig()
+        self._session = session
+        self._owns_session = session is None
+        self._latencies = LatencyTracker(self._config.hedge.window) if self._config.hedge else None
+
+    @property
+    def config(self: PWN) -> TransportConfig:
+        return self._config
+
+    @property
+    def session(self: PWN) -> 'aiohttp.ClientSession':
+        if self._session is None:
+            import aiohttp
+
+            connector = aiohttp.TCPConnector(
+                limit=self._config.pool_connections * self._config.pool_maxsize,
+                limit_per_host=self._config.pool_maxsize,
+                force_close=not self._config.keep_alive)
+            timeout = aiohttp.ClientTimeout(sock_connect=self._config.connect_timeout,
+                sock_read=self._config.read_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, auto_decompress=False)
+
+        return self._session
+
+    async def get(self: PWN, url: str, headers: typing.Dict[str, str] = None,
+            auth: 'requests.auth.AuthBase' = None) -> RangeResponse:
+        '''
+        GETs url, retrying as the RetryPolicy allows, the same way Transport.get does
+        '''
+        import asyncio
+
+        import aiohttp
+
+        retry: RetryPolicy = self._config.retry or RetryPolicy(max_attempts=1)
+        for attempt in range(1, retry.max_attempts + 1):
+            try:
+                response = await self._get_once(url, headers, auth)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as err:
+                if attempt >= retry.max_attempts:
+                    raise
+
+                delay = retry.backoff(attempt - 1)
+                logger.info(f'Retrying url[{url}] in {delay:.3f}s after {err.__class__.__name__}')
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code not in retry.retry_statuses or attempt >= retry.max_attempts:
+                return response._replace(attempts=attempt)
+
+            delay = retry.backoff(attempt - 1, response.headers.get('Retry-After', None))
+            logger.info(f'Retrying url[{url}] in {delay:.3f}s after HTTP Code: {response.status_code}')
+            await asyncio.sleep(delay)
+
+    async def _get_once(self: PWN, url: str, headers: typing.Dict[str, str],
+            auth: 'requests.auth.AuthBase') -> RangeResponse:
+        import asyncio
+
+        import yarl
+
+        if auth is None:
+            prepared = prepare_request('GET', url, headers or {}, auth)
+        else:
+            # Signing may fetch a token, or wait on another thread fetching one, so it's kept off the loop
+            prepared = await asyncio.get_running_loop().run_in_executor(None, prepare_request, 'GET', url,
+                headers or {}, auth)
+
+        started: float = time.perf_counter()
+        async with self.session.get(yarl.URL(prepared.url, encoded=True), headers=dict(prepared.headers)) as response:
+            elapsed: float = time.perf_counter() - started
+            content = await response.read()
+            return RangeResponse(response.status, content, response.headers, elapsed)
+
+    async def read_range(self: PWN, url: str, start: int, end: int, auth: 'requests.auth.AuthBase' = None,
+            headers: typing.Dict[str, str] = None) -> RangeResponse:
+        '''
+        Requests the inclusive byte range [start, end] of url, hedged when the config has a HedgePolicy
+        '''
+        range_headers: typing.Dict[str, str] = dict(headers or {})
+        range_headers['Range'] = f'bytes={start}-{end}'
+        if self._config.hedge is None:
+            return await self.get(url, headers=range_headers, auth=auth)
+
+        return await self._hedged_get(url, range_headers, auth)
+
+    async def _timed_get(self: PWN, url: str, headers: typing.Dict[str, str],
+            auth: 'requests.auth.AuthBase') -> RangeResponse:
+        started: float = time.perf_counter()
+        response = await self.get(url, headers=headers, auth=auth)
+        self._latencies.add(urlparse(url).netloc, time.perf_counter() - started)
+        return response
+
+    async def _hedged_get(self: PWN, url: str, headers: typing.Dict[str, str],
+            auth: 'requests.auth.AuthBase') -> RangeResponse:
+        import asyncio
+
+        hedge: HedgePolicy = self._config.hedge
+        threshold = self._latencies.percentile(urlparse(url).netloc, hedge.percentile, hedge.min_samples)
+        if threshold is None:
+            return await self._timed_get(url, headers, auth)
+
+        first = asyncio.ensure_future(self._timed_get(url, headers, auth))
+        done, _ = await asyncio.wait({first}, timeout=max(threshold, hedge.min_delay))
+        if done:
+            return first.result()
+
+        logger.info(f'Hedging url[{url}] Range[{headers["Range"]}] after {threshold:.3f}s')
+        second = asyncio.ensure_future(self.get(url, headers=headers, auth=auth))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()._replace(hedged=future is second, hedge_sent=True)
+
+            # Both failed, the first request's error is the one to report
+            return first.result()
+
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def close(self: PWN) -> None:
+        if self._session is not None and self._owns_session:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self: PWN) -> PWN:
+        return self
+
+    async def __aexit__(self: PWN, *args) -> None:
+        await self.close()
@@ -2,7 +2,8 @@ import os
 import pytest
 
 from astro_cloud_tests.pytest_constants import ENCODING
-from astro_cloud_tests.pytest_utils import aws_credential_filepath, aws_credential_filepath__empty
+from astro_cloud_tests.pytest_utils import aws_credential_filepath, aws_credential_filepath__empty, range_server, \
+    synthetic_fits_filepath
 
 def test__aws_auth():
     import requests
@@ -139,6 +140,10 @@ def test__get_canonical_querystring():
 
     url = 'https://s3.us-east-1.amazonaws.com/datum-storage.org/test-file.txt'
     assert get_canonical_querystring(url) == ''
+    url = 'https://s3.us-east-1.amazonaws.com/stpubdata?prefix=tess/public/mast&list-type=2&max-keys=1000&fetch-owner'
+    assert get_canonical_querystring(url) == 'fetch-owner=&list-type=2&max-keys=1000&prefix=tess%2Fpublic%2Fmast'
+    url = 'https://s3.us-east-1.amazonaws.com/stpubdata?prefix=a%20b%2Bc&continuation-token=1%2F2%3D%3D&list-type=2'
+    assert get_canonical_querystring(url) == 'continuation-token=1%2F2%3D%3D&list-type=2&prefix=a%20b%2Bc'
 
 def test__get_payload_hash():
     import hashlib
@@ -198,3 +203,144 @@ def test__get_signature_key(aws_credential_filepath):
 
 
 
+
+def test__load_aws_context__cached(aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.auth.aws import load_aws_auth_context
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    auth_context = load_aws_auth_context()
+    reads = []
+    monkeypatch.setattr(auth_aws, 'read_aws_auth_context', lambda: reads.append(1))
+    for _ in range(10):
+        assert load_aws_auth_context() is auth_context
+
+    assert reads == []
+
+def test__load_aws_context__reloaded_when_modified(aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.auth.aws import load_aws_auth_context
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    assert load_aws_auth_context().access_key == 'one'
+    with open(aws_credential_filepath, 'rb') as stream:
+        content = stream.read().replace(b'aws_access_key_id=one', b'aws_access_key_id=rotated')
+
+    with open(aws_credential_filepath, 'wb') as stream:
+        stream.write(content)
+
+    stat = os.stat(aws_credential_filepath)
+    os.utime(aws_credential_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert load_aws_auth_context().access_key == 'rotated'
+
+def test__invalidate_aws_auth_context(aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.auth.aws import invalidate_aws_auth_context, load_aws_auth_context
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    auth_context = load_aws_auth_context()
+    invalidate_aws_auth_context()
+    assert load_aws_auth_context() is not auth_context
+    assert load_aws_auth_context() == auth_context
+
+def test__derive_signature_key__cached():
+    from astro_cloud.auth.aws import derive_signature_key
+
+    derive_signature_key.cache_clear()
+    first = derive_signature_key('key', '20200818', 'us-east-1', 's3')
+    second = derive_signature_key('key', '20200818', 'us-east-1', 's3')
+    assert first is second
+    assert derive_signature_key.cache_info().hits == 1
+    assert derive_signature_key('key', '20200819', 'us-east-1', 's3') != first
+
+def test__aws_auth__signature(aws_credential_filepath, monkeypatch):
+    import hashlib
+    import hmac
+
+    from datetime import datetime
+
+    import requests
+
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.auth.aws import AWSAuth, sign
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime(2020, 8, 18, 12, 30, 0)
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    monkeypatch.setattr(auth_aws, 'datetime', FrozenDatetime)
+    url = 'https://s3.us-east-1.amazonaws.com/stpubdata/tess/file.fits'
+    for _ in range(2):
+        prepared = requests.Request('GET', url, auth=AWSAuth(request_payer=True)).prepare()
+        canonical_request = '\n'.join([
+            'GET',
+            '/stpubdata/tess/file.fits',
+            '',
+            'host:s3.us-east-1.amazonaws.com\nx-amz-date:20200818T123000Z\nx-amz-request-payer:requester\n',
+            'host;x-amz-date;x-amz-request-payer',
+            hashlib.sha256(b'').hexdigest(),
+        ])
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256',
+            '20200818T123000Z',
+            '20200818/three/s3/aws4_request',
+            hashlib.sha256(canonical_request.encode(ENCODING)).hexdigest(),
+        ])
+        signing_key = sign(sign(sign(sign('AWS4two', '20200818'), 'three'), 's3'), 'aws4_request')
+        signature = hmac.new(signing_key, string_to_sign.encode(ENCODING), hashlib.sha256).hexdigest()
+        assert prepared.headers['Authorization'] == \
+            'AWS4-HMAC-SHA256 Credential=one/20200818/three/s3/aws4_request, ' \
+            f'SignedHeaders=host;x-amz-date;x-amz-request-payer, Signature={signature}'
+
+def test__presign_url(range_server):
+    import requests
+
+    from datetime import datetime, timedelta
+
+    from astro_cloud.auth.aws import AWSAuthContext, AWSService, presign_url
+
+    range_server.credentials = {'one': 'two'}
+    aws_context = AWSAuthContext('one', 'two', 'us-east-1', AWSService.S3)
+    url = f'{range_server.base_url}/synthetic.fits'
+    presigned = presign_url(url, expires=60, aws_context=aws_context)
+    response = requests.get(presigned.url, headers={'Range': 'bytes=0-79'})
+    assert response.status_code == 206
+    assert response.content.startswith(b'SIMPLE')
+    assert 'Authorization' not in range_server.request_headers[-1]
+    assert requests.get(url).status_code == 403
+    assert requests.get(presigned.url.replace('X-Amz-Expires=60', 'X-Amz-Expires=600')).status_code == 403
+
+    expired = presign_url(url, expires=60, aws_context=aws_context, timestamp=datetime.utcnow() - timedelta(minutes=2))
+    assert requests.get(expired.url).status_code == 403
+
+    payer = presign_url(f'{url}?versionId=3', request_payer=True, aws_context=aws_context)
+    assert 'x-amz-request-payer=requester' in payer.url
+    assert requests.get(payer.url, headers={'Range': 'bytes=0-79'}).status_code == 206
+    with pytest.raises(ValueError):
+        presign_url(url, expires=8 * 24 * 60 * 60, aws_context=aws_context)
+
+def test__presigned_url_cache(aws_credential_filepath, monkeypatch):
+    import time
+
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.auth.aws import PresignedURLCache
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    now = [time.time()]
+    monkeypatch.setattr(auth_aws.time, 'time', lambda: now[0])
+    urls = [f'https://s3.us-east-1.amazonaws.com/stpubdata/tess/{idx}.fits' for idx in range(3)]
+    cache = PresignedURLCache(expires=600, refresh_margin=60, max_entries=2)
+    first = cache.presign_many(urls[:2])
+    assert all('X-Amz-Credential=one%2F' in url for url in first)
+    assert cache.presign_many(urls[:2]) == first
+    assert cache.signed == 2
+
+    now[0] += 600 - 60
+    cache.get(urls[0])
+    assert cache.signed == 3
+    cache.get(urls[2])
+    assert len(cache) == 2
+    with pytest.raises(ValueError):
+        PresignedURLCache(expires=60, refresh_margin=60)
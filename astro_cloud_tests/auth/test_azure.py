@@ -1,4 +1,92 @@
-def test__azure_auth():
+import pytest
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+ACCOUNT_KEY: str = 'c2VjcmV0LWFjY291bnQta2V5LWZvci10ZXN0aW5n'
+
+@pytest.fixture
+def azure_environment(monkeypatch):
+    from astro_cloud.auth.tokens import clear_token_caches
+
+    for name in ['AZURE_STORAGE_SAS_TOKEN', 'AZURE_STORAGE_ACCOUNT', 'AZURE_STORAGE_KEY', 'AZURE_TENANT_ID',
+            'AZURE_CLIENT_ID', 'AZURE_CLIENT_SECRET', 'AZURE_AUTHORITY_HOST']:
+        monkeypatch.delenv(name, raising=False)
+
+    clear_token_caches()
+    yield monkeypatch
+    clear_token_caches()
+
+def test__azure_auth__anonymous(azure_environment):
     import requests
 
     from astro_cloud.auth.azure import AzureAuth
+
+    url = 'https://account.blob.core.windows.net/container/file.fits'
+    prepared = requests.Request('GET', url, auth=AzureAuth()).prepare()
+    assert 'Authorization' not in prepared.headers
+    assert prepared.url == url
+
+def test__get_canonicalized_resource():
+    from astro_cloud.auth.azure import get_canonicalized_resource
+
+    url = 'https://account.blob.core.windows.net/container/a%20b.fits?restype=container&comp=list&include=metadata'
+    assert get_canonicalized_resource('account', url) == \
+        '/account/container/a%20b.fits\ncomp:list\ninclude:metadata\nrestype:container'
+
+def test__azure_auth__shared_key(azure_environment, range_server):
+    from astro_cloud.fits import CloudService, HeaderCache, load_headers
+
+    azure_environment.setenv('AZURE_STORAGE_ACCOUNT', 'devaccount')
+    azure_environment.setenv('AZURE_STORAGE_KEY', ACCOUNT_KEY)
+    range_server.shared_keys = {'devaccount': ACCOUNT_KEY}
+    url = f'{range_server.base_url}/synthetic.fits'
+    cache = HeaderCache()
+    assert len(load_headers(url, CloudService.BlobStorage, cache=cache)) == 4
+    # The conditional revalidation signs If-None-Match too
+    assert len(load_headers(url, CloudService.BlobStorage, cache=cache)) == 4
+    assert range_server.signature_failures == 0
+    assert range_server.request_headers[-1]['Authorization'].startswith('SharedKey devaccount:')
+
+    azure_environment.setenv('AZURE_STORAGE_KEY', 'd3Jvbmcta2V5')
+    with pytest.raises(NotImplementedError):
+        load_headers(url, CloudService.BlobStorage)
+
+def test__azure_auth__shared_key__escaped_blob_name(azure_environment, range_server, synthetic_fits_filepath):
+    import os
+    import shutil
+
+    from astro_cloud.fits import CloudService, load_headers
+
+    azure_environment.setenv('AZURE_STORAGE_ACCOUNT', 'devaccount')
+    azure_environment.setenv('AZURE_STORAGE_KEY', ACCOUNT_KEY)
+    range_server.shared_keys = {'devaccount': ACCOUNT_KEY}
+    shutil.copy(synthetic_fits_filepath, os.path.join(range_server.directory, 'sector 22+cam1.fits'))
+    assert len(load_headers(f'{range_server.base_url}/sector%2022%2Bcam1.fits', CloudService.BlobStorage)) == 4
+    assert range_server.signature_failures == 0
+    assert range_server.request_log[-1][0].startswith('/sector%2022%2Bcam1.fits')
+
+def test__azure_auth__sas(azure_environment, range_server):
+    from astro_cloud.fits import CloudService, load_headers
+
+    azure_environment.setenv('AZURE_STORAGE_SAS_TOKEN', '?sv=2021-08-06&sig=abc%3D')
+    assert len(load_headers(f'{range_server.base_url}/synthetic.fits', CloudService.BlobStorage)) == 4
+    assert all(path.endswith('/synthetic.fits?sv=2021-08-06&sig=abc%3D') for path, _ in range_server.request_log)
+
+def test__azure_auth__client_secret(azure_environment, range_server):
+    from astro_cloud.fits import CloudService, load_headers_many
+
+    azure_environment.setenv('AZURE_TENANT_ID', 'tenant')
+    azure_environment.setenv('AZURE_CLIENT_ID', 'client-id')
+    azure_environment.setenv('AZURE_CLIENT_SECRET', 'client-secret')
+    azure_environment.setenv('AZURE_AUTHORITY_HOST', range_server.base_url)
+    range_server.bearer_tokens = set()
+    range_server.token_latency = 0.1
+    urls = [f'{range_server.base_url}/synthetic.fits'] * 8
+    results = list(load_headers_many(urls, CloudService.BlobStorage, max_workers=8, max_per_host=8))
+    assert all(result.error is None for result in results)
+    assert range_server.token_requests == 1
+    path, grant = range_server.token_request_log[0]
+    assert path == '/tenant/oauth2/v2.0/token'
+    assert grant['grant_type'] == 'client_credentials'
+    assert grant['scope'] == 'https://storage.azure.com/.default'
+    assert range_server.request_headers[-1]['x-ms-version'] >= '2017-11-09'
@@ -1,4 +1,25 @@
-def test__digital_ocean_auth():
-    import requests
+import pytest
 
-    from astro_cloud.auth.digital_ocean import DigitalOceanAuth
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__load_spaces_auth_context(monkeypatch):
+    from astro_cloud.auth.digital_ocean import load_spaces_auth_context
+
+    monkeypatch.setenv('SPACES_ACCESS_KEY_ID', 'spaces-key')
+    monkeypatch.setenv('SPACES_SECRET_ACCESS_KEY', 'spaces-secret')
+    monkeypatch.delenv('SPACES_REGION', raising=False)
+    assert load_spaces_auth_context('nyc3.digitaloceanspaces.com').region == 'nyc3'
+    assert load_spaces_auth_context('bucket.sfo2.digitaloceanspaces.com').region == 'sfo2'
+    assert load_spaces_auth_context('bucket.sfo2.digitaloceanspaces.com').access_key == 'spaces-key'
+    assert load_spaces_auth_context('127.0.0.1:8080').region == 'us-east-1'
+
+def test__digital_ocean_auth(monkeypatch, range_server):
+    from astro_cloud.fits import CloudService, load_headers
+
+    monkeypatch.setenv('SPACES_ACCESS_KEY_ID', 'spaces-key')
+    monkeypatch.setenv('SPACES_SECRET_ACCESS_KEY', 'spaces-secret')
+    monkeypatch.setenv('SPACES_REGION', 'ams3')
+    range_server.credentials = {'spaces-key': 'spaces-secret'}
+    assert len(load_headers(f'{range_server.base_url}/synthetic.fits', CloudService.Spaces)) == 4
+    assert '/ams3/s3/aws4_request' in range_server.request_headers[-1]['Authorization']
+    assert range_server.signature_failures == 0
@@ -1,5 +1,137 @@
-def test__gcp_auth():
+import json
+import pytest
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+@pytest.fixture
+def gcp_environment(monkeypatch, tmp_path):
+    from astro_cloud.auth import gcp as auth_gcp
+    from astro_cloud.auth.gcp import invalidate_gcp_credentials
+    from astro_cloud.auth.tokens import clear_token_caches
+
+    for name in ['GOOGLE_APPLICATION_CREDENTIALS', 'GCS_HMAC_ACCESS_KEY_ID', 'GCS_HMAC_SECRET', 'GCE_METADATA_HOST']:
+        monkeypatch.delenv(name, raising=False)
+
+    monkeypatch.setattr(auth_gcp, 'GCP_CREDENTIAL_FILE_LOCATION', str(tmp_path / 'missing.json'))
+    monkeypatch.setattr(auth_gcp, 'GCE_PRODUCT_NAME_FILE', str(tmp_path / 'product_name'))
+    invalidate_gcp_credentials()
+    clear_token_caches()
+    yield monkeypatch
+    invalidate_gcp_credentials()
+    clear_token_caches()
+
+def test__gcp_auth__anonymous(gcp_environment):
     import requests
 
+    from astro_cloud.auth.gcp import GCPAuth, GCPCredentialKind, load_gcp_credentials
+
+    assert load_gcp_credentials().kind == GCPCredentialKind.Anonymous
+    prepared = requests.Request('GET', 'https://storage.googleapis.com/bucket/file.fits', auth=GCPAuth()).prepare()
+    assert 'Authorization' not in prepared.headers
+
+def test__gcp_auth__authorized_user(gcp_environment, range_server, tmp_path):
+    from astro_cloud.fits import CloudService, load_headers_many
+
+    credentials_filepath = tmp_path / 'application_default_credentials.json'
+    credentials_filepath.write_text(json.dumps({
+        'type': 'authorized_user',
+        'client_id': 'client-id',
+        'client_secret': 'client-secret',
+        'refresh_token': 'refresh-token',
+        'token_uri': f'{range_server.base_url}/token',
+    }))
+    gcp_environment.setenv('GOOGLE_APPLICATION_CREDENTIALS', str(credentials_filepath))
+    range_server.bearer_tokens = set()
+    range_server.token_latency = 0.1
+    urls = [f'{range_server.base_url}/synthetic.fits'] * 8
+    results = list(load_headers_many(urls, CloudService.ObjectStorage, max_workers=8, max_per_host=8))
+    assert all(result.error is None and len(result.headers) == 4 for result in results)
+    # Eight concurrent walks share the one token
+    assert range_server.token_requests == 1
+    assert range_server.token_request_log[0][1]['grant_type'] == 'refresh_token'
+    assert range_server.token_request_log[0][1]['refresh_token'] == 'refresh-token'
+    assert range_server.request_headers[-1]['Authorization'] == 'Bearer token-1'
+
+def test__gcp_auth__refused_without_token(gcp_environment, range_server):
+    from astro_cloud.fits import CloudService, load_headers
+
+    range_server.bearer_tokens = {'token-issued-elsewhere'}
+    with pytest.raises(NotImplementedError):
+        load_headers(f'{range_server.base_url}/synthetic.fits', CloudService.ObjectStorage)
+
+def test__gcp_auth__metadata_server(gcp_environment, range_server):
+    from astro_cloud.auth.gcp import GCPAuth, GCPCredentialKind, load_gcp_credentials
+    from astro_cloud.fits.index.base import load_headers
+
+    gcp_environment.setenv('GCE_METADATA_HOST', range_server.base_url.split('//', 1)[1])
+    assert load_gcp_credentials().kind == GCPCredentialKind.Metadata
+    for _ in range(3):
+        assert len(load_headers(f'{range_server.base_url}/synthetic.fits', GCPAuth())) == 4
+
+    assert range_server.token_requests == 1
+
+@pytest.mark.asyncio
+async def test__gcp_auth__async_token_fetch_off_loop(gcp_environment, range_server):
+    import asyncio
+    import time
+
+    from astro_cloud.auth.gcp import GCPAuth
+    from astro_cloud.transport import AsyncTransport
+
+    gcp_environment.setenv('GCE_METADATA_HOST', range_server.base_url.split('//', 1)[1])
+    range_server.token_latency = 0.5
+    gaps = []
+
+    async def tick():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.ensure_future(tick())
+    try:
+        async with AsyncTransport() as transport:
+            response = await transport.read_range(f'{range_server.base_url}/synthetic.fits', 0, 79, GCPAuth())
+    finally:
+        ticker.cancel()
+
+    assert response.status_code == 206
+    assert range_server.token_requests == 1
+    assert len(gaps) > 10 and max(gaps) < 0.25
+
+def test__gcp_auth__hmac(gcp_environment, range_server):
+    from astro_cloud.auth.gcp import GCPAuth
+    from astro_cloud.fits.index.base import load_headers
+
+    gcp_environment.setenv('GCS_HMAC_ACCESS_KEY_ID', 'GOOG1EXAMPLE')
+    gcp_environment.setenv('GCS_HMAC_SECRET', 'hmac-secret')
+    range_server.credentials = {'GOOG1EXAMPLE': 'hmac-secret'}
+    assert len(load_headers(f'{range_server.base_url}/synthetic.fits', GCPAuth())) == 4
+    assert '/auto/s3/aws4_request' in range_server.request_headers[-1]['Authorization']
+    assert range_server.signature_failures == 0
+
+def test__gcp_auth__service_account(gcp_environment, range_server, tmp_path):
+    pytest.importorskip('cryptography')
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
     from astro_cloud.auth.gcp import GCPAuth
+    from astro_cloud.fits.index.base import load_headers
 
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    credentials_filepath = tmp_path / 'service-account.json'
+    credentials_filepath.write_text(json.dumps({
+        'type': 'service_account',
+        'client_email': 'indexer@project.iam.gserviceaccount.com',
+        'private_key': private_key.decode('ascii'),
+        'token_uri': f'{range_server.base_url}/token',
+    }))
+    gcp_environment.setenv('GOOGLE_APPLICATION_CREDENTIALS', str(credentials_filepath))
+    assert len(load_headers(f'{range_server.base_url}/synthetic.fits', GCPAuth())) == 4
+    grant = range_server.token_request_log[0][1]
+    assert grant['grant_type'] == 'urn:ietf:params:oauth:grant-type:jwt-bearer'
+    assert grant['assertion'].count('.') == 2
@@ -0,0 +1,69 @@
+import pytest
+
+def test__token_cache__single_fetch():
+    import threading
+    import time
+
+    from astro_cloud.auth.tokens import Token, TokenCache
+
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        time.sleep(0.1)
+        return Token(f'token-{len(fetches)}', time.time() + 3600)
+
+    token_cache = TokenCache(fetch)
+    barrier = threading.Barrier(16)
+    values = []
+
+    def get():
+        barrier.wait()
+        values.append(token_cache.get())
+
+    threads = [threading.Thread(target=get) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    assert values == ['token-1'] * 16
+
+def test__token_cache__refreshes_before_expiry(monkeypatch):
+    from astro_cloud.auth import tokens
+    from astro_cloud.auth.tokens import Token, TokenCache
+
+    now = [1000.0]
+    monkeypatch.setattr(tokens.time, 'time', lambda: now[0])
+    issued = []
+
+    def fetch():
+        issued.append(1)
+        if len(issued) == 3:
+            raise NotImplementedError('Unable to handle HTTP Code: 503')
+
+        return Token(f'token-{len(issued)}', now[0] + 600)
+
+    token_cache = TokenCache(fetch, refresh_margin=60)
+    assert token_cache.get() == 'token-1'
+    now[0] += 500
+    assert token_cache.get() == 'token-1'
+    now[0] += 50
+    # Inside the margin the token is replaced while the old one still works
+    assert token_cache.get() == 'token-2'
+    now[0] += 560
+    # A failed early refresh keeps the current token, one that has expired has to be replaced
+    assert token_cache.get() == 'token-2'
+    now[0] += 100
+    assert token_cache.get() == 'token-4'
+    assert token_cache.refreshes == 3
+
+def test__get_token_cache__shared():
+    from astro_cloud.auth.tokens import Token, clear_token_caches, get_token_cache
+
+    clear_token_caches()
+    first = get_token_cache(('test', 'a'), lambda: Token('a', 0))
+    assert get_token_cache(('test', 'a'), lambda: Token('b', 0)) is first
+    assert get_token_cache(('test', 'b'), lambda: Token('b', 0)) is not first
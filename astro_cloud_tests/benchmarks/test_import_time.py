@@ -0,0 +1,43 @@
+import subprocess
+import sys
+import typing
+
+# Cold import budgets in microseconds, the best of IMPORT_TIME_RUNS fresh interpreters. They sit well above what the
+#   lazy imports cost today, so only a heavy dependency sneaking back onto the import path trips them
+IMPORT_TIME_RUNS: int = 5
+FITS_IMPORT_BUDGET: int = 50_000
+OWN_MODULES_IMPORT_BUDGET: int = 75_000
+HEAVY_MODULES: typing.List[str] = ['astropy', 'numpy', 'aiohttp']
+
+def measure_import(module: str) -> typing.Dict[str, typing.Tuple[int, int]]:
+    '''
+    Imports module in a fresh interpreter and returns the self and cumulative microseconds of every module it loaded
+    '''
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    timings: typing.Dict[str, typing.Tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return timings
+
+def best_of(module: str) -> typing.Dict[str, typing.Tuple[int, int]]:
+    runs = [measure_import(module) for _ in range(IMPORT_TIME_RUNS)]
+    return min(runs, key=lambda timings: timings[module][1])
+
+def test__import_time__fits():
+    timings = best_of('astro_cloud.fits')
+    loaded = set(timings)
+    assert not [name for name in loaded if name.split('.')[0] in HEAVY_MODULES + ['requests']]
+    assert 'astro_cloud.fits.index.aws' not in loaded
+    assert timings['astro_cloud.fits'][1] < FITS_IMPORT_BUDGET
+
+def test__import_time__provider():
+    timings = best_of('astro_cloud.fits.index.aws')
+    assert not [name for name in timings if name.split('.')[0] in HEAVY_MODULES]
+    own = sum(self_us for name, (self_us, _) in timings.items() if name.split('.')[0] == 'astro_cloud')
+    assert own < OWN_MODULES_IMPORT_BUDGET
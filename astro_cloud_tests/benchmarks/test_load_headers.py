@@ -0,0 +1,136 @@
+import os
+import pytest
+
+from astro_cloud_tests.pytest_benchmark import BUNDLED_FITS_FILES, bundled_fits_filepath, measure, \
+    write_many_hdu_fits
+from astro_cloud_tests.pytest_utils import aws_credential_filepath, synthetic_fits_filepath
+
+MANY_HDU_COUNT: int = 256
+
+@pytest.fixture(scope='module')
+def many_hdu_filepath(tmp_path_factory):
+    filepath = os.path.join(str(tmp_path_factory.mktemp('benchmarks')), 'many-hdu.fits')
+    write_many_hdu_fits(filepath, MANY_HDU_COUNT)
+    return filepath
+
+def serve(directory: str, **kwargs) -> 'RangeServer':
+    from astro_cloud_tests.pytest_server import RangeServer
+
+    return RangeServer(directory, **kwargs).start()
+
+@pytest.mark.parametrize('filename', BUNDLED_FITS_FILES)
+def test__load_headers__bundled(filename, record_property):
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    filepath = bundled_fits_filepath(filename)
+    server = serve(os.path.dirname(filepath))
+    try:
+        with Transport() as transport:
+            result = measure(server, filename,
+                lambda: load_headers(f'{server.base_url}/{filename}', None, transport=transport))
+
+    finally:
+        server.stop()
+
+    print(result.report())
+    record_property(filename, result._asdict())
+    with fits.open(filepath) as hdu_list:
+        assert result.headers == len(hdu_list)
+
+    assert result.requests <= result.headers + 1
+    assert result.bytes_sent < os.path.getsize(filepath)
+
+def test__load_headers__many_hdu(many_hdu_filepath, record_property):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    server = serve(os.path.dirname(many_hdu_filepath))
+    try:
+        with Transport() as transport:
+            result = measure(server, 'many-hdu',
+                lambda: load_headers(f'{server.base_url}/many-hdu.fits', None, transport=transport))
+            cold_connections = server.connection_count
+
+    finally:
+        server.stop()
+
+    print(result.report())
+    record_property('many-hdu', result._asdict())
+    assert result.headers == MANY_HDU_COUNT + 1
+    # One request per header at most, over a single kept-alive connection, reading headers and not data
+    assert result.requests <= result.headers
+    assert cold_connections == 1
+    assert result.bytes_sent <= result.headers * 2880 * 2
+
+def test__load_headers__latency(many_hdu_filepath, record_property):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    latency = 0.002
+    server = serve(os.path.dirname(many_hdu_filepath), latency=latency)
+    try:
+        with Transport() as transport:
+            result = measure(server, 'many-hdu-latency',
+                lambda: load_headers(f'{server.base_url}/many-hdu.fits', None, transport=transport))
+
+    finally:
+        server.stop()
+
+    print(result.report())
+    record_property('many-hdu-latency', result._asdict())
+    assert result.wall_time >= result.requests * latency
+    # Waiting on the network doesn't cost CPU
+    assert result.cpu_time < result.wall_time
+
+def test__load_headers__bandwidth(synthetic_fits_filepath, record_property):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    bandwidth = 512 * 1024
+    server = serve(os.path.dirname(synthetic_fits_filepath), bandwidth=bandwidth)
+    try:
+        with Transport() as transport:
+            result = measure(server, 'synthetic-bandwidth',
+                lambda: load_headers(f'{server.base_url}/synthetic.fits', None, transport=transport))
+
+    finally:
+        server.stop()
+
+    print(result.report())
+    record_property('synthetic-bandwidth', result._asdict())
+    assert result.headers == 4
+    assert result.wall_time >= result.bytes_sent / bandwidth * 0.9
+
+def test__load_headers__sigv4(synthetic_fits_filepath, aws_credential_filepath, monkeypatch, record_property):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.fits.datatypes import PaymentSolution
+    from astro_cloud.fits.index.aws import load_headers
+    from astro_cloud.transport import Transport
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    for key in ['AWS_PROFILE', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_DEFAULT_REGION']:
+        monkeypatch.delenv(key, raising=False)
+
+    server = serve(os.path.dirname(synthetic_fits_filepath), credentials={'one': 'two'})
+    url = f'{server.base_url}/synthetic.fits'
+    try:
+        with Transport() as transport:
+            result = measure(server, 'synthetic-sigv4',
+                lambda: load_headers(url, PaymentSolution.AWSRequestPayer, transport=transport))
+            assert server.signature_failures == 0
+
+            server.credentials = {'one': 'not-two'}
+            with pytest.raises(NotImplementedError):
+                load_headers(url, PaymentSolution.AWSRequestPayer, transport=transport)
+
+            assert server.signature_failures == 1
+
+    finally:
+        server.stop()
+
+    print(result.report())
+    record_property('synthetic-sigv4', result._asdict())
+    assert result.headers == 4
@@ -1,7 +1,7 @@
 import json
 import pytest
 
-from astro_cloud_tests.pytest_utils import fits_files
+from astro_cloud_tests.pytest_utils import fits_files, range_server, synthetic_fits_filepath, aws_credential_filepath
 
 def test__load_headers__aws__request_payer(fits_files):
     from astro_cloud.fits.datatypes import PaymentSolution
@@ -12,3 +12,16 @@ def test__load_headers__aws__request_payer(fits_files):
         for key, value in local_header.items():
             assert value == fits_headers[header_idx].fits[key]
 
+
+@pytest.mark.asyncio
+async def test__aload_headers__aws__signed(range_server, aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.fits.datatypes import PaymentSolution
+    from astro_cloud.fits.index.aws import aload_headers
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    url = f'{range_server.base_url}/synthetic.fits'
+    fits_headers = [header async for header in aload_headers(url, PaymentSolution.AWSRequestPayer)]
+    assert len(fits_headers) == 4
+    assert range_server.request_headers[-1]['x-amz-request-payer'] == 'requester'
+    assert range_server.request_headers[-1]['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=one/')
@@ -0,0 +1,175 @@
+import pytest
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__load_headers__local_server(range_server, synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import load_headers
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    fits_headers = load_headers(url, auth=None)
+    local_headers = [hdu.header for hdu in fits.open(synthetic_fits_filepath)]
+    assert len(fits_headers) == len(local_headers)
+    for fits_header, local_header in zip(fits_headers, local_headers):
+        for key, value in local_header.items():
+            assert value == fits_header.fits[key]
+
+def test__load_headers__offsets(range_server, synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import load_headers
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    fits_headers = load_headers(url, auth=None)
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        for fits_header, hdu in zip(fits_headers, hdu_list):
+            info = hdu.fileinfo()
+            assert fits_header.offset == info['hdrLoc']
+            assert fits_header.offset + fits_header.length == info['datLoc']
+
+def test__load_headers__shared_transport(range_server):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport() as transport:
+        load_headers(url, auth=None, transport=transport)
+        load_headers(url, auth=None, transport=transport)
+
+    assert range_server.connection_count == 1
+
+def test__load_headers__read_ahead(range_server, synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    fits_headers = load_headers(url, auth=None, read_ahead=ReadAheadConfig(initial_blocks=2))
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        assert len(fits_headers) == len(hdu_list)
+        for fits_header, hdu in zip(fits_headers, hdu_list):
+            assert fits_header.offset == hdu.fileinfo()['hdrLoc']
+            assert fits_header.length == hdu.fileinfo()['datLoc'] - hdu.fileinfo()['hdrLoc']
+            for key, value in hdu.header.items():
+                assert value == fits_header.fits[key]
+
+def test__load_headers__read_ahead__fewer_requests(range_server):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    load_headers(url, auth=None)
+    single_block_requests = range_server.request_count
+    range_server.reset_stats()
+    load_headers(url, auth=None, read_ahead=ReadAheadConfig(initial_blocks=8))
+    # One request per HDU at most, and no trailing 416 once Content-Range reveals the file size
+    assert range_server.request_count <= 4
+    assert range_server.request_count < single_block_requests
+
+def test__header_scanner__keeps_bytes_past_end_card():
+    import io
+
+    import numpy as np
+
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import HeaderScanner
+
+    stream = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(np.zeros((2, 2), dtype='>f4'))]).writeto(stream)
+    content = stream.getvalue()
+    scanner = HeaderScanner()
+    headers = scanner.feed(content, len(content))
+    assert [header.offset for header in headers] == [0, 2880]
+    assert scanner.done
+
+@pytest.mark.asyncio
+async def test__aload_headers(range_server, synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import aload_headers
+    from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    fits_headers = [header async for header in aload_headers(url, auth=None, read_ahead=ReadAheadConfig())]
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        assert len(fits_headers) == len(hdu_list)
+        for fits_header, hdu in zip(fits_headers, hdu_list):
+            assert fits_header.offset == hdu.fileinfo()['hdrLoc']
+            for key, value in hdu.header.items():
+                assert value == fits_header.fits[key]
+
+@pytest.mark.asyncio
+async def test__aload_headers__shared_transport(range_server):
+    import asyncio
+
+    from astro_cloud.fits.index.base import aload_headers
+    from astro_cloud.transport import AsyncTransport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+
+    async def count_headers(transport):
+        return len([header async for header in aload_headers(url, auth=None, transport=transport)])
+
+    async with AsyncTransport() as transport:
+        counts = await asyncio.gather(*[count_headers(transport) for _ in range(5)])
+
+    assert counts == [4] * 5
+
+def test__iter_headers__early_cancellation(range_server):
+    from astro_cloud.fits.index.base import iter_headers
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    headers = iter_headers(url, auth=None)
+    assert range_server.request_count == 0
+    primary = next(headers)
+    assert primary.fits['SIMPLE'] is True
+    requests_for_primary = range_server.request_count
+    headers.close()
+    assert range_server.request_count == requests_for_primary
+    # 120 extra keywords push the primary header into 4 blocks
+    assert requests_for_primary == 4
+
+def test__prefetch_headers(range_server):
+    from astro_cloud.fits.index.base import iter_headers, prefetch_headers
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    headers = [header for header in prefetch_headers(iter_headers(url, auth=None), 2)]
+    assert [header.fits.get('EXTNAME', None) for header in headers] == [None, 'CUBE', 'TABLE', 'IMAGE']
+
+def test__prefetch_headers__cancellation():
+    import threading
+
+    from astro_cloud.fits.index.base import prefetch_headers
+
+    produced = []
+    closed = threading.Event()
+
+    def source():
+        try:
+            for idx in range(1000):
+                produced.append(idx)
+                yield idx
+
+        finally:
+            closed.set()
+
+    headers = prefetch_headers(source(), 2)
+    assert next(headers) == 0
+    headers.close()
+    assert closed.wait(timeout=5)
+    assert len(produced) < 10
+
+def test__prefetch_headers__error():
+    from astro_cloud.fits.index.base import prefetch_headers
+
+    def source():
+        yield 1
+        raise NotImplementedError('Unable to handle HTTP Code: 503')
+
+    headers = prefetch_headers(source(), 2)
+    assert next(headers) == 1
+    with pytest.raises(NotImplementedError):
+        next(headers)
@@ -0,0 +1,101 @@
+import os
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__header_cache__put_get(tmp_path):
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    cache = HeaderCache(os.path.join(str(tmp_path), 'headers.sqlite3'))
+    headers = [FITSHeader(0, 2880, fits.PrimaryHDU().header), FITSHeader(2880, 2880, fits.ImageHDU().header)]
+    cache.put('http://host/file.fits', '"etag"', None, headers)
+    cached = cache.get('http://host/file.fits')
+    assert cached.etag == '"etag"'
+    assert [(header.offset, header.length) for header in cached.headers] == [(0, 2880), (2880, 2880)]
+    assert cached.headers[1].fits['XTENSION'] == 'IMAGE'
+    assert cache.get('http://host/other.fits') is None
+
+def test__header_cache__lru_eviction(tmp_path):
+    import time
+
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    headers = [FITSHeader(0, 2880, fits.PrimaryHDU().header)]
+    cache = HeaderCache(os.path.join(str(tmp_path), 'headers.sqlite3'), max_bytes=2880 * 2)
+    cache.put('http://host/a.fits', '"a"', None, headers)
+    time.sleep(0.01)
+    cache.put('http://host/b.fits', '"b"', None, headers)
+    time.sleep(0.01)
+    assert cache.get('http://host/a.fits') is not None
+    time.sleep(0.01)
+    cache.put('http://host/c.fits', '"c"', None, headers)
+    assert 'http://host/a.fits' in cache
+    assert 'http://host/b.fits' not in cache
+    assert 'http://host/c.fits' in cache
+    assert cache.size() == 2880 * 2
+
+def test__header_cache__shared_between_processes(tmp_path):
+    import multiprocessing
+
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    path = os.path.join(str(tmp_path), 'headers.sqlite3')
+    HeaderCache(path)
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=put_from_process, args=(path, idx)) for idx in range(4)]
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = HeaderCache(path)
+    for idx in range(4):
+        assert cache.get(f'http://host/{idx}.fits').etag == f'"{idx}"'
+
+def put_from_process(path: str, idx: int) -> None:
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    cache = HeaderCache(path)
+    for _ in range(10):
+        cache.put(f'http://host/{idx}.fits', f'"{idx}"', None, [FITSHeader(0, 2880, fits.PrimaryHDU().header)])
+
+def test__iter_headers__cache_revalidation(range_server, synthetic_fits_filepath, tmp_path):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    cache = HeaderCache(os.path.join(str(tmp_path), 'headers.sqlite3'))
+    walked = load_headers(url, auth=None, cache=cache)
+    assert url in cache
+    range_server.reset_stats()
+    cached = load_headers(url, auth=None, cache=cache)
+    assert range_server.request_count == 1
+    assert 'If-None-Match' in range_server.request_headers[0]
+    assert [(header.offset, header.length) for header in cached] == \
+        [(header.offset, header.length) for header in walked]
+    assert cached[2].fits['EXTNAME'] == 'TABLE'
+
+def test__iter_headers__cache_stale(range_server, synthetic_fits_filepath, tmp_path):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    cache = HeaderCache(os.path.join(str(tmp_path), 'headers.sqlite3'))
+    load_headers(url, auth=None, cache=cache)
+    etag = cache.get(url).etag
+    os.utime(synthetic_fits_filepath, ns=(0, 0))
+    range_server.reset_stats()
+    headers = load_headers(url, auth=None, cache=cache)
+    assert len(headers) == 4
+    assert range_server.request_count > 1
+    assert cache.get(url).etag != etag
@@ -0,0 +1,92 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def write_gzipped_fits(directory: str) -> str:
+    '''
+    Noisy images, so the compressed file is large compared to a seek
+    '''
+    import numpy as np
+
+    from astropy.io import fits
+
+    rng = np.random.default_rng(7)
+    filepath = os.path.join(directory, 'noise.fits')
+    hdus = [fits.PrimaryHDU()] + [fits.ImageHDU(rng.normal(0, 100, (512, 512)).astype(np.int16), name=f'NOISE{idx}')
+        for idx in range(6)]
+    fits.HDUList(hdus).writeto(filepath, overwrite=True)
+    with open(filepath, 'rb') as source, gzip.open(f'{filepath}.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+
+    return filepath
+
+def test__range_file(range_server, synthetic_fits_filepath):
+    from astro_cloud.fits.index.gzipped import RangeFile
+
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        expected = stream.read()
+
+    raw = RangeFile(f'{range_server.base_url}/synthetic.fits', read_size=4096)
+    assert raw.size == len(expected)
+    assert raw.read(10) == expected[:10]
+    raw.seek(-100, os.SEEK_END)
+    assert raw.read() == expected[-100:]
+    raw.seek(5000)
+    assert raw.read(3000) == expected[5000:8000]
+    assert raw.etag is not None
+
+def test__load_headers__gzipped(range_server, synthetic_fits_filepath, tmp_path):
+    pytest.importorskip('indexed_gzip')
+
+    from astro_cloud.fits.index import gzipped, local
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.index.cache import HeaderCache
+
+    filepath = write_gzipped_fits(os.path.dirname(synthetic_fits_filepath))
+    compressed_size = os.path.getsize(f'{filepath}.gz')
+    url = f'{range_server.base_url}/noise.fits.gz'
+    expected = [(header.offset, header.length) for header in local.load_headers(filepath)]
+    with pytest.raises(NotImplementedError):
+        load_headers(url, auth=None)
+
+    index_cache = gzipped.GzipIndexCache(os.path.join(str(tmp_path), 'indexes'))
+    range_server.reset_stats()
+    headers = gzipped.load_headers(url, index_cache=index_cache, spacing=256 * 1024)
+    assert [(header.offset, header.length) for header in headers] == expected
+    assert headers[3].fits['EXTNAME'] == 'NOISE2'
+    # One pass over the file, and the index is saved
+    assert range_server.bytes_sent < compressed_size * 1.1
+    assert url in index_cache
+
+    range_server.reset_stats()
+    headers = gzipped.load_headers(url, index_cache=index_cache, spacing=256 * 1024)
+    assert [(header.offset, header.length) for header in headers] == expected
+    assert range_server.bytes_sent < compressed_size * 0.75
+
+    cache = HeaderCache(os.path.join(str(tmp_path), 'headers.sqlite3'))
+    gzipped.load_headers(url, index_cache=index_cache, cache=cache)
+    range_server.reset_stats()
+    headers = gzipped.load_headers(url, index_cache=index_cache, cache=cache)
+    assert [(header.offset, header.length) for header in headers] == expected
+    assert range_server.request_count == 1
+
+def test__read_range__gzipped(range_server, synthetic_fits_filepath, tmp_path):
+    pytest.importorskip('indexed_gzip')
+
+    from astro_cloud.fits.index import gzipped
+
+    filepath = write_gzipped_fits(os.path.dirname(synthetic_fits_filepath))
+    with open(filepath, 'rb') as stream:
+        expected = stream.read()
+
+    url = f'{range_server.base_url}/noise.fits.gz'
+    index_cache = gzipped.GzipIndexCache(os.path.join(str(tmp_path), 'indexes'))
+    assert gzipped.read_range(url, len(expected) - 3000, len(expected), index_cache=index_cache, spacing=256 * 1024) \
+        == expected[-3000:]
+    range_server.reset_stats()
+    assert gzipped.read_range(url, 1500000, 1510000, index_cache=index_cache) == expected[1500000:1510000]
+    assert range_server.bytes_sent < 512 * 1024
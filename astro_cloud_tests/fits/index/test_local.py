@@ -0,0 +1,66 @@
+import pytest
+
+from astro_cloud_tests.pytest_utils import synthetic_fits_filepath
+
+def test__url_to_path():
+    from astro_cloud.fits.index.local import url_to_path
+
+    assert url_to_path('file:///data/tess%20cube.fits') == '/data/tess cube.fits'
+    assert url_to_path('/data/tess.fits') == '/data/tess.fits'
+
+def test__load_headers(synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.local import load_headers
+
+    fits_headers = load_headers(f'file://{synthetic_fits_filepath}')
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        assert len(fits_headers) == len(hdu_list)
+        for fits_header, hdu in zip(fits_headers, hdu_list):
+            assert fits_header.offset == hdu.fileinfo()['hdrLoc']
+            assert fits_header.length == hdu.fileinfo()['datLoc'] - hdu.fileinfo()['hdrLoc']
+            for key, value in hdu.header.items():
+                assert value == fits_header.fits[key]
+
+def test__load_headers__matches_http(synthetic_fits_filepath):
+    from astro_cloud.fits.index.base import HeaderScanner
+    from astro_cloud.fits.index.local import load_headers
+
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        content = stream.read()
+
+    scanned = HeaderScanner().feed(content, len(content))
+    local = load_headers(synthetic_fits_filepath)
+    assert [(header.offset, header.length) for header in local] == \
+        [(header.offset, header.length) for header in scanned]
+
+def test__load_headers__dispatcher(synthetic_fits_filepath):
+    from astro_cloud.fits import load_headers, iter_headers, CloudService
+
+    assert len(load_headers(synthetic_fits_filepath, CloudService.FileSystem)) == 4
+    primary = next(iter_headers(synthetic_fits_filepath, CloudService.FileSystem))
+    assert primary.fits['SIMPLE'] is True
+
+def test__load_headers__empty_file(tmp_path):
+    from astro_cloud.fits.index.local import load_headers
+
+    filepath = tmp_path / 'empty.fits'
+    filepath.write_bytes(b'')
+    assert load_headers(str(filepath)) == []
+
+@pytest.mark.asyncio
+async def test__aload_headers__executor(synthetic_fits_filepath, monkeypatch):
+    import threading
+
+    from astro_cloud.fits.index import local
+
+    threads = []
+    walk_headers = local.walk_headers
+    def record_thread(buffer):
+        threads.append(threading.get_ident())
+        return walk_headers(buffer)
+
+    monkeypatch.setattr(local, 'walk_headers', record_thread)
+    fits_headers = [header async for header in local.aload_headers(synthetic_fits_filepath)]
+    assert len(fits_headers) == 4
+    assert threads and threads[0] != threading.get_ident()
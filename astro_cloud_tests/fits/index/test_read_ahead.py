@@ -0,0 +1,37 @@
+def test__adaptive_read_ahead__grows():
+    from astro_cloud.fits.index.read_ahead import AdaptiveReadAhead, ReadAheadConfig
+
+    policy = AdaptiveReadAhead(ReadAheadConfig(initial_blocks=2, max_blocks=16))
+    policy.observe(2, 3, 0.1, 2 * 2880)
+    assert policy.window == 4
+    policy.observe(4, 5, 0.1, 4 * 2880)
+    assert policy.window == 8
+    policy.observe(8, 9, 0.1, 8 * 2880)
+    policy.observe(16, 17, 0.1, 16 * 2880)
+    assert policy.window == 16
+
+def test__adaptive_read_ahead__shrinks_on_slow_links():
+    from astro_cloud.fits.index.read_ahead import AdaptiveReadAhead, ReadAheadConfig
+
+    policy = AdaptiveReadAhead(ReadAheadConfig(initial_blocks=32))
+    # 10ms round trip, 1MB/s: one round trip only carries ~3 blocks
+    policy.observe(1, 1, 0.010, 2880)
+    for _ in range(5):
+        policy.observe(32, 3, 0.010 + 32 * 2880 / 1e6, 32 * 2880)
+
+    assert policy.window == 3
+
+def test__adaptive_read_ahead__keeps_window_on_fast_links():
+    from astro_cloud.fits.index.read_ahead import AdaptiveReadAhead, ReadAheadConfig
+
+    policy = AdaptiveReadAhead(ReadAheadConfig(initial_blocks=32))
+    # 80ms round trip, 100MB/s: hundreds of blocks fit in one round trip
+    policy.observe(1, 1, 0.080, 2880)
+    policy.observe(32, 3, 0.080 + 32 * 2880 / 1e8, 32 * 2880)
+    assert policy.window == 32
+
+def test__adaptive_read_ahead__clamps():
+    from astro_cloud.fits.index.read_ahead import AdaptiveReadAhead, ReadAheadConfig
+
+    policy = AdaptiveReadAhead(ReadAheadConfig(initial_blocks=500, max_blocks=64))
+    assert policy.window == 64
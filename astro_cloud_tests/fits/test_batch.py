@@ -0,0 +1,125 @@
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__map_headers__completion_order():
+    import time
+
+    from astro_cloud.fits.batch import map_headers
+
+    def loader(url: str):
+        time.sleep(float(url.rsplit('/', 1)[-1]))
+        return [url]
+
+    urls = [f'http://host-{idx}/{delay}' for idx, delay in enumerate([0.3, 0.0, 0.15])]
+    results = list(map_headers(urls, loader, max_workers=3))
+    assert [result.url for result in results] == [urls[1], urls[2], urls[0]]
+    assert all(result.error is None for result in results)
+
+def test__map_headers__per_host_limit():
+    import threading
+    import time
+
+    from astro_cloud.fits.batch import map_headers
+
+    lock = threading.Lock()
+    running = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+
+    def loader(url: str):
+        host = url.split('/')[2]
+        with lock:
+            running[host] += 1
+            peak[host] = max(peak[host], running[host])
+
+        time.sleep(0.01)
+        with lock:
+            running[host] -= 1
+
+        return []
+
+    urls = (f'http://{host}/{idx}' for idx in range(20) for host in ['a', 'a', 'a', 'b'])
+    results = list(map_headers(urls, loader, max_workers=8, max_per_host=2))
+    assert len(results) == 80
+    assert peak == {'a': 2, 'b': 2}
+
+def test__map_headers__error_isolation():
+    from astro_cloud.fits.batch import map_headers
+
+    def loader(url: str):
+        if url.endswith('bad'):
+            raise NotImplementedError('Unable to handle HTTP Code: 404')
+
+        return [url]
+
+    results = {result.url: result for result in map_headers(['http://a/good', 'http://a/bad'], loader)}
+    assert results['http://a/good'].headers == ['http://a/good']
+    assert isinstance(results['http://a/bad'].error, NotImplementedError)
+    assert results['http://a/bad'].headers is None
+
+def test__load_headers_many(range_server, synthetic_fits_filepath):
+    import shutil
+
+    from astro_cloud.fits import load_headers_many, CloudService
+    from astro_cloud.fits.index.read_ahead import ReadAheadConfig
+
+    for idx in range(6):
+        shutil.copy(synthetic_fits_filepath, f'{range_server.directory}/copy-{idx}.fits')
+
+    urls = [f'{range_server.base_url}/copy-{idx}.fits' for idx in range(6)]
+    urls.append(f'{range_server.base_url}/missing.fits')
+    results = {result.url: result for result in load_headers_many(
+        urls, CloudService.ObjectStorage, max_workers=4, read_ahead=ReadAheadConfig())}
+    assert len(results) == 7
+    for url in urls[:-1]:
+        assert results[url].error is None
+        assert len(results[url].headers) == 4
+
+    assert results[urls[-1]].error is not None
+
+def test__pipeline_headers(range_server, synthetic_fits_filepath):
+    import shutil
+
+    from astro_cloud.fits import load_headers_many, CloudService
+    from astro_cloud.fits.batch import PipelineConfig
+
+    for idx in range(6):
+        shutil.copy(synthetic_fits_filepath, f'{range_server.directory}/copy-{idx}.fits')
+
+    urls = [f'{range_server.base_url}/copy-{idx}.fits' for idx in range(6)]
+    urls.append(f'{range_server.base_url}/missing.fits')
+    for parse_executor in ['thread', 'process']:
+        pipeline = PipelineConfig(parse_workers=2, parse_executor=parse_executor, max_pending=2)
+        results = {result.url: result for result in load_headers_many(
+            urls, CloudService.ObjectStorage, max_workers=4, pipeline=pipeline)}
+        assert len(results) == 7
+        for url in urls[:-1]:
+            assert results[url].error is None
+            assert all(header.materialized for header in results[url].headers)
+            assert [header.fits['EXTNAME'] for header in results[url].headers[1:]] == ['CUBE', 'TABLE', 'IMAGE']
+
+        assert results[urls[-1]].error is not None
+
+def test__pipeline_headers__backpressure():
+    import threading
+    import time
+
+    from astro_cloud.fits.batch import PipelineConfig, pipeline_headers
+    from astro_cloud.fits.datatypes import FITSHeader
+
+    raw = (b'SIMPLE  =                    T' + b' ' * 50 + b'END' + b' ' * 77).ljust(2880, b' ')
+    lock = threading.Lock()
+    loaded = []
+
+    def loader(url: str):
+        with lock:
+            loaded.append(url)
+
+        return [FITSHeader(0, 2880, raw=raw)]
+
+    results = pipeline_headers((f'http://a/{idx}' for idx in range(100)), loader, max_workers=2,
+        config=PipelineConfig(parse_workers=1, max_pending=3))
+    first = next(results)
+    time.sleep(0.2)
+    # Nothing is consumed, so fetching stalls once max_pending files are waiting
+    assert len(loaded) < 20
+    assert first.headers[0].fits['SIMPLE'] is True
+    results.close()
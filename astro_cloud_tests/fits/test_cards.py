@@ -0,0 +1,61 @@
+from astro_cloud_tests.pytest_utils import synthetic_fits_filepath
+
+def test__parse_card_value():
+    from astro_cloud.fits.cards import parse_card_value
+
+    assert parse_card_value(b"                   T / conforms to FITS standard") is True
+    assert parse_card_value(b"                   F") is False
+    assert parse_card_value(b"                 -32 / array data type") == -32
+    assert parse_card_value(b"              1.5D-3") == 1.5e-3
+    assert parse_card_value(b"'BINTABLE'           / binary table extension") == 'BINTABLE'
+    assert parse_card_value(b"'O''HARA / ZENITH'   ") == "O'HARA / ZENITH"
+
+def test__parse_structural_cards(synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.cards import STRUCTURAL_KEYWORDS, is_structural_keyword, parse_structural_cards
+
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        for hdu in hdu_list:
+            header_string = hdu.header.tostring()
+            cards = parse_structural_cards(header_string.encode('ascii'))
+            expected = {key: value for key, value in hdu.header.items() if is_structural_keyword(key)}
+            assert cards == expected
+            assert 'BITPIX' in cards and 'NAXIS' in cards
+            assert set(cards) - STRUCTURAL_KEYWORDS == {f'NAXIS{idx}' for idx in range(1, cards['NAXIS'] + 1)}
+
+def test__fits_header__lazy(synthetic_fits_filepath):
+    import pickle
+
+    from astro_cloud.fits.datatypes import FITSHeader
+    from astro_cloud.fits.index.local import load_headers
+
+    headers = load_headers(synthetic_fits_filepath)
+    assert not any(header.materialized for header in headers)
+    assert [header.cards.get('XTENSION', None) for header in headers] == [None, 'IMAGE', 'BINTABLE', 'IMAGE']
+
+    restored = pickle.loads(pickle.dumps(headers))
+    assert restored == headers
+    assert not any(header.materialized for header in restored)
+
+    offset, length, header = restored[2]
+    assert restored[2].materialized
+    assert (offset, length) == (headers[2].offset, headers[2].length)
+    assert header['TTYPE1'] == 'TIME'
+    assert FITSHeader(offset, length, header) == headers[2]
+
+def test__parse_structural_cards__memoryview(synthetic_fits_filepath):
+    from astropy.io import fits
+
+    from astro_cloud.fits.cards import parse_structural_cards
+
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        header_string = hdu_list['TABLE'].header.tostring().encode('ascii')
+        expected = parse_structural_cards(header_string)
+
+    buffer = bytearray(b' ' * 2880 + header_string)
+    view = memoryview(buffer)
+    assert parse_structural_cards(view, 2880, len(buffer)) == expected
+    view.release()
+    # Resizing fails while any view of the bytearray is still exported
+    buffer.extend(b' ' * 2880)
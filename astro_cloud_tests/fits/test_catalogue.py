@@ -0,0 +1,89 @@
+import os
+import typing
+
+def make_chain(camera: int, exposure: float, target: str) -> typing.List['FITSHeader']:
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+
+    primary = fits.PrimaryHDU().header
+    primary['CAMERA'] = camera
+    primary['OBJECT'] = target
+    primary['SIMULATD'] = camera % 2 == 0
+    image = fits.ImageHDU().header
+    image['EXPOSURE'] = exposure
+    image['OBJECT'] = target
+    return [FITSHeader(0, 2880, primary), FITSHeader(2880, 2880, image)]
+
+def test__header_catalogue__query(tmp_path):
+    from astro_cloud.fits.catalogue import HeaderCatalogue
+
+    catalogue = HeaderCatalogue(os.path.join(str(tmp_path), 'catalogue.sqlite3'), keywords=['camera', 'EXPOSURE'],
+        batch_size=3)
+    added = catalogue.add_many((f'http://host/{idx}.fits', make_chain(idx % 4 + 1, idx * 100.0, f'TIC {idx}'))
+        for idx in range(20))
+    assert added == len(catalogue) == 40
+    assert catalogue.keywords == ['CAMERA', 'EXPOSURE']
+
+    cameras = catalogue.query([('CAMERA', '=', 4)])
+    # Ordered by url, then HDU index
+    assert [(header.url, header.hdu) for header in cameras] == \
+        sorted((f'http://host/{idx}.fits', 0) for idx in [3, 7, 11, 15, 19])
+    assert not any(header.materialized for header in cameras)
+    assert cameras[0].fits['OBJECT'] == 'TIC 11'
+    assert cameras[0].cards['SIMPLE'] is True
+
+    exposures = catalogue.query([('EXPOSURE', '>', 1000), ('EXPOSURE', '<=', 1500)])
+    assert sorted(header.fits['EXPOSURE'] for header in exposures) == [1100.0, 1200.0, 1300.0, 1400.0, 1500.0]
+    assert len(catalogue.query([('exposure', '>=', 0)], limit=3)) == 3
+    assert len(catalogue.get('http://host/5.fits')) == 2
+
+def test__header_catalogue__index_keywords(tmp_path):
+    import pytest
+
+    from astro_cloud.fits.catalogue import HeaderCatalogue
+
+    path = os.path.join(str(tmp_path), 'catalogue.sqlite3')
+    catalogue = HeaderCatalogue(path, keywords=['CAMERA'])
+    for idx in range(6):
+        catalogue.add(f'http://host/{idx}.fits', make_chain(idx % 2 + 1, 10.0, 'TIC 1' if idx < 3 else 'TIC 2'))
+
+    with pytest.raises(ValueError):
+        catalogue.query([('OBJECT', '=', 'TIC 2')])
+
+    # Re-opening with more keywords back-fills them from the stored headers
+    catalogue = HeaderCatalogue(path, keywords=['OBJECT', 'SIMULATD'])
+    assert catalogue.keywords == ['CAMERA', 'OBJECT', 'SIMULATD']
+    assert len(catalogue.query([('OBJECT', '=', 'TIC 2'), ('CAMERA', '=', 2)])) == 2
+    assert len(catalogue.query([('OBJECT', '=', 'TIC 2')])) == 6
+    assert [header.url for header in catalogue.query([('SIMULATD', '=', True)])] == \
+        [f'http://host/{idx}.fits' for idx in [1, 3, 5]]
+
+def test__header_catalogue__replace_and_results(tmp_path):
+    from astro_cloud.fits.batch import HeaderResult
+    from astro_cloud.fits.catalogue import HeaderCatalogue
+
+    catalogue = HeaderCatalogue(os.path.join(str(tmp_path), 'catalogue.sqlite3'), keywords=['CAMERA'])
+    catalogue.add_many([
+        HeaderResult('http://host/a.fits', make_chain(1, 1.0, 'A'), None),
+        HeaderResult('http://host/b.fits', None, IOError('unreachable')),
+    ])
+    assert 'http://host/a.fits' in catalogue and 'http://host/b.fits' not in catalogue
+    catalogue.add('http://host/a.fits', make_chain(2, 1.0, 'A')[:1])
+    assert len(catalogue) == 1
+    assert catalogue.query([('CAMERA', '=', 1)]) == []
+    assert len(catalogue.query([('CAMERA', '=', 2)])) == 1
+    catalogue.remove('http://host/a.fits')
+    assert len(catalogue) == 0
+
+def test__header_catalogue__uses_indexes(tmp_path):
+    import sqlite3
+
+    from astro_cloud.fits.catalogue import HeaderCatalogue
+
+    path = os.path.join(str(tmp_path), 'catalogue.sqlite3')
+    HeaderCatalogue(path, keywords=['CAMERA'])
+    connection = sqlite3.connect(path)
+    plan = ' '.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN SELECT h.url FROM hdus h WHERE h.id IN '
+        '(SELECT hdu_id FROM cards WHERE keyword = ? AND number > ?)', ('CAMERA', 1)))
+    assert 'cards_number' in plan
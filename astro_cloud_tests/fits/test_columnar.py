@@ -0,0 +1,84 @@
+import typing
+
+import pytest
+
+def make_chain(camera: int, exposure: typing.Any, target: str) -> typing.List['FITSHeader']:
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+
+    primary = fits.PrimaryHDU().header
+    primary['CAMERA'] = camera
+    primary['OBJECT'] = target
+    primary['COMMENT'] = 'not a column'
+    image = fits.ImageHDU().header
+    if exposure is not None:
+        image['EXPOSURE'] = exposure
+
+    return [FITSHeader(0, 2880, primary), FITSHeader(2880, 2880, image)]
+
+def test__columnar_builder__to_numpy():
+    import numpy as np
+
+    from astro_cloud.fits.columnar import ColumnarBuilder
+
+    builder = ColumnarBuilder(chunk_size=3)
+    # Integer exposures in the first chunk become float once a float one turns up
+    exposures = [100, 200, None, 300.5, 400, None, 500]
+    added = builder.extend([(f'http://host/{idx}.fits', make_chain(idx % 4 + 1, exposure, f'TIC {idx}'))
+        for idx, exposure in enumerate(exposures)] + [('http://host/failed.fits', None)])
+    assert added == len(builder) == 14
+    assert builder.columns[:4] == ['url', 'hdu', 'offset', 'length']
+    assert 'COMMENT' not in builder.columns
+
+    table = builder.to_numpy()
+    assert table.shape == (14, )
+    assert table['CAMERA'].dtype == np.int64
+    assert table['EXPOSURE'].dtype == np.float64
+    assert table['SIMPLE'].dtype == np.bool_
+    assert list(table['hdu']) == [0, 1] * 7
+    assert table['url'][4] == 'http://host/2.fits'
+    assert table['OBJECT'][12] == 'TIC 6'
+    assert table['CAMERA'].mask.tolist() == [False, True] * 7
+    assert table['EXPOSURE'].compressed().tolist() == [100.0, 200.0, 300.5, 400.0, 500.0]
+
+    selected = table[(table['CAMERA'] == 4) | (table['EXPOSURE'] > 350)]
+    assert sorted(set(selected['url'].tolist())) == ['http://host/3.fits', 'http://host/4.fits', 'http://host/6.fits']
+
+def test__columnar_builder__promoted_to_string():
+    from astro_cloud.fits.columnar import ColumnarBuilder
+
+    builder = ColumnarBuilder(chunk_size=1)
+    # The numeric chunks are sealed before the string turns up, they mustn't be cut to the string's width
+    for idx, value in enumerate([123456.789, True, 'a']):
+        builder.add_chain(f'http://host/{idx}.fits', make_chain(idx, value, 'TIC'))
+
+    table = builder.to_numpy()
+    assert table['EXPOSURE'].compressed().tolist() == ['123456.789', 'True', 'a']
+
+def test__columnar_builder__keywords():
+    from astro_cloud.fits.columnar import ColumnarBuilder
+
+    builder = ColumnarBuilder(keywords=['camera', 'OBJECT'])
+    builder.add_chain('http://host/0.fits', make_chain(1, 10.0, 'TIC 0'))
+    builder.add(make_chain(2, None, 'TIC 1')[0])
+    assert builder.columns == ['url', 'hdu', 'offset', 'length', 'CAMERA', 'OBJECT']
+
+    table = builder.to_numpy()
+    assert table['CAMERA'].tolist() == [1, None, 2]
+    assert table['url'].tolist() == ['http://host/0.fits', 'http://host/0.fits', None]
+
+def test__columnar_builder__to_arrow():
+    pyarrow = pytest.importorskip('pyarrow')
+
+    from astro_cloud.fits.columnar import ColumnarBuilder
+
+    builder = ColumnarBuilder(chunk_size=4)
+    builder.extend((f'http://host/{idx}.fits', make_chain(idx, idx * 10, f'TIC {idx}')) for idx in range(5))
+    table = builder.to_arrow()
+    assert table.num_rows == 10
+    assert len(table.column('CAMERA').chunks) == 3
+    assert table.schema.field('CAMERA').type == pyarrow.int64()
+    assert table.schema.field('OBJECT').type == pyarrow.string()
+    assert table.column('CAMERA').null_count == 5
+    assert table.column('EXPOSURE').to_pylist() == [None, 0, None, 10, None, 20, None, 30, None, 40]
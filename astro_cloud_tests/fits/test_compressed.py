@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def write_compressed_fits(filepath: str) -> None:
+    import numpy as np
+
+    from astropy.io import fits
+
+    rng = np.random.default_rng(42)
+    counts = rng.normal(30000, 500, (300, 400)).astype(np.uint16)
+    flux = rng.normal(0, 1, (300, 400)).astype(np.float32)
+    flux[5, 5] = np.nan
+    flux[6, 6] = 0
+    fits.HDUList([
+        fits.PrimaryHDU(),
+        fits.CompImageHDU(counts, compression_type='RICE_1', tile_shape=(32, 64), name='RICE'),
+        fits.CompImageHDU(counts.astype(np.int32), compression_type='GZIP_2', name='ROWS'),
+        fits.CompImageHDU(flux, compression_type='RICE_1', tile_shape=(50, 50), quantize_method=1, name='DITHER1'),
+        fits.CompImageHDU(flux, compression_type='GZIP_1', tile_shape=(50, 50), quantize_method=2, name='DITHER2'),
+        fits.CompImageHDU(flux, compression_type='GZIP_1', tile_shape=(50, 50), quantize_level=0.0, name='LOSSLESS'),
+    ]).writeto(filepath, overwrite=True)
+
+def test__dither_random_values():
+    import numpy as np
+
+    from astro_cloud.fits.compressed import dither_random_values
+
+    values = dither_random_values()
+    assert values.shape == (10000, )
+    assert values[0] == np.float32(16807 / 2147483647)
+    assert 0 < values.min() and values.max() < 1
+
+def test__rice_decode():
+    import numpy as np
+
+    from astro_cloud.fits.compressed import rice_decode
+
+    _codecs = pytest.importorskip('astropy.io.fits.hdu.compressed._codecs')
+    rng = np.random.default_rng(7)
+    for bytepix in [1, 2, 4]:
+        info = np.iinfo(f'i{bytepix}')
+        # Smooth noise, flat blocks, and jumps across the whole range, with a last block shorter than block_size
+        values = np.concatenate([
+            rng.normal(0, 20, 100),
+            np.full(64, 3),
+            rng.integers(info.min, info.max, 50, endpoint=True),
+        ]).astype(f'i{bytepix}')
+        for block_size in [16, 32]:
+            content = _codecs.Rice1(blocksize=block_size, bytepix=bytepix, tilesize=values.size).encode(values)
+            np.testing.assert_array_equal(rice_decode(content, values.size, block_size, bytepix), values)
+
+def test__read_compressed_image(synthetic_fits_filepath):
+    from astro_cloud.fits.compressed import is_compressed_image, read_compressed_image
+    from astro_cloud.fits.index.local import load_headers
+
+    filepath = os.path.join(os.path.dirname(synthetic_fits_filepath), 'compressed.fits')
+    write_compressed_fits(filepath)
+    headers = load_headers(filepath)
+    assert not is_compressed_image(load_headers(synthetic_fits_filepath)[2])
+    assert [is_compressed_image(header) for header in headers] == [False, True, True, True, True, True]
+
+    image = read_compressed_image(headers[1])
+    assert image.shape == (300, 400)
+    assert image.tile_shape == (32, 64)
+    assert image.grid == (10, 7)
+    assert image.compression == 'RICE_1'
+    assert image.bzero == 32768
+    assert read_compressed_image(headers[2]).tile_shape == (1, 400)
+
+def test__load_compressed_cutout(range_server, synthetic_fits_filepath):
+    import numpy as np
+
+    from astropy.io import fits
+
+    from astro_cloud.fits.compressed import load_compressed_cutout
+    from astro_cloud.fits.cutout import load_cutout
+    from astro_cloud.fits.index.base import load_headers
+
+    pytest.importorskip('astropy.io.fits.hdu.compressed._codecs')
+    filepath = os.path.join(os.path.dirname(synthetic_fits_filepath), 'compressed.fits')
+    write_compressed_fits(filepath)
+    url = f'{range_server.base_url}/compressed.fits'
+    headers = load_headers(url, auth=None)
+    with fits.open(filepath) as hdu_list:
+        for idx in range(1, len(hdu_list)):
+            image = hdu_list[idx].data
+            for key in [
+                    (slice(40, 90), slice(100, 170)),
+                    (slice(None, None, 37), 7),
+                    (slice(299, 150, -3), slice(None, None, -1)),
+                    (slice(10, 10), slice(None)),
+                    Ellipsis]:
+                cutout = load_compressed_cutout(url, headers[idx], key, workers=4)
+                assert cutout.dtype == image.dtype
+                np.testing.assert_array_equal(cutout, image[key])
+
+        np.testing.assert_array_equal(load_cutout(url, headers[1], (slice(0, 5), 3)), hdu_list[1].data[0:5, 3])
+
+def test__load_compressed_cutout__fetches_touched_tiles(range_server, synthetic_fits_filepath):
+    from astro_cloud.fits.compressed import load_compressed_cutout
+    from astro_cloud.fits.index.base import load_headers
+
+    filepath = os.path.join(os.path.dirname(synthetic_fits_filepath), 'compressed.fits')
+    write_compressed_fits(filepath)
+    url = f'{range_server.base_url}/compressed.fits'
+    headers = load_headers(url, auth=None)
+    range_server.reset_stats()
+    load_compressed_cutout(url, headers[5], (slice(60, 70), slice(60, 70)), max_gap=0)
+    box_bytes = range_server.bytes_sent
+    range_server.reset_stats()
+    load_compressed_cutout(url, headers[5], Ellipsis, max_gap=0)
+    # One 50x50 tile, out of 48, and its row of the descriptor table
+    assert box_bytes * 20 < range_server.bytes_sent
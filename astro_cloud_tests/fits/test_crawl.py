@@ -0,0 +1,71 @@
+import os
+import shutil
+
+from astro_cloud_tests.pytest_utils import aws_credential_filepath, range_server, synthetic_fits_filepath
+
+def test__filter_objects():
+    from astro_cloud.fits.crawl import filter_objects
+    from astro_cloud.listing.aws import ObjectEntry
+
+    entries = [ObjectEntry(key, size, None, None, key) for key, size in [
+        ('a.fits', 2880 * 4),
+        ('b.FITS', 2880 * 40),
+        ('c.fits.gz', 2880 * 4),
+        ('d.fits', 100),
+        ('e.json', 2880 * 4),
+    ]]
+    assert [entry.key for entry in filter_objects(entries)] == ['a.fits', 'b.FITS']
+    assert [entry.key for entry in filter_objects(entries, max_size=2880 * 10)] == ['a.fits']
+    assert [entry.key for entry in filter_objects(entries, suffixes=('.json', '.gz'))] == ['c.fits.gz', 'e.json']
+    assert len(list(filter_objects(entries, suffixes=None, min_size=None))) == 5
+
+def test__crawl_headers(range_server, synthetic_fits_filepath, aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.fits import CloudService, PaymentSolution, crawl_headers
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    for key in ['AWS_PROFILE', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_DEFAULT_REGION']:
+        monkeypatch.delenv(key, raising=False)
+
+    sector_directory = os.path.join(range_server.directory, 'stpubdata', 'tess', 'public', 'mast')
+    os.makedirs(sector_directory)
+    for idx in range(16):
+        shutil.copy(synthetic_fits_filepath, os.path.join(sector_directory, f'tess-s0022-{idx:02d}.fits'))
+
+    with open(os.path.join(sector_directory, 'tess-s0022-headers.json'), 'w') as stream:
+        stream.write('{}')
+
+    range_server.credentials = {'one': 'two'}
+    range_server.listing_latency = 0.05
+    results = list(crawl_headers(f'{range_server.base_url}/stpubdata', 'tess/public/mast/', CloudService.S3,
+        PaymentSolution.AWSRequestPayer, max_workers=4, max_keys=4))
+
+    assert len(results) == 16
+    assert all(result.error is None and len(result.headers) == 4 for result in results)
+    assert range_server.list_count == 5
+    assert range_server.signature_failures == 0
+    # Indexing starts on the first page, while later pages are still being listed
+    listing = [idx for idx, (path, _) in enumerate(range_server.request_log) if 'list-type=2' in path]
+    indexing = [idx for idx, (path, _) in enumerate(range_server.request_log) if 'list-type=2' not in path]
+    assert indexing[0] < listing[-1]
+
+def test__crawl_headers__spaces(range_server, synthetic_fits_filepath, monkeypatch):
+    from astro_cloud.fits import CloudService, crawl_headers
+
+    monkeypatch.setenv('SPACES_ACCESS_KEY_ID', 'spaces-key')
+    monkeypatch.setenv('SPACES_SECRET_ACCESS_KEY', 'spaces-secret')
+    monkeypatch.setenv('SPACES_REGION', 'ams3')
+    sector_directory = os.path.join(range_server.directory, 'space', 'sector')
+    os.makedirs(sector_directory)
+    for idx in range(3):
+        shutil.copy(synthetic_fits_filepath, os.path.join(sector_directory, f'image-{idx:02d}.fits'))
+
+    range_server.credentials = {'spaces-key': 'spaces-secret'}
+    results = list(crawl_headers(f'{range_server.base_url}/space', 'sector/', CloudService.Spaces, max_workers=2))
+
+    assert len(results) == 3
+    assert all(result.error is None and len(result.headers) == 4 for result in results)
+    assert range_server.list_count == 1
+    assert range_server.signature_failures == 0
+    assert all('spaces-key/' in headers['Authorization'] and '/ams3/s3/aws4_request' in headers['Authorization']
+        for headers in range_server.request_headers)
@@ -0,0 +1,83 @@
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__plan_cutout__contiguous_rows():
+    from astro_cloud.fits.cutout import ByteRange, plan_cutout
+
+    plan = plan_cutout((4, 30, 20), 4, (slice(None), slice(5, 10)))
+    assert plan.ranges == [ByteRange((idx * 600 + 100) * 4, (idx * 600 + 200) * 4) for idx in range(4)]
+    assert plan.fetched_shape == (4, 5, 20)
+
+def test__plan_cutout__box():
+    from astro_cloud.fits.cutout import plan_cutout
+
+    plan = plan_cutout((4, 30, 20), 4, (slice(None), slice(5, 10), slice(2, 4)))
+    assert len(plan.ranges) == 4 * 5
+    assert all(byte_range.stop - byte_range.start == 8 for byte_range in plan.ranges)
+
+def test__plan_cutout__whole_image():
+    from astro_cloud.fits.cutout import ByteRange, plan_cutout
+
+    plan = plan_cutout((4, 30, 20), 2, Ellipsis)
+    assert plan.ranges == [ByteRange(0, 4 * 30 * 20 * 2)]
+
+def test__merge_byte_ranges():
+    from astro_cloud.fits.cutout import ByteRange, merge_byte_ranges
+
+    ranges = [ByteRange(100, 200), ByteRange(0, 10), ByteRange(20, 30), ByteRange(150, 160)]
+    assert merge_byte_ranges(ranges, max_gap=10) == [ByteRange(0, 30), ByteRange(100, 200)]
+    assert merge_byte_ranges(ranges, max_gap=0) == \
+        [ByteRange(0, 10), ByteRange(20, 30), ByteRange(100, 200)]
+
+def test__scale_image_data__unsigned():
+    import numpy as np
+
+    from astro_cloud.fits.cutout import scale_image_data
+
+    data = np.array([-32768, 0, 32767], dtype=np.int16)
+    scaled = scale_image_data(data, 1, 32768)
+    assert scaled.dtype == np.uint16
+    assert scaled.tolist() == [0, 32768, 65535]
+
+def test__load_cutout(range_server, synthetic_fits_filepath):
+    import numpy as np
+
+    from astropy.io import fits
+
+    from astro_cloud.fits.cutout import load_cutout
+    from astro_cloud.fits.index.base import load_headers
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    headers = load_headers(url, auth=None)
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        cube = hdu_list['CUBE'].data
+        image = hdu_list['IMAGE'].data
+        for key in [
+                (slice(None), slice(5, 15), slice(3, 9)),
+                (2, slice(None), slice(None)),
+                (slice(None), 4, 7),
+                (slice(1, 4, 2), slice(None, None, 3), slice(None, None, -4)),
+                Ellipsis]:
+            cutout = load_cutout(url, headers[1], key)
+            assert cutout.dtype.isnative
+            np.testing.assert_array_equal(cutout, cube[key])
+
+        cutout = load_cutout(url, headers[3], (slice(10, 20), slice(5, 25)))
+        np.testing.assert_array_equal(cutout, image[10:20, 5:25])
+
+def test__load_cutout__gap_threshold(range_server):
+    from astro_cloud.fits.cutout import load_cutout
+    from astro_cloud.fits.index.base import load_headers
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    headers = load_headers(url, auth=None)
+    key = (slice(None), slice(5, 15), slice(3, 9))
+    range_server.reset_stats()
+    load_cutout(url, headers[1], key, max_gap=0)
+    # 40 ranges batched into a single multi-range request
+    assert range_server.request_count == 1
+    assert range_server.request_log[0][1].count(',') == 4 * 10 - 1
+    range_server.reset_stats()
+    load_cutout(url, headers[1], key)
+    assert range_server.request_count == 1
+    assert range_server.request_log[0][1].count(',') == 0
+    assert range_server.bytes_sent < 4 * 30 * 20 * 4
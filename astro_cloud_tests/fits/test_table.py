@@ -0,0 +1,101 @@
+import os
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def write_wide_table(filepath: str) -> 'np.ndarray':
+    import numpy as np
+
+    from astropy.io import fits
+
+    rows = 500
+    table = fits.BinTableHDU.from_columns([
+        fits.Column(name='TIME', format='D', array=np.arange(rows) / 10),
+        fits.Column(name='PADDING', format='4000B', array=np.zeros((rows, 4000), dtype=np.uint8)),
+        fits.Column(name='FLUX', format='E', array=np.arange(rows, dtype=np.float32) * 2),
+        fits.Column(name='COUNTS', format='I', bzero=32768, array=np.arange(rows, dtype=np.uint16) + 60000),
+        fits.Column(name='FLAG', format='L', array=np.arange(rows) % 3 == 0),
+        fits.Column(name='BITS', format='3X', array=np.array([[1, 0, 1]] * rows, dtype=np.bool_)),
+        fits.Column(name='LABEL', format='8A', array=np.array([f'row{idx}' for idx in range(rows)])),
+        fits.Column(name='CUBE', format='6J', dim='(3,2)', array=np.arange(rows * 6).reshape(rows, 2, 3)),
+    ], name='WIDE')
+    fits.HDUList([fits.PrimaryHDU(), table]).writeto(filepath, overwrite=True)
+    with fits.open(filepath) as hdu_list:
+        return hdu_list[1].data.copy()
+
+def test__get_table_columns(synthetic_fits_filepath):
+    from astro_cloud.fits.index.local import load_headers
+    from astro_cloud.fits.table import get_table_columns
+
+    headers = load_headers(synthetic_fits_filepath)
+    columns = get_table_columns(headers[2])
+    assert [(column.name, column.code, column.offset, column.width) for column in columns] == \
+        [('TIME', 'D', 0, 8), ('FLUX', 'E', 8, 4), ('QUALITY', 'J', 12, 4)]
+
+def test__plan_table_read():
+    from astro_cloud.fits.cutout import ByteRange
+    from astro_cloud.fits.table import TableColumn, plan_table_read
+
+    columns = [
+        TableColumn(1, 'TIME', 'D', 'D', 1, 0, 8, (1, ), 1, 0),
+        TableColumn(2, 'WIDE', '4000B', 'B', 4000, 8, 4000, (4000, ), 1, 0),
+        TableColumn(3, 'FLUX', 'E', 'E', 1, 4008, 4, (1, ), 1, 0),
+    ]
+    # Narrow rows are read as one block
+    plan = plan_table_read(columns[2:], 4012, range(10, 20), max_gap=8192)
+    assert plan.ranges == [ByteRange(10 * 4012 + 4008, 19 * 4012 + 4012)]
+    # Wide rows as strided ranges holding only the column
+    plan = plan_table_read(columns[2:], 4012, range(10, 20), max_gap=1024)
+    assert plan.ranges == [ByteRange(row * 4012 + 4008, row * 4012 + 4012) for row in range(10, 20)]
+    assert plan.row_dtype.itemsize == 4
+    # Two columns far apart in a row are two ranges per row
+    plan = plan_table_read([columns[0], columns[2]], 4012, range(0, 6, 2), max_gap=1024)
+    assert len(plan.ranges) == 6
+    assert plan.row_dtype.itemsize == 12
+
+def test__load_table(range_server, synthetic_fits_filepath):
+    import numpy as np
+
+    from astropy.io import fits
+
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.table import load_table
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    headers = load_headers(url, auth=None)
+    with fits.open(synthetic_fits_filepath) as hdu_list:
+        expected = hdu_list['TABLE'].data
+
+    table = load_table(url, headers[2])
+    assert list(table) == ['TIME', 'FLUX', 'QUALITY']
+    for name in table:
+        assert table[name].dtype.isnative
+        np.testing.assert_array_equal(table[name], expected[name])
+
+    table = load_table(url, headers[2], ['flux'], rows=slice(90, 10, -7))
+    np.testing.assert_array_equal(table['FLUX'], expected['FLUX'][90:10:-7])
+    assert load_table(url, headers[2], [3], rows=5)['QUALITY'].tolist() == [5]
+    assert load_table(url, headers[2], ['TIME'], rows=slice(5, 5))['TIME'].shape == (0, )
+
+def test__load_table__projection(range_server, tmp_path):
+    import numpy as np
+
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.fits.table import load_table
+
+    expected = write_wide_table(os.path.join(str(tmp_path), 'wide.fits'))
+    url = f'{range_server.base_url}/wide.fits'
+    headers = load_headers(url, auth=None)
+    table = load_table(url, headers[1], ['COUNTS', 'FLAG', 'BITS', 'LABEL', 'CUBE', 'TIME'], rows=range(10, 400, 3))
+    for name in table:
+        np.testing.assert_array_equal(table[name], expected[name][10:400:3])
+
+    assert table['COUNTS'].dtype == np.uint16
+    assert table['FLAG'].dtype == np.bool_
+    assert table['CUBE'].shape == (130, 2, 3)
+
+    range_server.reset_stats()
+    table = load_table(url, headers[1], ['FLUX'], max_gap=1024)
+    np.testing.assert_array_equal(table['FLUX'], expected['FLUX'])
+    # 500 strided 4 byte reads, batched into multi-range requests, rather than the 2MB table
+    assert range_server.bytes_sent < 100 * 1024
+    assert range_server.request_count < 10
@@ -46,3 +46,37 @@ def test__find_next_header_offset__table(fits_files):
     # import pdb; pdb.set_trace()
     # import sys; sys.exit(1)
 
+
+def test__find_next_header_offset__padded_data_units(tmp_path):
+    import numpy as np
+
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+    from astro_cloud.fits.utils import find_next_header_offset
+
+    # Data sizes that aren't a multiple of 2880 bytes, and a BINTABLE with a heap
+    filepath = str(tmp_path / 'padded.fits')
+    fits.HDUList([
+        fits.PrimaryHDU(np.zeros((7, 11), dtype='>f4')),
+        fits.ImageHDU(np.zeros((3, 5), dtype='>i2')),
+        fits.BinTableHDU.from_columns([
+            fits.Column(name='SPECTRUM', format='PE()', array=[np.arange(idx, dtype='>f4') for idx in range(1, 40)]),
+        ]),
+        fits.ImageHDU(np.zeros((2, 2), dtype='>f8')),
+    ]).writeto(filepath)
+
+    with fits.open(filepath) as hdu_list:
+        infos = [hdu.fileinfo() for hdu in hdu_list]
+        assert hdu_list[2].header['PCOUNT'] > 0
+        for hdu, info, next_info in zip(hdu_list, infos, infos[1:]):
+            header = FITSHeader(info['hdrLoc'], info['datLoc'] - info['hdrLoc'], hdu.header)
+            assert find_next_header_offset(header) == next_info['hdrLoc']
+
+def test__find_next_header_offset__empty_primary_header():
+    from astropy.io import fits
+
+    from astro_cloud.fits.datatypes import FITSHeader
+    from astro_cloud.fits.utils import find_next_header_offset
+
+    assert find_next_header_offset(FITSHeader(0, 2880, fits.PrimaryHDU().header)) == 2880
@@ -0,0 +1,65 @@
+import os
+import pytest
+import shutil
+
+from astro_cloud_tests.pytest_utils import aws_credential_filepath, range_server, synthetic_fits_filepath
+
+def test__build_list_url():
+    from astro_cloud.listing.aws import build_list_url
+
+    assert build_list_url('https://s3.us-east-1.amazonaws.com/stpubdata/', 'tess/public/mast/', max_keys=10) == \
+        'https://s3.us-east-1.amazonaws.com/stpubdata?list-type=2&max-keys=10&prefix=tess%2Fpublic%2Fmast%2F'
+    assert build_list_url('https://s3.us-east-1.amazonaws.com/stpubdata', continuation_token='1a/b+c=',
+        start_after='ignored') == \
+        'https://s3.us-east-1.amazonaws.com/stpubdata?list-type=2&max-keys=1000&continuation-token=1a%2Fb%2Bc%3D'
+
+def test__parse_list_page():
+    from astro_cloud.listing.aws import parse_list_page
+
+    content = b'''<?xml version="1.0" encoding="UTF-8"?>
+<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+    <Name>stpubdata</Name><Prefix>tess/</Prefix><KeyCount>2</KeyCount><MaxKeys>2</MaxKeys>
+    <IsTruncated>true</IsTruncated>
+    <Contents><Key>tess/a b.fits</Key><LastModified>2020-08-18T00:00:00.000Z</LastModified>
+        <ETag>&quot;abc&quot;</ETag><Size>2880</Size></Contents>
+    <Contents><Key>tess/c.fits</Key><Size>5760</Size></Contents>
+    <NextContinuationToken>token==</NextContinuationToken>
+</ListBucketResult>'''
+    page = parse_list_page('https://s3.us-east-1.amazonaws.com/stpubdata', content)
+    assert page.continuation_token == 'token=='
+    assert [entry.key for entry in page.entries] == ['tess/a b.fits', 'tess/c.fits']
+    assert page.entries[0].url == 'https://s3.us-east-1.amazonaws.com/stpubdata/tess/a%20b.fits'
+    assert page.entries[0].etag == '"abc"'
+    assert page.entries[1].size == 5760
+
+def test__list_objects(range_server, synthetic_fits_filepath, aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.fits.datatypes import PaymentSolution
+    from astro_cloud.listing.aws import iter_pages, list_objects
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    for key in ['AWS_PROFILE', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_DEFAULT_REGION']:
+        monkeypatch.delenv(key, raising=False)
+
+    bucket_directory = os.path.join(range_server.directory, 'bucket')
+    for idx in range(7):
+        os.makedirs(os.path.join(bucket_directory, 'sector 1'), exist_ok=True)
+        shutil.copy(synthetic_fits_filepath, os.path.join(bucket_directory, 'sector 1', f'{idx}.fits'))
+
+    shutil.copy(synthetic_fits_filepath, os.path.join(bucket_directory, 'other.fits'))
+    range_server.credentials = {'one': 'two'}
+    bucket_url = f'{range_server.base_url}/bucket'
+    pages = list(iter_pages(bucket_url, 'sector 1/', PaymentSolution.AWSRequestPayer, max_keys=3))
+    assert [len(page.entries) for page in pages] == [3, 3, 1]
+    assert range_server.signature_failures == 0
+    assert range_server.request_headers[-1]['x-amz-request-payer'] == 'requester'
+
+    entries = list(list_objects(bucket_url, 'sector 1/'))
+    assert [entry.key for entry in entries] == [f'sector 1/{idx}.fits' for idx in range(7)]
+    assert entries[0].size == os.path.getsize(synthetic_fits_filepath)
+    assert entries[0].url == f'{bucket_url}/sector%201/0.fits'
+    assert len(list(list_objects(bucket_url))) == 8
+
+    range_server.credentials = {'one': 'not-two'}
+    with pytest.raises(NotImplementedError):
+        list(list_objects(bucket_url))
@@ -0,0 +1,68 @@
+import os
+import time
+import typing
+
+import pytest
+
+from astro_cloud_tests.pytest_constants import PYTEST_DATA_DIR
+from astro_cloud_tests.pytest_server import RangeServer
+
+LFS_POINTER_PREFIX: bytes = b'version https://git-lfs'
+BUNDLED_FITS_FILES: typing.List[str] = ['502nmos.fits', 'tess2020061235921-s0022-4-4-0174-s_ffic.fits']
+
+class Measurement(typing.NamedTuple):
+    '''
+    What one load_headers call cost, as seen by the server and by the calling thread
+    '''
+    name: str
+    headers: int
+    requests: int
+    bytes_sent: int
+    wall_time: float
+    cpu_time: float
+
+    def report(self: 'Measurement') -> str:
+        return f'{self.name}: headers[{self.headers}] requests[{self.requests}] bytes[{self.bytes_sent}] ' \
+            f'wall[{self.wall_time * 1000:.1f}ms] cpu[{self.cpu_time * 1000:.1f}ms]'
+
+def is_lfs_pointer(filepath: str) -> bool:
+    with open(filepath, 'rb') as stream:
+        return stream.read(len(LFS_POINTER_PREFIX)) == LFS_POINTER_PREFIX
+
+def bundled_fits_filepath(filename: str) -> str:
+    '''
+    The bundled FITS files are stored with git-lfs, skip the benchmark when only the pointer has been checked out
+    '''
+    filepath = os.path.join(PYTEST_DATA_DIR, filename)
+    if is_lfs_pointer(filepath):
+        pytest.skip(f'{filename} is a git-lfs pointer, run `git lfs pull` to benchmark it')
+
+    return filepath
+
+def write_many_hdu_fits(filepath: str, hdu_count: int = 256, shape: typing.Tuple[int, ...] = (8, 8)) -> None:
+    '''
+    Writes a primary header followed by hdu_count small IMAGE extensions, the worst case for a header walk that
+      issues a request per header
+    '''
+    import numpy as np
+
+    from astropy.io import fits
+
+    hdu_list = fits.HDUList([fits.PrimaryHDU()])
+    for idx in range(hdu_count):
+        hdu_list.append(fits.ImageHDU(np.full(shape, idx, dtype='>f4'), name=f'CCD{idx}'))
+
+    hdu_list.writeto(filepath, overwrite=True)
+
+def measure(server: RangeServer, name: str, load: typing.Callable[[], typing.List[typing.Any]]) -> Measurement:
+    '''
+    Runs load once against server. CPU time is that of the calling thread, so the server threads sharing the process
+      aren't counted
+    '''
+    server.reset_stats()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    headers = load()
+    cpu_time = time.thread_time() - cpu_start
+    wall_time = time.perf_counter() - wall_start
+    return Measurement(name, len(headers), server.request_count, server.bytes_sent, wall_time, cpu_time)
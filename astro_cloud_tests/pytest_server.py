@@ -0,0 +1,431 @@
+import base64
+import calendar
+import email.utils
+import hashlib
+import hmac
+import http.server
+import json
+import os
+import re
+import threading
+import time
+import typing
+import xml.sax.saxutils
+
+from urllib.parse import parse_qsl, quote, unquote, urlsplit
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+RANGE_PATTERN = re.compile(r'^(\d+)-(\d*)$')
+AUTHORIZATION_PATTERN = re.compile(
+    r'^AWS4-HMAC-SHA256 Credential=([^/]+)/(\d{8})/([^/]+)/([^/]+)/aws4_request, SignedHeaders=([^,]+), '
+    r'Signature=([0-9a-f]{64})$')
+CREDENTIAL_PATTERN = re.compile(r'^([^/]+)/(\d{8})/([^/]+)/([^/]+)/aws4_request$')
+METADATA_TOKEN_PATH = '/computeMetadata/v1/instance/service-accounts/default/token'
+MULTIPART_BOUNDARY = 'astro-cloud-byteranges'
+THROTTLE_CHUNK_SIZE: int = 16 * 1024
+
+def hmac_sha256(key: bytes, value: str) -> bytes:
+    return hmac.new(key, value.encode('utf-8'), hashlib.sha256).digest()
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Serves files from `server.directory` with support for the HTTP Range header, the same way S3, Caddy, Nginx and
+      Apache2 do. HTTP/1.1 is used so connections are kept alive between requests
+    '''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self: PWN) -> None:
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connection_count += 1
+
+    def log_message(self: PWN, *args) -> None:
+        pass
+
+    def send_body(self: PWN, status: int, body: bytes, headers: typing.Dict[str, str]) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            if self.server.bandwidth is None:
+                self.wfile.write(body)
+
+            else:
+                for start in range(0, len(body), THROTTLE_CHUNK_SIZE):
+                    chunk = body[start:start + THROTTLE_CHUNK_SIZE]
+                    self.wfile.write(chunk)
+                    time.sleep(len(chunk) / self.server.bandwidth)
+
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients abandon bodies they don't want
+            self.close_connection = True
+            return None
+
+        with self.server.stats_lock:
+            self.server.bytes_sent += len(body)
+
+    def do_GET(self: PWN) -> None:
+        with self.server.stats_lock:
+            self.server.request_count += 1
+            request_number = self.server.request_count
+            self.server.request_log.append((self.path, self.headers.get('Range', None)))
+            self.server.request_headers.append(dict(self.headers.items()))
+            injected_status = self.server.injected_statuses.pop(0) if self.server.injected_statuses else None
+
+        latency = self.server.latency(request_number) if callable(self.server.latency) else self.server.latency
+        if latency > 0:
+            time.sleep(latency)
+
+        if injected_status is not None:
+            return self.send_body(injected_status, b'', {'Retry-After': '0'})
+
+        if urlsplit(self.path).path == METADATA_TOKEN_PATH and self.headers.get('Metadata-Flavor', None) == 'Google':
+            return self.send_token()
+
+        if not self.authorized():
+            with self.server.stats_lock:
+                self.server.signature_failures += 1
+
+            return self.send_body(403, b'SignatureDoesNotMatch', {})
+
+        url_parts = urlsplit(self.path)
+        query = dict(parse_qsl(url_parts.query, keep_blank_values=True))
+        if query.get('list-type', None) == '2':
+            return self.send_listing(unquote(url_parts.path).strip('/'), query)
+
+        filepath = os.path.join(self.server.directory, unquote(url_parts.path).lstrip('/'))
+        if not os.path.isfile(filepath):
+            return self.send_body(404, b'', {})
+
+        stat = os.stat(filepath)
+        file_size = stat.st_size
+        validators = {
+            'ETag': f'"{stat.st_mtime_ns:x}-{file_size:x}"',
+            'Last-Modified': email.utils.formatdate(stat.st_mtime, usegmt=True),
+        }
+        if self.headers.get('If-None-Match', None) == validators['ETag']:
+            return self.send_body(304, b'', validators)
+
+        range_header = self.headers.get('Range', None)
+        with open(filepath, 'rb') as stream:
+            if range_header is None:
+                return self.send_body(200, stream.read(), validators)
+
+            ranges: typing.List[typing.Tuple[int, int]] = []
+            for range_spec in range_header.split('=', 1)[1].split(','):
+                match = RANGE_PATTERN.match(range_spec.strip())
+                start = int(match.group(1))
+                end = min(int(match.group(2) or file_size - 1), file_size - 1)
+                if start < file_size:
+                    ranges.append((start, end))
+
+            if len(ranges) == 0:
+                return self.send_body(416, b'', {'Content-Range': f'bytes */{file_size}'})
+
+            elif len(ranges) > 1 and not self.server.multirange:
+                # S3 answers multiple ranges with the whole object
+                return self.send_body(200, stream.read(), validators)
+
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                stream.seek(start)
+                return self.send_body(206, stream.read(end - start + 1), dict(validators, **{
+                    'Content-Range': f'bytes {start}-{end}/{file_size}',
+                }))
+
+            body = bytearray()
+            for start, end in ranges:
+                stream.seek(start)
+                body.extend(f'\r\n--{MULTIPART_BOUNDARY}\r\n'.encode('ascii'))
+                body.extend(b'Content-Type: application/octet-stream\r\n')
+                body.extend(f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'.encode('ascii'))
+                body.extend(stream.read(end - start + 1))
+
+            body.extend(f'\r\n--{MULTIPART_BOUNDARY}--\r\n'.encode('ascii'))
+            content_type = 'multipart/byteranges' if self.server.omit_boundary else \
+                f'multipart/byteranges; boundary={MULTIPART_BOUNDARY}'
+            return self.send_body(206, bytes(body), dict(validators, **{'Content-Type': content_type}))
+
+    def send_listing(self: PWN, bucket: str, query: typing.Dict[str, str]) -> None:
+        '''
+        Answers ListObjectsV2 for the directory named bucket. Continuation tokens are the last key of the previous page
+        '''
+        bucket_directory = os.path.join(self.server.directory, bucket)
+        if not os.path.isdir(bucket_directory):
+            return self.send_body(404, b'NoSuchBucket', {})
+
+        keys: typing.List[str] = []
+        for dirpath, _, filenames in os.walk(bucket_directory):
+            for filename in filenames:
+                keys.append(os.path.relpath(os.path.join(dirpath, filename), bucket_directory).replace(os.sep, '/'))
+
+        prefix = query.get('prefix', '')
+        after = query.get('continuation-token', None) or query.get('start-after', '')
+        keys = [key for key in sorted(keys) if key.startswith(prefix) and key > after]
+        max_keys = int(query.get('max-keys', '1000'))
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        with self.server.stats_lock:
+            self.server.list_count += 1
+
+        if self.server.listing_latency > 0:
+            time.sleep(self.server.listing_latency)
+
+        contents: typing.List[str] = []
+        for key in page:
+            stat = os.stat(os.path.join(bucket_directory, key))
+            contents.append(
+                f'<Contents><Key>{xml.sax.saxutils.escape(key)}</Key>'
+                f'<LastModified>{time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(stat.st_mtime))}</LastModified>'
+                f'<ETag>&quot;{stat.st_mtime_ns:x}-{stat.st_size:x}&quot;</ETag><Size>{stat.st_size}</Size>'
+                f'<StorageClass>STANDARD</StorageClass></Contents>')
+
+        token = f'<NextContinuationToken>{xml.sax.saxutils.escape(page[-1])}</NextContinuationToken>' \
+            if truncated else ''
+        body = f'<?xml version="1.0" encoding="UTF-8"?>' \
+            f'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"><Name>{bucket}</Name>' \
+            f'<Prefix>{xml.sax.saxutils.escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>' \
+            f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{"true" if truncated else "false"}</IsTruncated>' \
+            f'{"".join(contents)}{token}</ListBucketResult>'
+        return self.send_body(200, body.encode('utf-8'), {'Content-Type': 'application/xml'})
+
+    def do_POST(self: PWN) -> None:
+        '''
+        Answers OAuth 2.0 token requests, to any path ending in /token, the way Google's and Microsoft's token
+          endpoints do
+        '''
+        body = self.rfile.read(int(self.headers.get('Content-Length', '0'))).decode('utf-8')
+        if not urlsplit(self.path).path.endswith('/token'):
+            return self.send_body(404, b'', {})
+
+        with self.server.stats_lock:
+            self.server.token_request_log.append((self.path, dict(parse_qsl(body, keep_blank_values=True))))
+
+        return self.send_token()
+
+    def send_token(self: PWN) -> None:
+        if self.server.token_latency > 0:
+            time.sleep(self.server.token_latency)
+
+        with self.server.stats_lock:
+            self.server.token_requests += 1
+            token = f'token-{self.server.token_requests}'
+            if self.server.bearer_tokens is None:
+                self.server.bearer_tokens = set()
+
+            self.server.bearer_tokens.add(token)
+
+        body = json.dumps({'access_token': token, 'expires_in': self.server.token_lifetime, 'token_type': 'Bearer'})
+        return self.send_body(200, body.encode('utf-8'), {'Content-Type': 'application/json'})
+
+    def authorized(self: PWN) -> bool:
+        '''
+        Requests are checked against whichever of SigV4 credentials, issued bearer tokens and Azure Shared Keys the
+          server holds, and are all let through while it holds none
+        '''
+        if self.server.credentials is None and self.server.bearer_tokens is None and \
+                self.server.shared_keys is None:
+            return True
+
+        authorization = self.headers.get('Authorization', '')
+        if authorization.startswith('Bearer ') and self.server.bearer_tokens is not None:
+            return authorization[len('Bearer '):] in self.server.bearer_tokens
+
+        elif authorization.startswith('SharedKey ') and self.server.shared_keys is not None:
+            return self.verify_shared_key(authorization[len('SharedKey '):])
+
+        elif self.server.credentials is not None:
+            return self.verify_signature()
+
+        return False
+
+    def verify_shared_key(self: PWN, credential: str) -> bool:
+        '''
+        Checks an Azure Shared Key signature against the key server.shared_keys holds for the account
+        '''
+        account, _, signature = credential.partition(':')
+        key = self.server.shared_keys.get(account, None)
+        if key is None:
+            return False
+
+        names = ['Content-Encoding', 'Content-Language', 'Content-Length', 'Content-MD5', 'Content-Type', 'Date',
+            'If-Modified-Since', 'If-Match', 'If-None-Match', 'If-Unmodified-Since', 'Range']
+        values = [self.headers.get(name, '') for name in names]
+        canonicalized_headers = ''.join(f'{name}:{value.strip()}\n' for name, value in sorted(
+            (name.lower(), value) for name, value in self.headers.items() if name.lower().startswith('x-ms-')))
+        url_parts = urlsplit(self.path)
+        resource = f'/{account}{url_parts.path}'
+        for name, value in sorted(parse_qsl(url_parts.query, keep_blank_values=True)):
+            resource += f'\n{name.lower()}:{value}'
+
+        string_to_sign = '\n'.join([self.command] + values + [canonicalized_headers + resource])
+        expected = base64.b64encode(hmac.new(base64.b64decode(key), string_to_sign.encode('utf-8'),
+            hashlib.sha256).digest()).decode('ascii')
+        return hmac.compare_digest(expected, signature)
+
+    def verify_signature(self: PWN) -> bool:
+        '''
+        Checks the AWS Signature Version 4 in the Authorization header the way S3 does, against the secret key
+          server.credentials holds for the access key
+        '''
+        url_parts = urlsplit(self.path)
+        parameters = parse_qsl(url_parts.query, keep_blank_values=True)
+        query = dict(parameters)
+        if 'X-Amz-Signature' in query:
+            return self.verify_presigned(url_parts, parameters, query)
+
+        match = AUTHORIZATION_PATTERN.match(self.headers.get('Authorization', ''))
+        if match is None:
+            return False
+
+        access_key, datestamp, region, service, signed_headers, signature = match.groups()
+        secret_key = self.server.credentials.get(access_key, None)
+        amzdate = self.headers.get('x-amz-date', '')
+        if secret_key is None or not amzdate.startswith(datestamp):
+            return False
+
+        canonical_querystring = '&'.join(f'{quote(key, safe="-_.~")}={quote(value, safe="-_.~")}'
+            for key, value in sorted(parameters))
+        canonical_headers = ''.join(f'{name}:{self.headers.get(name, "").strip()}\n'
+            for name in signed_headers.split(';'))
+        canonical_request = '\n'.join([
+            self.command,
+            quote(url_parts.path or '/', safe='/-_.~'),
+            canonical_querystring,
+            canonical_headers,
+            signed_headers,
+            self.headers.get('x-amz-content-sha256', hashlib.sha256(b'').hexdigest()),
+        ])
+        return self.check_signature(canonical_request, secret_key, amzdate, datestamp, region, service, signature)
+
+    def verify_presigned(self: PWN, url_parts: 'urllib.parse.SplitResult',
+            parameters: typing.List[typing.Tuple[str, str]], query: typing.Dict[str, str]) -> bool:
+        '''
+        Checks a SigV4 presigned url, signed in its query string and valid for X-Amz-Expires seconds from X-Amz-Date
+        '''
+        match = CREDENTIAL_PATTERN.match(query.get('X-Amz-Credential', ''))
+        if match is None or query.get('X-Amz-Algorithm', None) != 'AWS4-HMAC-SHA256':
+            return False
+
+        access_key, datestamp, region, service = match.groups()
+        secret_key = self.server.credentials.get(access_key, None)
+        amzdate = query.get('X-Amz-Date', '')
+        if secret_key is None or not amzdate.startswith(datestamp):
+            return False
+
+        signed_at = calendar.timegm(time.strptime(amzdate, '%Y%m%dT%H%M%SZ'))
+        if time.time() > signed_at + int(query.get('X-Amz-Expires', '0')):
+            return False
+
+        signed_headers = query.get('X-Amz-SignedHeaders', '')
+        canonical_querystring = '&'.join(f'{quote(key, safe="-_.~")}={quote(value, safe="-_.~")}'
+            for key, value in sorted(parameters) if key != 'X-Amz-Signature')
+        canonical_headers = ''.join(f'{name}:{self.headers.get(name, "").strip()}\n'
+            for name in signed_headers.split(';'))
+        canonical_request = '\n'.join([
+            self.command,
+            quote(url_parts.path or '/', safe='/-_.~'),
+            canonical_querystring,
+            canonical_headers,
+            signed_headers,
+            'UNSIGNED-PAYLOAD',
+        ])
+        return self.check_signature(canonical_request, secret_key, amzdate, datestamp, region, service,
+            query['X-Amz-Signature'])
+
+    def check_signature(self: PWN, canonical_request: str, secret_key: str, amzdate: str, datestamp: str, region: str,
+            service: str, signature: str) -> bool:
+        credential_scope = f'{datestamp}/{region}/{service}/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256',
+            amzdate,
+            credential_scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+        ])
+        signing_key = f'AWS4{secret_key}'.encode('utf-8')
+        for value in [datestamp, region, service, 'aws4_request']:
+            signing_key = hmac_sha256(signing_key, value)
+
+        expected = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+class RangeServer(http.server.ThreadingHTTPServer):
+    '''
+    A local stand-in for S3. latency seconds are added before every response, bodies are throttled to bandwidth
+      bytes per second, and when credentials maps access keys to secret keys, requests without a valid SigV4
+      signature are refused with a 403. latency may also be a callable taking the request number, counting from 1.
+      The next requests are answered with injected_statuses, in order, before any are served. GETs with
+      `?list-type=2` list the directory named by the path like ListObjectsV2, after another listing_latency seconds.
+
+    It also stands in for OAuth token endpoints and the GCE metadata server, issuing bearer tokens valid for
+      token_lifetime seconds after token_latency seconds. Once one has been issued, or bearer_tokens or shared_keys
+      is set, requests need a valid bearer token, Azure Shared Key or SigV4 signature
+    '''
+    daemon_threads = True
+    directory: str
+    connection_count: int
+    request_count: int
+    bytes_sent: int
+    request_log: typing.List[typing.Tuple[str, str]]
+    request_headers: typing.List[typing.Dict[str, str]]
+    signature_failures: int
+    list_count: int
+    listing_latency: float
+    multirange: bool
+    omit_boundary: bool  # leave the boundary parameter out of multipart/byteranges responses
+    latency: typing.Union[float, typing.Callable[[int], float]]
+    injected_statuses: typing.List[int]
+    bandwidth: int
+    credentials: typing.Dict[str, str]
+    bearer_tokens: typing.Set[str]
+    shared_keys: typing.Dict[str, str]
+    token_lifetime: int
+    token_latency: float
+    token_requests: int
+    token_request_log: typing.List[typing.Tuple[str, typing.Dict[str, str]]]
+    def __init__(self: PWN, directory: str, multirange: bool = True,
+            latency: typing.Union[float, typing.Callable[[int], float]] = 0.0, bandwidth: int = None,
+            credentials: typing.Dict[str, str] = None) -> None:
+        super().__init__(('127.0.0.1', 0), RangeRequestHandler)
+        self.directory = directory
+        self.multirange = multirange
+        self.omit_boundary = False
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.credentials = credentials
+        self.injected_statuses = []
+        self.listing_latency = 0.0
+        self.bearer_tokens = None
+        self.shared_keys = None
+        self.token_lifetime = 3600
+        self.token_latency = 0.0
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def base_url(self: PWN) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def reset_stats(self: PWN) -> None:
+        self.connection_count = 0
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.signature_failures = 0
+        self.list_count = 0
+        self.request_log = []
+        self.request_headers = []
+        self.token_requests = 0
+        self.token_request_log = []
+
+    def start(self: PWN) -> PWN:
+        thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self: PWN) -> None:
+        self.shutdown()
+        self.server_close()
@@ -67,3 +67,38 @@ def aws_credential_filepath__empty():
         os.remove(filepath)
 
     return filepath
+
+def write_synthetic_fits(filepath: str) -> typing.List[fits.Header]:
+    '''
+    Writes a FITS file with a multi-block primary header, an IMAGE cube, a BINTABLE and an int16 IMAGE
+    '''
+    import numpy as np
+
+    primary = fits.PrimaryHDU()
+    for idx in range(120):
+        primary.header[f'KEY{idx}'] = (idx, f'synthetic keyword {idx}')
+
+    cube = fits.ImageHDU(np.arange(4 * 30 * 20, dtype='>f4').reshape(4, 30, 20), name='CUBE')
+    table = fits.BinTableHDU.from_columns([
+        fits.Column(name='TIME', format='D', array=np.linspace(0, 1, 100)),
+        fits.Column(name='FLUX', format='E', array=np.arange(100, dtype='>f4')),
+        fits.Column(name='QUALITY', format='J', array=np.arange(100, dtype='>i4') % 7),
+    ], name='TABLE')
+    image = fits.ImageHDU(np.arange(50 * 40, dtype='>i2').reshape(50, 40), name='IMAGE')
+    hdu_list = fits.HDUList([primary, cube, table, image])
+    hdu_list.writeto(filepath, overwrite=True)
+    return [hdu.header for hdu in hdu_list]
+
+@pytest.fixture
+def synthetic_fits_filepath(tmp_path):
+    filepath = os.path.join(str(tmp_path), 'synthetic.fits')
+    write_synthetic_fits(filepath)
+    return filepath
+
+@pytest.fixture
+def range_server(synthetic_fits_filepath):
+    from astro_cloud_tests.pytest_server import RangeServer
+
+    server = RangeServer(os.path.dirname(synthetic_fits_filepath)).start()
+    yield server
+    server.stop()
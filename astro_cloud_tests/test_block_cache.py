@@ -0,0 +1,228 @@
+import os
+import pytest
+import threading
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__block_runs():
+    from astro_cloud.block_cache import block_runs
+
+    assert block_runs([0, 10, 20, 50, 60], 10) == [(0, 29), (50, 69)]
+    assert block_runs([], 10) == []
+
+def test__block_cache__read_range(range_server, synthetic_fits_filepath):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        expected = stream.read()
+
+    cache = BlockCache()
+    with Transport(block_cache=cache) as transport:
+        response = transport.read_range(url, 100, 3000)
+        assert response.status_code == 206
+        assert response.content == expected[100:3001]
+        assert response.headers['Content-Range'] == f'bytes 100-3000/{len(expected)}'
+        assert range_server.request_log[-1][1] == 'bytes=0-5759'
+
+        range_server.reset_stats()
+        assert transport.read_range(url, 2880, 5759).content == expected[2880:5760]
+        assert transport.read_range(url, 0, 79).content == expected[:80]
+        assert range_server.request_count == 0
+        # Reads past the end are clipped to the size, like a server would
+        tail = transport.read_range(url, len(expected) - 10, len(expected) + 10000)
+        assert tail.content == expected[-10:]
+        assert transport.read_range(url, len(expected), len(expected) + 10).status_code == 416
+
+    assert cache.stats()[:2] == (2, 3)
+    assert cache.bytes == sum(len(block) for block in cache._blocks.values())
+
+def test__block_cache__header_walk(range_server):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport(block_cache=BlockCache()) as transport:
+        headers = load_headers(url, None, transport)
+        range_server.reset_stats()
+        again = load_headers(url, None, transport)
+
+    assert range_server.request_count == 0
+    assert [(header.offset, header.raw) for header in again] == [(header.offset, header.raw) for header in headers]
+
+def test__block_cache__single_flight(range_server, synthetic_fits_filepath):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        expected = stream.read()
+
+    cache = BlockCache()
+    range_server.latency = 0.2
+    barrier = threading.Barrier(8)
+    contents = [None] * 8
+    with Transport(block_cache=cache) as transport:
+        def read(idx: int) -> None:
+            barrier.wait()
+            contents[idx] = transport.read_range(url, idx * 80, idx * 80 + 79).content
+
+        threads = [threading.Thread(target=read, args=(idx,)) for idx in range(8)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    assert range_server.request_count == 1
+    assert contents == [expected[idx * 80:idx * 80 + 80] for idx in range(8)]
+
+def test__block_cache__read_ranges(range_server, synthetic_fits_filepath):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        expected = stream.read()
+
+    ranges = [(10, 20), (2900, 2950), (8640, 8700), (8700, 8800)]
+    cache = BlockCache()
+    with Transport(block_cache=cache) as transport:
+        assert transport.read_ranges(url, ranges) == [expected[start:end + 1] for start, end in ranges]
+        # The first range learns the validators, the remaining blocks are one multipart request
+        assert range_server.request_count == 2
+        assert range_server.request_log[-1][1] == 'bytes=2880-5759,8640-11519'
+
+        range_server.reset_stats()
+        assert transport.read_ranges(url, ranges[1:]) == [expected[start:end + 1] for start, end in ranges[1:]]
+        assert range_server.request_count == 0
+
+def test__block_cache__eviction(range_server):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    cache = BlockCache(max_bytes=2880 * 2)
+    with Transport(block_cache=cache) as transport:
+        for block in range(3):
+            transport.read_range(url, block * 2880, block * 2880 + 2879)
+
+        assert cache.stats().evictions == 1
+        assert cache.bytes == 2880 * 2
+        range_server.reset_stats()
+        transport.read_range(url, 2880, 2880 * 3 - 1)
+        assert range_server.request_count == 0
+        transport.read_range(url, 0, 79)
+        assert range_server.request_count == 1
+
+def test__block_cache__object_changed(range_server, synthetic_fits_filepath):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    cache = BlockCache(max_age=0.0)
+    with Transport(block_cache=cache) as transport:
+        first = transport.read_range(url, 0, 79).content
+        with open(synthetic_fits_filepath, 'r+b') as stream:
+            stream.write(b'X' * 80)
+
+        stat = os.stat(synthetic_fits_filepath)
+        os.utime(synthetic_fits_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        assert transport.read_range(url, 0, 79).content == b'X' * 80
+
+    assert first.startswith(b'SIMPLE')
+    assert all(key[1] == cache._validators[url].etag for key in cache._blocks)
+
+def test__block_cache__conditional_bypass(range_server):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport(block_cache=BlockCache()) as transport:
+        etag = transport.read_range(url, 0, 79).headers['ETag']
+        assert transport.read_range(url, 0, 79, headers={'If-None-Match': etag}).status_code == 304
+
+    assert range_server.request_count == 2
+
+def test__block_cache__overlapping_cutouts(range_server, synthetic_fits_filepath):
+    import numpy as np
+
+    from astropy.io import fits
+
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.fits.cutout import load_cutout
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with fits.open(synthetic_fits_filepath) as hdu_list, Transport(block_cache=BlockCache()) as transport:
+        cube = hdu_list['CUBE'].data
+        headers = load_headers(url, None, transport)
+        cutout = load_cutout(url, headers[1], (slice(None), slice(5, 15), slice(3, 9)), transport=transport)
+        np.testing.assert_array_equal(cutout, cube[:, 5:15, 3:9])
+        range_server.reset_stats()
+        cutout = load_cutout(url, headers[1], (slice(1, 3), slice(8, 12), slice(None)), transport=transport)
+        np.testing.assert_array_equal(cutout, cube[1:3, 8:12, :])
+
+    assert range_server.request_count == 0
+
+def test__block_cache__short_read():
+    import time
+
+    from astro_cloud.block_cache import BlockCache, ShortRead
+    from astro_cloud.transport import RangeResponse
+
+    url = 'http://127.0.0.1/short.fits'
+    data = bytes(idx % 251 for idx in range(2880 * 10))
+    short = []
+    release = threading.Event()
+    def fetch(start: int, end: int) -> RangeResponse:
+        content = data[start:end + 1]
+        if short and short.pop(0):
+            release.wait(5)
+            content = content[:-100]
+
+        return RangeResponse(206, content, {'Content-Range': f'bytes {start}-{end}/{len(data)}', 'ETag': '"v1"'})
+
+    def fetch_many(ranges):
+        return [data[start:end + 1][:-1] for start, end in ranges]
+
+    cache = BlockCache()
+    assert cache.read_range(url, 0, 79, fetch).content == data[:80]
+
+    release.set()
+    short.append(True)
+    with pytest.raises(ShortRead):
+        cache.read_range(url, 2880 * 3, 2880 * 4 + 10, fetch)
+
+    assert not cache._in_flight and not (url, '"v1"', 2880 * 3) in cache._blocks
+    assert cache.read_range(url, 2880 * 3, 2880 * 4 + 10, fetch).content == data[2880 * 3:2880 * 4 + 11]
+
+    # A reader waiting on the short response's blocks requests them itself
+    release.clear()
+    short.append(True)
+    errors, contents = [], []
+    def read() -> None:
+        try:
+            contents.append(cache.read_range(url, 2880 * 6, 2880 * 6 + 99, fetch).content)
+        except ShortRead as err:
+            errors.append(err)
+
+    owner = threading.Thread(target=read)
+    owner.start()
+    time.sleep(0.05)
+    waiter = threading.Thread(target=read)
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    owner.join()
+    waiter.join()
+    assert len(errors) == 1
+    assert contents == [data[2880 * 6:2880 * 6 + 100]]
+
+    with pytest.raises(ShortRead):
+        cache.read_ranges(url, [(2880 * 8, 2880 * 8 + 10)], fetch, fetch_many)
+
+    assert not cache._in_flight and not (url, '"v1"', 2880 * 8) in cache._blocks
@@ -0,0 +1,134 @@
+import pytest
+
+from astro_cloud_tests.pytest_utils import aws_credential_filepath, range_server, synthetic_fits_filepath
+
+def test__estimate_cost():
+    from astro_cloud.metrics import BYTES_PER_GB, CallStats, CostModel
+
+    stats = CallStats('s3://bucket/key')
+    stats.requests = 2000
+    stats.bytes_received = BYTES_PER_GB
+    assert stats.estimate_cost() == pytest.approx(0.0008 + 0.09)
+    assert stats.estimate_cost(CostModel(transfer_per_gb=0)) == pytest.approx(0.0008)
+
+def test__load_headers__instrumentation(range_server):
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.metrics import Instrumentation
+    from astro_cloud.transport import Transport
+
+    spans = []
+    completed = []
+    instrumentation = Instrumentation(on_request=spans.append, on_complete=completed.append)
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport() as transport:
+        fits_headers = load_headers(url, None, transport=transport, instrumentation=instrumentation)
+        load_headers(url, None, transport=transport, instrumentation=instrumentation)
+
+    assert len(completed) == 2
+    stats = completed[0]
+    assert stats.url == url
+    assert stats.headers == len(fits_headers) == 4
+    assert stats.requests == len(stats.spans) == range_server.request_count // 2
+    assert stats.bytes_received == range_server.bytes_sent // 2
+    assert stats.spans == spans[:stats.requests]
+    assert stats.parse_time > 0
+    assert stats.signing_time == 0
+    assert 0 < stats.parse_time < stats.wall_time
+    first = stats.spans[0]
+    assert (first.start, first.end, first.status_code, first.bytes_received) == (0, 2879, 206, 2880)
+    assert 0 < first.time_to_first_byte <= first.elapsed
+    assert instrumentation.totals.requests == range_server.request_count
+    assert instrumentation.totals.headers == 8
+
+def test__load_headers__instrumentation__signing(range_server, aws_credential_filepath, monkeypatch):
+    from astro_cloud.auth import aws as auth_aws
+    from astro_cloud.fits import CloudService, PaymentSolution, load_headers
+    from astro_cloud.metrics import Instrumentation
+
+    monkeypatch.setattr(auth_aws, 'AWS_CREDENTIAL_FILE_LOCATION', aws_credential_filepath)
+    instrumentation = Instrumentation(record_spans=False)
+    load_headers(f'{range_server.base_url}/synthetic.fits', CloudService.S3, PaymentSolution.AWSRequestPayer,
+        instrumentation=instrumentation)
+
+    totals = instrumentation.totals
+    assert totals.headers == 4
+    assert totals.requests == range_server.request_count
+    assert totals.signing_time > 0
+    assert totals.estimate_cost() > 0
+
+@pytest.mark.asyncio
+async def test__aload_headers__instrumentation(range_server):
+    from astro_cloud.fits.index.base import aload_headers
+    from astro_cloud.metrics import Instrumentation
+
+    instrumentation = Instrumentation()
+    fits_headers = [header async for header in aload_headers(f'{range_server.base_url}/synthetic.fits', None,
+        instrumentation=instrumentation)]
+    assert instrumentation.totals.headers == len(fits_headers) == 4
+    assert instrumentation.totals.requests == range_server.request_count
+
+def test__load_headers__instrumentation__local(synthetic_fits_filepath):
+    from astro_cloud.fits.index.local import load_headers
+    from astro_cloud.metrics import Instrumentation
+
+    instrumentation = Instrumentation()
+    load_headers(synthetic_fits_filepath, instrumentation=instrumentation)
+    assert instrumentation.totals.headers == 4
+    assert instrumentation.totals.requests == 0
+    assert instrumentation.totals.parse_time > 0
+
+def test__iter_headers__instrumentation__local__closed_early(synthetic_fits_filepath):
+    from astro_cloud.fits.index.local import iter_headers
+    from astro_cloud.metrics import Instrumentation
+
+    instrumentation = Instrumentation()
+    headers = iter_headers(synthetic_fits_filepath, instrumentation=instrumentation)
+    assert next(headers).fits['SIMPLE'] is True
+    headers.close()
+    assert instrumentation.totals.headers == 1
+
+def test__load_headers__instrumentation__block_cache(range_server):
+    from astro_cloud.block_cache import BlockCache
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.metrics import Instrumentation
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport(block_cache=BlockCache()) as transport:
+        first = Instrumentation()
+        load_headers(url, None, transport, instrumentation=first)
+        spans = []
+        again = Instrumentation(on_request=spans.append)
+        load_headers(url, None, transport, instrumentation=again)
+
+    assert first.totals.requests == range_server.request_count
+    assert first.totals.bytes_received > 0
+    assert again.totals.requests == again.totals.bytes_received == 0
+    assert again.totals.cache_hits == len(spans) > 0
+    assert all(span.cached for span in spans)
+    assert again.totals.estimate_cost() == 0
+
+def test__load_headers__instrumentation__hedged(range_server):
+    import time
+
+    from astro_cloud.fits.index.base import load_headers
+    from astro_cloud.metrics import Instrumentation
+    from astro_cloud.transport import HedgePolicy, Transport, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport(TransportConfig(hedge=HedgePolicy(percentile=0.9, min_samples=10))) as transport:
+        for idx in range(10):
+            transport.read_range(url, 0, 79)
+
+        range_server.reset_stats()
+        # The 1st request is beaten by its duplicate, the 3rd answers before its duplicate does
+        range_server.latency = lambda request_number: {1: 0.2, 3: 0.2, 4: 0.5}.get(request_number, 0)
+        instrumentation = Instrumentation()
+        load_headers(url, None, transport, instrumentation=instrumentation)
+        time.sleep(0.1)
+
+    totals = instrumentation.totals
+    assert (totals.hedges, totals.hedges_sent) == (1, 2)
+    assert totals.requests == range_server.request_count
+    assert totals.estimate_cost() > 0
+
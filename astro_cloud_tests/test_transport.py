@@ -0,0 +1,277 @@
+import pytest
+import time
+
+from astro_cloud_tests.pytest_utils import range_server, synthetic_fits_filepath
+
+def test__create_session__pool_sizes():
+    from astro_cloud.transport import TransportConfig, create_session
+
+    session = create_session(TransportConfig(pool_connections=3, pool_maxsize=7))
+    adapter = session.get_adapter('https://s3.us-east-1.amazonaws.com')
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 7
+    assert session.get_adapter('http://127.0.0.1') is adapter
+
+def test__transport__caller_supplied_session():
+    import requests
+
+    from astro_cloud.transport import Transport
+
+    session = requests.Session()
+    transport = Transport(session=session)
+    assert transport.session is session
+
+def test__transport__read_range(range_server):
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport() as transport:
+        response = transport.read_range(url, 0, 79)
+        assert response.status_code == 206
+        assert response.content.startswith(b'SIMPLE  =')
+        assert len(response.content) == 80
+
+def test__transport__keep_alive(range_server):
+    from astro_cloud.transport import Transport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    with Transport() as transport:
+        for idx in range(10):
+            assert transport.read_range(url, idx * 80, idx * 80 + 79).status_code == 206
+
+    assert range_server.request_count == 10
+    assert range_server.connection_count == 1
+
+def test__get_default_transport():
+    from astro_cloud.transport import Transport, get_default_transport, set_default_transport
+
+    transport = get_default_transport()
+    assert transport is get_default_transport()
+    replacement = Transport()
+    set_default_transport(replacement)
+    assert get_default_transport() is replacement
+    set_default_transport(transport)
+
+def test__prepare_request__signs_headers():
+    from requests.auth import HTTPBasicAuth
+
+    from astro_cloud.transport import prepare_request
+
+    prepared = prepare_request('GET', 'http://127.0.0.1/a b.fits', {'Range': 'bytes=0-9'}, HTTPBasicAuth('a', 'b'))
+    assert prepared.url == 'http://127.0.0.1/a%20b.fits'
+    assert prepared.headers['Range'] == 'bytes=0-9'
+    assert prepared.headers['Authorization'].startswith('Basic ')
+
+@pytest.mark.asyncio
+async def test__async_transport__read_range(range_server):
+    from astro_cloud.transport import AsyncTransport
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    async with AsyncTransport() as transport:
+        for idx in range(5):
+            response = await transport.read_range(url, idx * 80, idx * 80 + 79)
+            assert response.status_code == 206
+            assert len(response.content) == 80
+
+    assert range_server.connection_count == 1
+
+def test__multipart_byteranges_parser():
+    from astro_cloud.transport import MultipartByteRangesParser
+
+    body = b'\r\n--abc\r\nContent-Type: application/octet-stream\r\nContent-Range: bytes 0-4/100\r\n\r\n' \
+        b'01234\r\n--abc\r\nContent-Range: bytes 50-52/100\r\n\r\n--a\r\n--abc--\r\n'
+    parser = MultipartByteRangesParser('abc')
+    parts = []
+    for idx in range(len(body)):
+        parts.extend(parser.feed(body[idx:idx + 1]))
+
+    assert parts == [((0, 4), b'01234'), ((50, 52), b'--a')]
+    assert parser.done
+
+def test__extract_ranges__coalesced_parts():
+    from astro_cloud.transport import extract_ranges
+
+    parts = [((10, 29), bytes(range(10, 30)))]
+    assert extract_ranges([(10, 11), (20, 29), (40, 41)], parts) == [bytes([10, 11]), bytes(range(20, 30)), None]
+
+def test__transport__read_ranges__multipart(range_server, synthetic_fits_filepath):
+    from astro_cloud.transport import Transport
+
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        content = stream.read()
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    ranges = [(idx * 250, idx * 250 + 99) for idx in range(100)] + [(5, 9)]
+    with Transport() as transport:
+        contents = transport.read_ranges(url, ranges)
+
+    assert contents == [content[start:end + 1] for start, end in ranges]
+    # 64 ranges per request
+    assert range_server.request_count == 2
+
+def test__transport__read_ranges__fallback(range_server, synthetic_fits_filepath):
+    from astro_cloud.transport import Transport
+
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        content = stream.read()
+
+    range_server.multirange = False
+    url = f'{range_server.base_url}/synthetic.fits'
+    ranges = [(idx * 2500, idx * 2500 + 99) for idx in range(10)]
+    with Transport() as transport:
+        assert transport.read_ranges(url, ranges) == [content[start:end + 1] for start, end in ranges]
+        assert range_server.request_count == 11
+        range_server.reset_stats()
+        assert transport.read_ranges(url, ranges) == [content[start:end + 1] for start, end in ranges]
+        assert range_server.request_count == 10
+
+def test__transport__read_ranges__missing_boundary(range_server, synthetic_fits_filepath):
+    from astro_cloud.transport import Transport
+
+    with open(synthetic_fits_filepath, 'rb') as stream:
+        content = stream.read()
+
+    range_server.omit_boundary = True
+    url = f'{range_server.base_url}/synthetic.fits'
+    ranges = [(idx * 2500, idx * 2500 + 99) for idx in range(4)]
+    with Transport() as transport:
+        assert transport.read_ranges(url, ranges) == [content[start:end + 1] for start, end in ranges]
+
+    assert range_server.request_count == 5
+
+def test__retry_policy__backoff():
+    from astro_cloud.transport import RetryPolicy
+
+    policy = RetryPolicy(base_delay=0.1, max_delay=1.0)
+    for retry in range(8):
+        assert 0 <= policy.backoff(retry) <= min(1.0, 0.1 * 2 ** retry)
+
+    assert policy.backoff(0, '5') == 1.0
+    assert policy.backoff(0, 'Wed, 21 Oct 2015 07:28:00 GMT') <= 0.1
+
+def test__transport__retry__status(range_server):
+    from astro_cloud.transport import RetryPolicy, Transport, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    range_server.injected_statuses = [503, 500]
+    with Transport(TransportConfig(retry=RetryPolicy(base_delay=0.001))) as transport:
+        response = transport.read_range(url, 0, 79)
+        assert response.status_code == 206
+        assert response.attempts == 3
+        assert range_server.request_count == 3
+
+        range_server.injected_statuses = [503] * 4
+        response = transport.read_range(url, 0, 79)
+        assert response.status_code == 503
+        assert response.attempts == 4
+
+    with Transport(TransportConfig(retry=None)) as transport:
+        range_server.injected_statuses = [503]
+        assert transport.read_range(url, 0, 79).status_code == 503
+
+def test__transport__retry__timeout(range_server):
+    import requests
+
+    from astro_cloud.transport import RetryPolicy, Transport, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    range_server.latency = lambda request_number: 0.5 if request_number == 1 else 0
+    config = TransportConfig(read_timeout=0.1, retry=RetryPolicy(base_delay=0.001))
+    with Transport(config) as transport:
+        response = transport.read_range(url, 0, 79)
+        assert response.status_code == 206
+        assert response.attempts == 2
+
+    range_server.latency = 0.5
+    with Transport(config._replace(retry=RetryPolicy(max_attempts=2, base_delay=0.001))) as transport:
+        with pytest.raises(requests.exceptions.Timeout):
+            transport.read_range(url, 0, 79)
+
+def test__transport__hedge(range_server):
+    from astro_cloud.transport import HedgePolicy, Transport, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    config = TransportConfig(hedge=HedgePolicy(percentile=0.9, min_samples=10))
+    with Transport(config) as transport:
+        for idx in range(10):
+            assert not getattr(transport.read_range(url, 0, 79), 'hedged', False)
+
+        # The 11th request stalls, the hedge sent after the p90 latency answers first
+        range_server.latency = lambda request_number: 1.0 if request_number == 11 else 0
+        started = time.perf_counter()
+        response = transport.read_range(url, 0, 79)
+        assert time.perf_counter() - started < 0.5
+        assert response.status_code == 206
+        assert response.hedged
+        assert range_server.request_count == 12
+
+def test__transport__hedge__original_answers_first(range_server):
+    from astro_cloud.transport import HedgePolicy, Transport, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    config = TransportConfig(hedge=HedgePolicy(percentile=0.9, min_samples=10))
+    with Transport(config) as transport:
+        for idx in range(10):
+            transport.read_range(url, 0, 79)
+
+        # The hedge is sent, but stalls for longer than the original request
+        range_server.latency = lambda request_number: {11: 0.2, 12: 1.0}.get(request_number, 0)
+        response = transport.read_range(url, 0, 79)
+        assert response.status_code == 206
+        assert not response.hedged
+        assert range_server.request_count == 12
+
+def test__transport__hedge__queued_requests(range_server):
+    import threading
+
+    from astro_cloud.transport import HedgePolicy, Transport, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    # One worker, so all but one request wait in the queue for longer than the p90 latency
+    config = TransportConfig(pool_maxsize=1, hedge=HedgePolicy(percentile=0.9, min_samples=10))
+    with Transport(config) as transport:
+        range_server.latency = 0.1
+        for idx in range(10):
+            transport.read_range(url, 0, 79)
+
+        range_server.reset_stats()
+        range_server.latency = 0.02
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(transport.read_range(url, 0, 79)))
+            for idx in range(8)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        # Give any duplicate still queued time to be sent
+        time.sleep(0.3)
+
+    assert len(responses) == range_server.request_count == 8
+    assert not any(getattr(response, 'hedge_sent', False) for response in responses)
+
+@pytest.mark.asyncio
+async def test__async_transport__retry_and_hedge(range_server):
+    import asyncio
+
+    from astro_cloud.transport import AsyncTransport, HedgePolicy, RetryPolicy, TransportConfig
+
+    url = f'{range_server.base_url}/synthetic.fits'
+    config = TransportConfig(retry=RetryPolicy(base_delay=0.001), hedge=HedgePolicy(percentile=0.9, min_samples=10))
+    async with AsyncTransport(config) as transport:
+        range_server.injected_statuses = [503]
+        response = await transport.read_range(url, 0, 79)
+        assert (response.status_code, response.attempts) == (206, 2)
+        for idx in range(10):
+            assert not (await transport.read_range(url, 0, 79)).hedged
+
+        range_server.latency = lambda request_number: 1.0 if request_number == 13 else 0
+        response = await asyncio.wait_for(transport.read_range(url, 0, 79), 0.5)
+        assert response.status_code == 206
+        assert response.hedged
+
+        range_server.latency = lambda request_number: {15: 0.2, 16: 1.0}.get(request_number, 0)
+        response = await transport.read_range(url, 0, 79)
+        assert response.status_code == 206
+        assert not response.hedged
@@ -36,6 +36,12 @@ INSTALL_REQUIRES = [
     'requests==2.24.0',
     'astropy==4.0.1.post1'
 ]
+EXTRAS_REQUIRE = {
+    'async': ['aiohttp'],
+    'arrow': ['pyarrow'],
+    'gzip': ['indexed_gzip'],
+    'gcp': ['cryptography'],
+}
 description = 'A utility to make accessing static content in the cloud, efficient'
 
 def read(fname):
@@ -57,6 +63,7 @@ setup(
     include_package_data=True,
     scripts=[],
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     entry_points={
         'console_scripts': []
     },